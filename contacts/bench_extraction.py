@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Adversarial benchmark for phone and address extraction. Times PHONE_RE and
+ADDY_RE against their linear time replacements (phones.scan_phone and
+scraper.match_address) on garbage lines of increasing length. The regexes
+grow quadratically; the scanners should grow linearly."""
+
+import random
+from timeit import default_timer
+
+import phones
+import scraper
+
+
+def garbage_lines(length, seed=0):
+    """Lines shaped to make the regexes backtrack: long runs of digits and
+    separators that never form a phone number, and long stretches of
+    whitespace and commas that never end in a state and zip"""
+    rand = random.Random(seed)
+    return {
+        'digit pairs': ' '.join(['12'] * length)[:length],
+        'dashed digits': '-'.join(['12'] * length)[:length],
+        'random separators': ''.join(rand.choice('12 ()-')
+                                     for _ in range(length)),
+        'spaces': 'a' + ' ' * (length - 2) + 'b',
+        'comma then spaces': ',' + ' ' * (length - 2) + 'x',
+        'commas': ', ' * (length // 2),
+    }
+
+
+def timed(fn, line):
+    start = default_timer()
+    fn(line)
+    return default_timer() - start
+
+
+CASES = [
+    ('phone', phones.PHONE_RE.search, phones.scan_phone),
+    ('address', scraper.ADDY_RE.match, scraper.match_address),
+]
+
+
+def run(lengths=(1250, 2500, 5000, 10000)):
+    print("%-8s %-18s %7s %10s %10s" % ('', 'line', 'length', 'regex ms',
+                                        'scan ms'))
+    for length in lengths:
+        for line_name, line in sorted(garbage_lines(length).items()):
+            for case_name, regex, scanner in CASES:
+                print("%-8s %-18s %7d %10.2f %10.2f" % (
+                    case_name, line_name, len(line),
+                    timed(regex, line) * 1000, timed(scanner, line) * 1000))
+
+
+if __name__ == "__main__":
+    run()
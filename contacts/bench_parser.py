@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""Benchmark for the agency page parser. For each agency page cached in html/,
+times parse_agency, parse_department, clean_paragraphs, find_bold_fields and
+clean_phone_number, and records the median, 95th percentile and peak memory
+of each. Results are written as JSON so runs can be compared across commits:
+
+    python bench_parser.py --output before.json
+    (make changes)
+    python bench_parser.py --output after.json --baseline before.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+from timeit import default_timer
+import tracemalloc
+
+from compare_parsers import cached_agency_pages
+import phones
+import scraper
+
+
+FUNCTIONS = ['parse_agency', 'parse_department', 'clean_paragraphs',
+             'find_bold_fields', 'clean_phone_number']
+
+
+def department_inputs(doc):
+    """(name, div, paragraphs after the address, phone lines) for each
+    department, found the way parse_agency and parse_department find them"""
+    by_id = scraper.element_index(doc)
+    departments = []
+    for option in doc("option")[1:]:
+        elem = by_id[option['value']]
+        lines, ps = scraper.clean_paragraphs(elem)
+        lines, ps = lines[1:], ps[1:]
+        _, lines = scraper.split_address_from(lines)
+        phone_lines = [line for line in lines if phones.scan_phone(line)]
+        departments.append((option.string.strip(), elem, ps[-len(lines):],
+                            phone_lines))
+    return departments
+
+
+def agency_workloads(doc):
+    """A function -> callable mapping; each callable does one agency's worth
+    of that function's work"""
+    departments = department_inputs(doc)
+
+    def parse_departments():
+        for name, elem, _, _ in departments:
+            scraper.parse_department(elem, name)
+
+    def clean_paragraphs():
+        for _, elem, _, _ in departments:
+            scraper.clean_paragraphs(elem)
+
+    def find_bold_fields():
+        for _, _, ps, _ in departments:
+            list(scraper.find_bold_fields(ps))
+
+    def clean_phone_numbers():
+        # Cold cache, so this measures normalizing rather than lookups
+        phones.clear_cache()
+        for _, _, _, phone_lines in departments:
+            phones.clean_phone_numbers(phone_lines)
+
+    return {'parse_agency': lambda: scraper.parse_agency('', doc),
+            'parse_department': parse_departments,
+            'clean_paragraphs': clean_paragraphs,
+            'find_bold_fields': find_bold_fields,
+            'clean_phone_number': clean_phone_numbers}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def peak_memory(fn):
+    """Peak bytes allocated while running fn"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = default_timer()
+        fn()
+        times.append(default_timer() - start)
+    return {'median': statistics.median(times),
+            'p95': percentile(times, 95),
+            'peak_bytes': peak_memory(fn)}
+
+
+def summarize(agencies):
+    """Totals across agencies: summed medians and p95s, largest peak"""
+    totals = {}
+    for name in FUNCTIONS:
+        results = [agency[name] for agency in agencies.values()]
+        totals[name] = {
+            'median': sum(r['median'] for r in results),
+            'p95': sum(r['p95'] for r in results),
+            'peak_bytes': max([r['peak_bytes'] for r in results] or [0])}
+    return totals
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat=5, parser=None, html_directory='html', only=None):
+    agencies = {}
+    for abb, text in cached_agency_pages(html_directory):
+        if only and abb not in only:
+            continue
+        doc = scraper.make_soup(scraper.fix_known_typos(text), parser)
+        workloads = agency_workloads(doc)
+        agencies[abb] = dict((name, measure(workloads[name], repeat))
+                             for name in FUNCTIONS)
+        logging.info("[%s] parse_agency median %.2fms", abb,
+                     agencies[abb]['parse_agency']['median'] * 1000)
+    return {'revision': git_revision(),
+            'python': platform.python_version(),
+            'parser': parser or scraper.HTML_PARSER,
+            'repeat': repeat,
+            'agencies': agencies,
+            'totals': summarize(agencies)}
+
+
+def report(results, baseline=None):
+    lines = ["%-20s %12s %12s %12s" % (
+        '', 'median ms', 'p95 ms', 'peak KB')]
+    for name in FUNCTIONS:
+        total = results['totals'][name]
+        line = "%-20s %12.2f %12.2f %12.1f" % (
+            name, total['median'] * 1000, total['p95'] * 1000,
+            total['peak_bytes'] / 1024.0)
+        if baseline and baseline['totals'][name]['median']:
+            line += "  %+.1f%%" % (
+                100.0 * (total['median'] /
+                         baseline['totals'][name]['median'] - 1))
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the agency page parser over html/.')
+    parser.add_argument('agency', nargs='*',
+                        help='Only benchmark these agencies.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed runs per function and agency.')
+    parser.add_argument('--parser', default=scraper.HTML_PARSER,
+                        choices=['html.parser', 'lxml'],
+                        help='BeautifulSoup tree builder for agency pages.')
+    parser.add_argument('--output', default='bench_parser.json',
+                        help='File to write the JSON results to.')
+    parser.add_argument('--baseline',
+                        help='Results of an earlier run to compare against.')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.parser, only=args.agency)
+    if not results['agencies']:
+        logging.error("No cached agency pages in html/; run scraper.py first")
+        return 1
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(report(results, baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
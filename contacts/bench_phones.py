@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Micro-benchmark for phones.py. Times the original character-by-character
+implementations of clean_phone_number/extract_numbers against phones.py, cold
+and with a warm cache, over every phone and fax string in the XLS and in
+data/. Also checks that both produce the same output."""
+
+from timeit import default_timer
+import os
+import re
+
+import xlrd
+
+import dataset
+import phones
+from phones import PHONE_RE
+
+
+def legacy_clean_phone_number(line):
+    """clean_phone_number as it was before phones.py"""
+    match = PHONE_RE.search(line)
+    if match:
+        prefix = "".join(ch for ch in match.group("prefix") if ch.isdigit())
+        area_code = "".join(ch for ch in match.group("area_code")
+                            if ch.isdigit())
+        first_three = "".join(ch for ch in match.group("first_three")
+                              if ch.isdigit())
+        last_four = "".join(ch for ch in match.group("last_four")
+                            if ch.isdigit())
+        number = "-".join([area_code, first_three, last_four])
+        if prefix:
+            number = "+" + prefix + " " + number
+        extension = match.group("extension")
+        if extension:
+            extension = re.sub(r"\D", "", extension)
+            number = number + " x" + extension
+        if match.group("tty"):
+            number += " (TTY)"
+        return number
+    else:
+        raise Exception("Error extracting phone number",
+                        "phone line: " + line)
+
+
+def legacy_extract_numbers(phone_str):
+    """extract_numbers as it was before phones.py"""
+    clean_numbers = []
+    phone_str = re.sub(r'[,\s(]+ext', ' ext', phone_str)
+    for phone in phone_str.split(","):
+        phone = phone.strip()
+        if PHONE_RE.match(phone):
+            clean_numbers.append(legacy_clean_phone_number(phone))
+    return clean_numbers
+
+
+XLS_PATH = os.path.join('layering_data', 'full-foia-contacts.xls')
+
+
+def xls_phone_strings(xls_path=XLS_PATH):
+    workbook = xlrd.open_workbook(xls_path)
+    for sheet in workbook.sheets():
+        field_names = sheet.row_values(0)
+        for row_idx in range(1, sheet.nrows):
+            row = dict(zip(field_names, sheet.row_values(row_idx)))
+            for field in ('Telephone', 'Fax'):
+                if isinstance(row.get(field), str) and row[field].strip():
+                    yield row[field]
+
+
+def yaml_phone_strings(agencies):
+    def walk(value):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                if key in ('phone', 'fax'):
+                    for number in (child if isinstance(child, list)
+                                   else [child]):
+                        yield number
+                else:
+                    for number in walk(child):
+                        yield number
+        elif isinstance(value, list):
+            for child in value:
+                for number in walk(child):
+                    yield number
+    return walk(list(agencies.values()))
+
+
+def batch(clean):
+    """Apply clean to each line, None for lines it rejects"""
+    def apply(lines):
+        results = []
+        for line in lines:
+            try:
+                results.append(clean(line))
+            except Exception:
+                results.append(None)
+        return results
+    return apply
+
+
+def timed(fn, lines, repeat, cold=True):
+    best = None
+    for _ in range(repeat):
+        if cold:
+            phones.clear_cache()
+        start = default_timer()
+        result = fn(lines)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(repeat=5):
+    lines = list(xls_phone_strings()) + list(
+        yaml_phone_strings(dataset.load_all()))
+    print("%d phone strings, %d distinct" % (len(lines), len(set(lines))))
+
+    cases = [
+        ('clean_phone_number', batch(legacy_clean_phone_number),
+         phones.clean_phone_numbers),
+        ('extract_numbers',
+         lambda lines: [legacy_extract_numbers(line) for line in lines],
+         phones.extract_all_numbers),
+    ]
+    for name, legacy, current in cases:
+        legacy_time, expected = timed(legacy, lines, repeat)
+        cold_time, actual = timed(current, lines, repeat)
+        assert expected == actual, "%s output differs" % name
+        warm_time, _ = timed(current, lines, repeat, cold=False)
+        print("%-20s legacy %8.2fms  cold %8.2fms  warm %8.2fms" % (
+            name, legacy_time * 1000, cold_time * 1000, warm_time * 1000))
+
+
+if __name__ == "__main__":
+    run()
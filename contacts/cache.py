@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+"""The HTTP cache shared by the contacts fetchers. Every source (foia.gov's
+agency pages, its processing time tables and contacts XLS, the Federal
+Register API) is cached in cache/<source>/, one body and one small JSON
+metadata file per URL, with its own time to live:
+
+    response = cache.fetch(url, 'processing_times', params=params)
+
+A fresh entry is served without touching the network. Once it expires, the
+entry is revalidated with If-None-Match / If-Modified-Since when the server
+gave us an ETag or Last-Modified, so an unchanged page costs a 304 rather
+than a download. The cache keeps track of its size and, once it grows past
+MAX_BYTES, evicts the least recently used entries.
+
+    python cache.py stats    # entries, size and expired entries per source
+    python cache.py prune    # drop expired entries, then shrink to budget
+"""
+
+import argparse
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import http_client
+import metrics
+
+
+# replay.py points runs at a scratch cache through the environment
+CACHE_ENV = 'CONTACTS_CACHE_DIRECTORY'
+CACHE_DIRECTORY = os.environ.get(CACHE_ENV) or 'cache'
+
+DAY = 24 * 60 * 60
+# Seconds a response is used without asking the server again
+TTLS = {
+    'foia_agencies': 7 * DAY,
+    'foia_contacts_xls': 7 * DAY,
+    'processing_times': 30 * DAY,
+    # Past months of the Federal Register don't change
+    'federal_register': 365 * DAY,
+}
+DEFAULT_TTL = DAY
+MAX_BYTES = 512 * 1024 * 1024
+# How stale an entry's last use may get before a hit records it again. LRU
+# eviction doesn't need it any finer, and hits don't each rewrite metadata
+TOUCH_INTERVAL = 60 * 60
+
+
+class CachedResponse(object):
+    """Enough of a requests response for the fetchers, read from the
+    cache"""
+
+    def __init__(self, url, content, encoding=None, headers=None,
+                 from_cache=True):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers or {}
+        self.status_code = 200
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf8', 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+
+def cache_key(url, params=None):
+    """The URL a request is sent to, params included"""
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+def ok(response):
+    return response.status_code == 200
+
+
+class HttpCache(object):
+    """A directory of cached responses, grouped by source"""
+
+    def __init__(self, directory=CACHE_DIRECTORY, client=http_client,
+                 ttls=None, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.client = client
+        self.ttls = TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        # Guards the size, and keeps writes out while prune() removes
+        self.lock = threading.RLock()
+        self._size = None
+
+    def ttl(self, source):
+        return self.ttls.get(source, DEFAULT_TTL)
+
+    def paths(self, source, key):
+        """The body and metadata filenames of key"""
+        digest = hashlib.sha1(key.encode('utf8')).hexdigest()
+        base = os.path.join(self.directory, source, digest)
+        return base + '.body', base + '.json'
+
+    def entry(self, source, key):
+        """The metadata of key, or None if it isn't cached"""
+        body_path, meta_path = self.paths(source, key)
+        if not os.path.isfile(body_path) or not os.path.isfile(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    def is_fresh(self, entry, source, max_age=None):
+        if max_age is None:
+            max_age = self.ttl(source)
+        return time.time() - entry['fetched_at'] <= max_age
+
+    def read(self, source, key, entry):
+        """The cached response, or None if its body has gone (say, pruned
+        by another thread)"""
+        body_path, _ = self.paths(source, key)
+        try:
+            with open(body_path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        return CachedResponse(entry['url'], content, entry.get('encoding'),
+                              entry.get('headers'))
+
+    def write_entry(self, source, key, entry, content=None):
+        body_path, meta_path = self.paths(source, key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        # Threads writing the same key each get their own temp file
+        suffix = '.%s.%s.tmp' % (os.getpid(), threading.get_ident())
+        if content is not None:
+            with open(body_path + suffix, 'wb') as f:
+                f.write(content)
+            os.replace(body_path + suffix, body_path)
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(entry, f, sort_keys=True)
+        os.replace(meta_path + suffix, meta_path)
+
+    def store(self, source, key, response):
+        """Cache a 200 response; returns it as a CachedResponse"""
+        content = response.content
+        encoding = response.encoding or response.apparent_encoding
+        headers = dict((name, response.headers[name])
+                       for name in ('Content-Type',)
+                       if name in response.headers)
+        now = int(time.time())
+        entry = {'url': response.url, 'fetched_at': now, 'last_used': now,
+                 'size': len(content), 'encoding': encoding,
+                 'etag': response.headers.get('ETag'),
+                 'last_modified': response.headers.get('Last-Modified'),
+                 'headers': headers}
+        with self.lock:
+            # Count what is cached before adding to it
+            self.size()
+            previous = self.entry(source, key)
+            self.write_entry(source, key, entry, content)
+            self._size += len(content) - (previous['size'] if previous
+                                          else 0)
+            over = self._size > self.max_bytes
+        if over:
+            self.prune()
+        return CachedResponse(response.url, content, encoding, headers,
+                              from_cache=False)
+
+    def touch(self, source, key, entry, **changes):
+        """Record a use of the entry, plus any changes. Without changes,
+        only an entry whose last use is TOUCH_INTERVAL old is rewritten"""
+        now = int(time.time())
+        if not changes and now - entry['last_used'] < TOUCH_INTERVAL:
+            return entry
+        entry = dict(entry, last_used=now, **changes)
+        self.write_entry(source, key, entry)
+        return entry
+
+    def fetch(self, url, source, params=None, key=None, max_age=None,
+              before_request=None, accept=ok, **kwargs):
+        """GET url through the cache. `key` replaces the URL as the cache
+        key, for URLs which change on every request; `max_age` overrides
+        the source's TTL. before_request(url) is called before anything is
+        sent, e.g. to rate limit. Only responses `accept` returns True for
+        are cached; others are returned as they are"""
+        key = key or cache_key(url, params)
+        entry = self.entry(source, key)
+        if entry and self.is_fresh(entry, source, max_age):
+            cached = self.read(source, key, entry)
+            if cached is not None:
+                metrics.cache_hit()
+                self.touch(source, key, entry)
+                return cached
+            entry = None
+
+        plain_headers = kwargs.pop('headers', None) or {}
+        headers = dict(plain_headers)
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        if before_request:
+            before_request(url)
+        response = self.client.get(url, params=params, headers=headers,
+                                   **kwargs)
+
+        if entry and response.status_code == 304:
+            cached = self.read(source, key, entry)
+            if cached is not None:
+                metrics.increment('cache_revalidations')
+                self.touch(source, key, entry, fetched_at=int(time.time()))
+                return cached
+            # Pruned in the meantime; ask again without validators
+            if before_request:
+                before_request(url)
+            response = self.client.get(url, params=params,
+                                       headers=plain_headers, **kwargs)
+        metrics.cache_miss()
+        if accept(response):
+            return self.store(source, key, response)
+        return response
+
+    def client_for(self, source):
+        """An object with a get(url, params) which fetches from source, for
+        code written against http_client"""
+        return SourceClient(self, source)
+
+    def entries(self):
+        """(source, metadata filename, metadata) for every cached entry"""
+        if not os.path.isdir(self.directory):
+            return
+        for source in sorted(os.listdir(self.directory)):
+            source_dir = os.path.join(self.directory, source)
+            if not os.path.isdir(source_dir):
+                continue
+            for name in sorted(os.listdir(source_dir)):
+                if not name.endswith('.json'):
+                    continue
+                meta_path = os.path.join(source_dir, name)
+                try:
+                    with open(meta_path, 'r') as f:
+                        entry = json.load(f)
+                except FileNotFoundError:
+                    continue
+                except ValueError:
+                    entry = None
+                yield source, meta_path, entry
+
+    def size(self):
+        """Bytes of cached bodies"""
+        with self.lock:
+            if self._size is None:
+                self._size = sum(entry['size'] for _, _, entry
+                                 in self.entries() if entry)
+            return self._size
+
+    def stats(self):
+        """source -> entries, bytes and expired entries"""
+        stats = OrderedDict()
+        for source, _, entry in self.entries():
+            record = stats.setdefault(
+                source, {'entries': 0, 'bytes': 0, 'expired': 0})
+            if not entry:
+                continue
+            record['entries'] += 1
+            record['bytes'] += entry['size']
+            if not self.is_fresh(entry, source):
+                record['expired'] += 1
+        return stats
+
+    def remove(self, meta_path):
+        for path in (meta_path[:-len('.json')] + '.body', meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def prune(self, max_bytes=None):
+        """Drop expired entries which can't be revalidated (or are
+        unreadable), then the least recently used entries until the cache
+        fits in max_bytes. Returns the number of entries removed. Holds the
+        lock throughout, so no entry is stored while the cache is counted
+        and trimmed"""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        removed, kept = 0, []
+        with self.lock:
+            for source, meta_path, entry in list(self.entries()):
+                validators = entry and (entry.get('etag')
+                                        or entry.get('last_modified'))
+                if not entry or (not validators
+                                 and not self.is_fresh(entry, source)):
+                    self.remove(meta_path)
+                    removed += 1
+                else:
+                    kept.append((entry['last_used'], meta_path,
+                                 entry['size']))
+            kept.sort()
+            total = sum(size for _, _, size in kept)
+            for _, meta_path, size in kept:
+                if total <= max_bytes:
+                    break
+                self.remove(meta_path)
+                total -= size
+                removed += 1
+            self._size = total
+        if removed:
+            logging.info("Pruned %s cache entries", removed)
+        return removed
+
+
+class SourceClient(object):
+    """HttpCache.fetch for one source, behind http_client's get()"""
+
+    def __init__(self, cache, source):
+        self.cache = cache
+        self.source = source
+
+    def get(self, url, params=None, **kwargs):
+        return self.cache.fetch(url, self.source, params=params, **kwargs)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = HttpCache()
+        return _default_cache
+
+
+def fetch(url, source, **kwargs):
+    return default_cache().fetch(url, source, **kwargs)
+
+
+def print_stats(stats):
+    print("%-20s %8s %12s %8s" % ('source', 'entries', 'bytes', 'expired'))
+    for source, record in stats.items():
+        print("%-20s %8d %12d %8d" % (source, record['entries'],
+                                      record['bytes'], record['expired']))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Inspect and prune the HTTP cache.')
+    parser.add_argument('command', choices=['stats', 'prune'])
+    parser.add_argument('--max-mb', type=float, default=None,
+                        help='Size to prune the cache down to, in MB.')
+    args = parser.parse_args()
+    cache = default_cache()
+    if args.command == 'prune':
+        max_bytes = None
+        if args.max_mb is not None:
+            max_bytes = int(args.max_mb * 1024 * 1024)
+        cache.prune(max_bytes)
+    print_stats(cache.stats())
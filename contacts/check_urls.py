@@ -1,14 +1,13 @@
-import requests
-import yaml
-from glob import glob
-import os
+import dataset
+import http_client
+import metrics
 
 
 def check_url(data, url_field):
     """ Actually check the URL and print out enough information to debug later.
     """
     try:
-        r = requests.get(data[url_field], verify=False)
+        r = http_client.get(data[url_field], verify=False)
         if r.status_code != 200:
             print(r.status_code)
             print(data[url_field])
@@ -36,10 +35,11 @@ def check_all_urls(data):
 
 
 def check_all():
-    for filename in glob('data' + os.sep + '*.yaml'):
-        yaml_data = yaml.load(open(filename, 'r'))
+    for yaml_data in dataset.load_all().values():
         check_all_urls(yaml_data)
 
 
 if __name__ == "__main__":
-    check_all()
+    with metrics.stage('check_urls'):
+        check_all()
+    metrics.write()
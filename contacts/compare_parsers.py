@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""Parse every cached agency page in html/ with both the html.parser and lxml
+backends and make sure they produce identical agency data. Run this before
+switching scraper.py to `--parser lxml`."""
+
+from glob import glob
+import logging
+import os
+import sys
+
+import scraper
+
+
+def cached_agency_pages(html_directory='html'):
+    """Yield (abbreviation, html) for each agency page scraper.py cached"""
+    for filename in sorted(glob(os.path.join(html_directory, '*.html'))):
+        abb, _ = os.path.splitext(os.path.basename(filename))
+        if abb in scraper.AGENCIES:
+            with open(filename, 'r', encoding='utf8') as f:
+                yield abb, f.read()
+
+
+def parse_with(abb, text, parser):
+    """The scraper's parse stage, minus manual data, using a given backend"""
+    text = scraper.fix_known_typos(text)
+    data = scraper.parse_agency(abb, scraper.make_soup(text, parser))
+    return scraper.populate_parent(data)
+
+
+def differences(expected, actual, path=''):
+    """List the paths at which two agency structures differ"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        diffs = []
+        for key in sorted(set(expected) | set(actual), key=str):
+            diffs.extend(differences(expected.get(key), actual.get(key),
+                                     '%s/%s' % (path, key)))
+        return diffs
+    if isinstance(expected, list) and isinstance(actual, list) \
+            and len(expected) == len(actual):
+        diffs = []
+        for idx, (left, right) in enumerate(zip(expected, actual)):
+            diffs.extend(differences(left, right, '%s[%d]' % (path, idx)))
+        return diffs
+    if expected != actual:
+        return [path or '/']
+    return []
+
+
+def compare_parsers(html_directory='html'):
+    """Returns a dictionary of agency abbreviation -> differing paths for any
+    agency on which the two backends disagree"""
+    mismatches = {}
+    for abb, text in cached_agency_pages(html_directory):
+        diffs = differences(parse_with(abb, text, 'html.parser'),
+                            parse_with(abb, text, 'lxml'))
+        if diffs:
+            mismatches[abb] = diffs
+            logging.warning("[%s] Parsers disagree: %s", abb,
+                            ", ".join(diffs))
+        else:
+            logging.info("[%s] Parsers agree.", abb)
+    return mismatches
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if compare_parsers():
+        sys.exit(1)
@@ -1,23 +1,203 @@
 #!/usr/bin/env python
+
+"""Export the agency YAML in data/ as JSON. Alongside data/<ABB>.json this
+writes every agency in one file, bundles/all_agencies.json, and as a stream of
+one agency per line, bundles/all_agencies.ndjson, plus gzipped copies of both
+for serving as-is. The bundles get their own directory so that data/*.json is
+only ever agencies.
+
+Exports are incremental: data/.export_manifest.json records a hash of each
+YAML file, and YAML which hasn't changed since the last export isn't parsed
+again (its JSON is read back instead). The rest is converted in a process
+pool. Files are only rewritten when their contents change."""
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import hashlib
+from io import BytesIO
 import json
 import logging
-import os.path
-import yaml
-from glob import glob
+import os
+
+import dataset
+import metrics
 
 logger = logging.getLogger('convert_to_json')
 
-def convert_to_json():
-    for filename in glob("data" + os.sep + "*.yaml"):
-        logger.debug('found yaml file filename=%s' % filename)
-        with open(filename) as f:
-            yaml_data = yaml.load(f.read())
+# Under the data directory
+BUNDLE_DIRECTORY = 'bundles'
+BUNDLE_FILENAME = 'all_agencies.json'
+NDJSON_FILENAME = 'all_agencies.ndjson'
+MANIFEST_FILENAME = '.export_manifest.json'
+
+
+def agency_json(yaml_data):
+    return json.dumps(yaml_data, sort_keys=True, indent=2)
+
+
+def json_filename(agency, directory=dataset.DATA_DIRECTORY):
+    return os.path.join(directory, '%s.json' % agency)
+
+
+def file_hash(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def replace_if_changed(filename, content):
+    """Write content (str or bytes) unless filename already holds exactly
+    that. Returns True if the file was written. Records no metrics, so it
+    can run in a worker process"""
+    data = content.encode('utf8') if isinstance(content, str) else content
+    if os.path.isfile(filename):
+        with open(filename, 'rb') as f:
+            if f.read() == data:
+                return False
+    with open(filename, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def write_if_changed(filename, content):
+    """replace_if_changed, counting the file if it was written"""
+    written = replace_if_changed(filename, content)
+    if written:
+        metrics.file_written()
+    return written
+
+
+def gzipped(data):
+    """Compressed bytes that only depend on data (no timestamp), so
+    unchanged content doesn't produce a changed file"""
+    buf = BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def write_bundles(agencies, directory=dataset.DATA_DIRECTORY):
+    """Write the combined JSON, the NDJSON stream and their .gz copies for
+    an abbreviation -> data mapping"""
+    ordered = sorted(agencies.items())
+    bundle = json.dumps(OrderedDict(ordered), sort_keys=True,
+                        separators=(',', ':')).encode('utf8')
+    ndjson = ''.join(json.dumps(data, sort_keys=True, separators=(',', ':'))
+                     + '\n' for _, data in ordered).encode('utf8')
+    bundle_directory = os.path.join(directory, BUNDLE_DIRECTORY)
+    os.makedirs(bundle_directory, exist_ok=True)
+    for filename, content in ((BUNDLE_FILENAME, bundle),
+                              (NDJSON_FILENAME, ndjson)):
+        filename = os.path.join(bundle_directory, filename)
+        write_if_changed(filename, content)
+        write_if_changed(filename + '.gz', gzipped(content))
+
+
+def load_manifest(directory=dataset.DATA_DIRECTORY):
+    filename = os.path.join(directory, MANIFEST_FILENAME)
+    if os.path.isfile(filename):
+        with open(filename, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest, directory=dataset.DATA_DIRECTORY):
+    write_if_changed(os.path.join(directory, MANIFEST_FILENAME),
+                     json.dumps(manifest, sort_keys=True, indent=2))
+
+
+def export_agency(agency, directory=dataset.DATA_DIRECTORY):
+    """Convert one agency's YAML; runs in a worker process. Returns the
+    agency's data, the hash of the YAML it was read from and whether its
+    JSON was written. Worker processes can't record metrics for the main
+    process, so the caller counts the file"""
+    filename = dataset.agency_filename(directory, agency)
+    with open(filename, 'rb') as f:
+        text = f.read()
+    yaml_data = dataset.load(text.decode('utf8'))
+    written = replace_if_changed(json_filename(agency, directory),
+                                 agency_json(yaml_data))
+    if written:
+        logger.info('converted to json agency=%s', agency)
+    return yaml_data, hashlib.sha1(text).hexdigest(), written
+
+
+def read_export(agency, directory=dataset.DATA_DIRECTORY):
+    with open(json_filename(agency, directory), 'r') as f:
+        return json.load(f)
+
+
+def unchanged(agency, manifest, directory=dataset.DATA_DIRECTORY):
+    """True if the agency's YAML is the same as when its JSON was written"""
+    return (agency in manifest
+            and os.path.isfile(json_filename(agency, directory))
+            and file_hash(dataset.agency_filename(directory, agency))
+            == manifest[agency])
+
+
+def export_directory(directory=dataset.DATA_DIRECTORY, workers=1,
+                     force=False):
+    """Export every agency in directory, converting only the YAML which
+    changed since the last export. Returns the abbreviation -> data
+    mapping"""
+    manifest = load_manifest(directory)
+    agencies, changed = {}, []
+    for agency in dataset.agency_abbrs(directory):
+        if not force and unchanged(agency, manifest, directory):
+            agencies[agency] = read_export(agency, directory)
+        else:
+            changed.append(agency)
+    logger.info('%d of %d agencies changed', len(changed),
+                len(changed) + len(agencies))
+
+    if workers > 1 and len(changed) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(export_agency, changed,
+                                    [directory] * len(changed)))
+    else:
+        results = [export_agency(agency, directory) for agency in changed]
+    for agency, (yaml_data, yaml_hash, written) in zip(changed, results):
+        agencies[agency] = yaml_data
+        manifest[agency] = yaml_hash
+        if written:
+            metrics.file_written()
+
+    for agency in set(manifest) - set(agencies):
+        del manifest[agency]
+    save_manifest(manifest, directory)
+    write_bundles(agencies, directory)
+    return agencies
+
+
+def write_json(agencies, directory=dataset.DATA_DIRECTORY):
+    """Export an in-memory abbreviation -> data mapping whose YAML has just
+    been saved, e.g. by pipeline.py"""
+    manifest = load_manifest(directory)
+    for agency, yaml_data in agencies.items():
+        if write_if_changed(json_filename(agency, directory),
+                            agency_json(yaml_data)):
+            logger.info('converted to json agency=%s', agency)
+        yaml_filename = dataset.agency_filename(directory, agency)
+        if os.path.isfile(yaml_filename):
+            manifest[agency] = file_hash(yaml_filename)
+    save_manifest(manifest, directory)
+    write_bundles(agencies, directory)
+
+
+def convert_to_json(workers=1, force=False):
+    return export_directory(workers=workers, force=force)
 
-        agency, _ = os.path.splitext(os.path.basename(filename))
-        logger.info('converting to json agency=%s' % agency)
-        with open(os.sep.join(['data', '%s.json' % agency]), 'w') as f:
-            f.write(json.dumps(yaml_data, sort_keys=True, indent=2))
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
-    convert_to_json()
+    parser = argparse.ArgumentParser(
+        description='Export the agency YAML in data/ as JSON.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of processes to convert YAML with.')
+    parser.add_argument('--force', action='store_true',
+                        help='Convert every agency, changed or not.')
+    args = parser.parse_args()
+    with metrics.stage('json'):
+        convert_to_json(args.workers, args.force)
+    metrics.write()
@@ -0,0 +1,114 @@
+"""Reading and writing the agency YAML files in data/ (and manual_data/).
+Every contacts script goes through here rather than calling yaml directly, so
+they all get the fast loader and byte-for-byte identical output."""
+
+from collections import OrderedDict
+from glob import glob
+import os
+import tempfile
+
+import yaml
+
+import metrics
+
+# libyaml's loader is roughly an order of magnitude faster than the pure
+# Python one. Output is always produced by the pure Python dumper: libyaml
+# folds long quoted strings differently, which would rewrite files whose data
+# did not change
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+from yaml import SafeDumper as Dumper
+
+
+DATA_DIRECTORY = 'data'
+
+# NamedTemporaryFile creates files readable by their owner only; written
+# files get the mode open() would have given them instead
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def load(stream):
+    """Parse YAML from a string or open file"""
+    return yaml.load(stream, Loader=Loader)
+
+
+def dumps(data):
+    """Serialize to YAML, keys sorted, in the style used throughout data/"""
+    return yaml.dump(data, Dumper=Dumper, default_flow_style=False,
+                     allow_unicode=True)
+
+
+def read(filename):
+    """Load a single YAML file; None if it doesn't exist"""
+    if os.path.isfile(filename):
+        with open(filename, 'r', encoding='utf8') as f:
+            return load(f)
+
+
+def write(filename, data):
+    """Atomically replace filename with the YAML for data. Returns the YAML
+    that was written"""
+    return write_dumped(filename, dumps(data))
+
+
+def write_if_changed(filename, data):
+    """write(), unless filename already holds exactly this YAML. Returns the
+    YAML if the file was written, otherwise None"""
+    dumped = dumps(data)
+    if os.path.isfile(filename):
+        with open(filename, 'rb') as f:
+            if f.read() == dumped.encode('utf8'):
+                return None
+    return write_dumped(filename, dumped)
+
+
+def write_dumped(filename, dumped):
+    """write() for YAML which has already been dumped"""
+    directory = os.path.dirname(filename) or '.'
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', encoding='utf8', dir=directory,
+                                     suffix='.tmp', delete=False) as f:
+        f.write(dumped)
+    os.chmod(f.name, FILE_MODE)
+    os.replace(f.name, filename)
+    metrics.file_written()
+    return dumped
+
+
+def agency_filename(directory, agency_abbr):
+    return os.path.join(directory, '%s.yaml' % agency_abbr)
+
+
+def agency_abbrs(directory=DATA_DIRECTORY):
+    """Abbreviations of all agencies with a YAML file in directory, sorted"""
+    return [os.path.splitext(os.path.basename(filename))[0]
+            for filename in sorted(glob(os.path.join(directory, '*.yaml')))]
+
+
+def load_agency(agency_abbr, directory=DATA_DIRECTORY):
+    return read(agency_filename(directory, agency_abbr))
+
+
+def save_agency(agency_abbr, data, directory=DATA_DIRECTORY):
+    return write(agency_filename(directory, agency_abbr), data)
+
+
+def save_agency_if_changed(agency_abbr, data, directory=DATA_DIRECTORY):
+    return write_if_changed(agency_filename(directory, agency_abbr), data)
+
+
+def load_all(directory=DATA_DIRECTORY):
+    """Load every agency in directory, keyed (in sorted order) by
+    abbreviation"""
+    return OrderedDict((abbr, load_agency(abbr, directory))
+                       for abbr in agency_abbrs(directory))
+
+
+def save_all(agencies, directory=DATA_DIRECTORY):
+    """Write every agency in an abbreviation -> data mapping"""
+    for abbr, data in agencies.items():
+        save_agency(abbr, data, directory)
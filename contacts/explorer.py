@@ -1,36 +1,54 @@
-import os
-import sys
-import yaml
+import argparse
 from foia_hub.settings.default import BASE_DIR
 
+import query
+import snapshot
+
 
 DEFAULT_YAML_FOLDER = 'foia/contacts/data'
 
+# Folder -> query.DepartmentIndex; the data is only read once per process
+_indexes = {}
+
 
 def _get_yaml_folder():
     return BASE_DIR.rstrip('/foia_hub').rstrip('foia-') + DEFAULT_YAML_FOLDER
 
 
+def department_index(folder=None):
+    folder = folder or _get_yaml_folder()
+    if folder not in _indexes:
+        _indexes[folder] = query.DepartmentIndex(snapshot.load_all(folder))
+    return _indexes[folder]
+
+
 def process_yaml_data(data_key):
-    folder = _get_yaml_folder()
-
-    count = 0
-    for item in os.listdir(folder):
-        data_file = os.path.join(folder, item)
-        data = yaml.load(open(data_file))
-        for rec in data['departments']:
-            data_value = rec.get(data_key, None)
-
-            if not data_value:
-                # Count how many records are missing this value
-                count += 1
-            else:
-                # Print out the values to the variance in the information.
-                # print(data['name'])  # Get agency name
-                print(data_value)
+    index = department_index()
+
+    for _, rec in index.having(data_key):
+        # Print out the values to the variance in the information.
+        print(query.field_value(rec, data_key))
+
+    print('------------------------------------------------------')
+    print('Records without %s: %s' % (data_key, len(index.missing(data_key))))
 
+
+def print_departments(title, departments):
+    for abbr, rec in departments:
+        print('%s: %s' % (abbr, rec.get('name')))
     print('------------------------------------------------------')
-    print('Records without %s: %s' % (data_key, count))
+    print('%s: %s' % (title, len(departments)))
+
+
+def missing(data_key):
+    print_departments('Records without %s' % data_key,
+                      department_index().missing(data_key))
+
+
+def where(condition):
+    data_key, value = condition.split('=', 1)
+    print_departments('Records with %s' % condition,
+                      department_index().where(data_key, value))
 
 
 if __name__ == "__main__":
@@ -41,6 +59,27 @@ if __name__ == "__main__":
 
         python explorer.py request_form
 
+    Or list the departments missing a field, or with a given value (nested
+    fields are separated by dots). Any number of queries can be run at once;
+    the data is only loaded for the first:
+
+        python explorer.py --missing request_form --where address.state=VA
+
     """
-    data_key = sys.argv[1]
-    process_yaml_data(data_key)
+    parser = argparse.ArgumentParser(
+        description='Explore the department data in the contacts YAML.')
+    parser.add_argument('data_key', nargs='*',
+                        help='Print the values of these fields.')
+    parser.add_argument('--missing', action='append', default=[],
+                        metavar='FIELD',
+                        help='List the departments without FIELD.')
+    parser.add_argument('--where', action='append', default=[],
+                        metavar='FIELD=VALUE',
+                        help='List the departments whose FIELD is VALUE.')
+    args = parser.parse_args()
+    for data_key in args.data_key:
+        process_yaml_data(data_key)
+    for data_key in args.missing:
+        missing(data_key)
+    for condition in args.where:
+        where(condition)
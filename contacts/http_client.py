@@ -0,0 +1,127 @@
+"""The HTTP client every contacts fetcher goes through. Requests share pooled
+keep-alive connections (so the many requests to foia.gov and
+federalregister.gov reuse a handful of TCP+TLS connections), have a timeout,
+are retried with exponential backoff on connection errors and 5xx responses,
+and are limited to a few at a time per host, however many threads are
+fetching. Every response is recorded in metrics.
+
+    response = http_client.get(url, params=params)
+
+Client(cache_name=...) does the same over a requests_cache session, for the
+sources we keep an HTTP cache of."""
+
+from collections import defaultdict
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
+
+import metrics
+import replay
+
+
+# Seconds to wait for a connection, and then for each read
+TIMEOUT = (10, 60)
+RETRIES = 3
+# Retries wait 0.5s, 1s, 2s, ...
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+# Connections kept open per host; at least as many as download threads
+POOL_SIZE = 16
+# Requests in flight to one host at a time, across all clients
+HOST_CONCURRENCY = 8
+
+
+class HostLimiter(object):
+    """A semaphore per host"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.semaphores = defaultdict(
+            lambda: threading.BoundedSemaphore(self.limit))
+
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            return self.semaphores[host]
+
+
+_host_limiter = HostLimiter(HOST_CONCURRENCY)
+
+
+class HostRateLimiter(object):
+    """Hands out request slots so that requests to the same host are at least
+    `interval` seconds apart, no matter how many threads are asking"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_adapter(retries=RETRIES, backoff_factor=BACKOFF_FACTOR,
+                 pool_size=POOL_SIZE):
+    retry = Retry(total=retries, backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    kwargs = dict(pool_connections=pool_size, pool_maxsize=pool_size,
+                  max_retries=retry)
+    # Recording or replaying traffic, if replay.py asked for it
+    return replay.adapter_from_environment(**kwargs) or HTTPAdapter(**kwargs)
+
+
+class Client(object):
+    """A pooled session plus timeouts, per-host limits and metrics. With a
+    cache_name, responses are cached by requests_cache under that name"""
+
+    def __init__(self, cache_name=None, timeout=TIMEOUT, retries=RETRIES,
+                 backoff_factor=BACKOFF_FACTOR, pool_size=POOL_SIZE,
+                 host_limiter=None):
+        if cache_name:
+            self.session = CachedSession(cache_name)
+        else:
+            self.session = requests.Session()
+        adapter = make_adapter(retries, backoff_factor, pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.timeout = timeout
+        self.host_limiter = host_limiter or _host_limiter
+
+    def get(self, url, params=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with self.host_limiter.slot(url):
+            response = self.session.get(url, params=params, **kwargs)
+        return metrics.record_response(response)
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client():
+    """The client shared by everything that doesn't need a cache"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = Client()
+        return _default_client
+
+
+def get(url, params=None, **kwargs):
+    return default_client().get(url, params=params, **kwargs)
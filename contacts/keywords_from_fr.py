@@ -3,16 +3,15 @@
 # Fetch and build keywords from the "subject" field of federal register data
 
 from datetime import date, timedelta
-from glob import glob
 import itertools
 import logging
 import re
-import os
 import string
 
-import requests
-from requests_cache.core import CachedSession
-import yaml
+import cache
+import dataset
+import http_client
+import metrics
 
 
 FR_BASE = "https://www.federalregister.gov"
@@ -20,7 +19,7 @@ API_BASE = FR_BASE + "/api/v1/"
 FR_ARTICLES = API_BASE + "articles"
 
 
-def fetch_page(year, month, page_num, client=requests):
+def fetch_page(year, month, page_num, client=http_client):
     """Download a single page of 1000 results; return the results dict"""
     # Don't use a dict as we need the same order with each request (for
     # caching)
@@ -47,7 +46,7 @@ def fetch_page(year, month, page_num, client=requests):
         return {'results': []}
 
 
-def results_from_month(year, month, client=requests):
+def results_from_month(year, month, client=http_client):
     """Download a month of documents and emit any agency-topic pairs via a
     generator"""
     page_num = 1
@@ -138,7 +137,7 @@ def build_keywords():
     #    keywords[agency].add(topic)
 
     # Now, step back until 1999 - there are no topics before 2000
-    client = CachedSession('fr')
+    client = cache.default_cache().client_for('federal_register')
     cursor = subtract_month(today)
     while cursor.year > 1999:
         num_distinct = sum(len(words) for words in keywords.values())
@@ -166,44 +165,66 @@ def new_keywords(agency_data, fr_keywords):
     return 0, agency_data
 
 
+def patch_agency(yaml_data, fr_keywords):
+    """Add new keywords to an agency and its offices. Matched names are
+    removed from fr_keywords. Returns the number of new keywords and the
+    (potentially modified) agency data"""
+    num_new_keywords = 0
+    # First, check if keywords need to be added to the root
+    num_new, modified = new_keywords(yaml_data, fr_keywords)
+    if num_new:
+        del fr_keywords[normalize_name(yaml_data['name'])]
+        yaml_data = modified
+        num_new_keywords += num_new
+
+    # Next, check the children
+    departments = []
+    for yaml_office in yaml_data['departments']:
+        num_new, modified = new_keywords(yaml_office, fr_keywords)
+        if num_new:
+            del fr_keywords[normalize_name(yaml_office['name'])]
+            departments.append(modified)
+            num_new_keywords += num_new
+        else:
+            departments.append(yaml_office)
+
+    if num_new_keywords:
+        yaml_data = dict(yaml_data, departments=departments)
+    return num_new_keywords, yaml_data
+
+
+def patch_agencies(agencies):
+    """In-memory version of patch_yaml over an abbreviation -> data
+    mapping"""
+    fr_keywords = normalize_and_map(build_keywords())
+    for abbr in agencies:
+        num_new_keywords, agencies[abbr] = patch_agency(agencies[abbr],
+                                                        fr_keywords)
+        if num_new_keywords:
+            logging.info('Added %d new keywords to %s', num_new_keywords,
+                         abbr)
+    for name in fr_keywords:
+        logging.warning('Could not find this agency: %s', name)
+    return agencies
+
+
 def patch_yaml():
     """Go through the YAML files; for all agencies, check if we have some new
     keywords based on FR data. If so, update the YAML"""
     fr_keywords = normalize_and_map(build_keywords())
 
-    for filename in glob("data" + os.sep + "*.yaml"):
-        num_new_keywords = 0
-        with open(filename) as f:
-            yaml_data = yaml.load(f.read())
-        # First, check if keywords need to be added to the root
-        num_new, modified = new_keywords(yaml_data, fr_keywords)
-        if num_new:
-            del fr_keywords[normalize_name(yaml_data['name'])]
-            yaml_data = modified
-            num_new_keywords += num_new
-
-        # Next, check the children
-        departments = []
-        for yaml_office in yaml_data['departments']:
-            num_new, modified = new_keywords(yaml_office, fr_keywords)
-            if num_new:
-                del fr_keywords[normalize_name(yaml_office['name'])]
-                departments.append(modified)
-                num_new_keywords += num_new
-            else:
-                departments.append(yaml_office)
-
+    for abbr, yaml_data in dataset.load_all().items():
+        num_new_keywords, yaml_data = patch_agency(yaml_data, fr_keywords)
         if num_new_keywords:
-            yaml_data = dict(yaml_data, departments=departments)
-            with open(filename, 'w') as f:
-                f.write(yaml.dump(yaml_data, default_flow_style=False,
-                                  allow_unicode=True))
-                logging.info('Rewrote %s with %d new keywords', filename,
-                             num_new_keywords)
+            dataset.save_agency(abbr, yaml_data)
+            logging.info('Rewrote %s with %d new keywords', abbr,
+                         num_new_keywords)
     for name in fr_keywords:
         logging.warning('Could not find this agency: %s', name)
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    patch_yaml()
+    with metrics.stage('keywords'):
+        patch_yaml()
+    metrics.write()
@@ -1,15 +1,31 @@
 #!/usr/bin/env python
 
 """Fill in any blanks in the YAML files by investigating a XLS"""
+from collections import Counter, OrderedDict
 from copy import deepcopy
-from glob import glob
-from scraper import extract_numbers, clean_phone_number
+import hashlib
 import logging
 import os
-from urllib.request import urlopen
+import pickle
 
+import requests
 import xlrd
-import yaml
+
+import cache
+import dataset
+import metrics
+import names
+import phones
+from phones import extract_numbers, clean_phone_number
+
+XLS_URL = "https://www.foia.gov/full-foia-contacts.xls"
+XLS_PATH = os.path.join("layering_data", "full-foia-contacts.xls")
+# The parsed XLS, kept until the XLS changes
+PARSED_PATH = os.path.join("layering_data", "full-foia-contacts.pickle")
+# The code that builds the parse: this module and the phone normalization
+# it relies on. Editing either invalidates the parse
+PARSE_SOURCES = (os.path.abspath(__file__),
+                 os.path.abspath(phones.__file__))
 
 
 def organize_address(row):
@@ -103,81 +119,258 @@ def add_contact_info(contacts, row):
         office_struct['misc'][row['Title']] = contact_string(row)
 
 
-def contacts_from_xls():
+def refresh_xls(xls_path):
+    """Bring the local XLS up to date, rewriting it only if it changed"""
+    response = cache.fetch(XLS_URL, 'foia_contacts_xls')
+    response.raise_for_status()
+    if os.path.isfile(xls_path):
+        with open(xls_path, 'rb') as f:
+            if f.read() == response.content:
+                return
+    with open(xls_path, 'wb') as f:
+        f.write(response.content)
+    metrics.file_written()
+
+
+def read_rows(sheet):
+    """Each row after the header as a field name -> value dict, reading
+    whole rows rather than cell by cell"""
+    field_names = sheet.row_values(0)
+    for row_idx in range(1, sheet.nrows):
+        yield dict(zip(field_names, sheet.row_values(row_idx)))
+
+
+def parse_xls(xls_path):
+    """Build the contacts lookup structure from every sheet of the XLS"""
+    contacts = {}
+    workbook = xlrd.open_workbook(xls_path)
+    for sheet in workbook.sheets():
+        for row in read_rows(sheet):
+            add_contact_info(contacts, row)
+    return contacts
+
+
+def xls_hash(xls_path, sources=PARSE_SOURCES):
+    """Identifies both the XLS and the code that parses it"""
+    digest = hashlib.sha1()
+    for path in sources + (xls_path,):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_parsed(xls_path, parsed_path):
+    """The contacts parsed from xls_path before, or None if they were
+    parsed from a different XLS (or not at all)"""
+    if not os.path.isfile(parsed_path):
+        return None
+    try:
+        with open(parsed_path, 'rb') as f:
+            source_hash, contacts = pickle.load(f)
+    except Exception as e:
+        logging.warning("Unreadable %s: %s", parsed_path, e)
+        return None
+    if source_hash == xls_hash(xls_path):
+        return contacts
+
+
+def save_parsed(xls_path, parsed_path, contacts):
+    tmp_path = parsed_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((xls_hash(xls_path), contacts), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, parsed_path)
+
+
+def contacts_from_xls(xls_path=XLS_PATH, parsed_path=PARSED_PATH):
     """Generate a lookup structure from the XLS files hosted by foia.gov. This
     is a dictionary of this form:
     { "agency_name": { "office_name": {dict-corresponding-to-yaml} } }
-    Look in local directories before pulling down the data."""
-    contacts = {}
+    The local copy is refreshed through the HTTP cache, and used as it is
+    when foia.gov can't be reached. Unless the XLS changed, the structure is
+    read back from the last parse instead of parsing the XLS again."""
+    try:
+        refresh_xls(xls_path)
+    except requests.RequestException as e:
+        if not os.path.isfile(xls_path):
+            raise
+        logging.warning("Could not refresh %s: %s", xls_path, e)
 
-    xls_path = "layering_data" + os.sep + "full-foia-contacts.xls"
-    if not os.path.isfile(xls_path):
-        with open(xls_path, 'wb') as f:
-            data = urlopen("https://www.foia.gov/full-foia-contacts.xls")
-            f.write(data.read())
-    workbook = xlrd.open_workbook(xls_path)
-    for sheet in workbook.sheet_names():
-        sheet = workbook.sheet_by_name(sheet)
-        field_names = [sheet.cell_value(0, x) for x in range(sheet.ncols)]
-        for row_idx in range(1, sheet.nrows):
-            row = {field_names[x]: sheet.cell_value(row_idx, x)
-                   for x in range(sheet.ncols)}
-            add_contact_info(contacts, row)
+    contacts = load_parsed(xls_path, parsed_path)
+    if contacts is not None:
+        metrics.cache_hit()
+        return contacts
+    metrics.cache_miss()
+    contacts = parse_xls(xls_path)
+    try:
+        save_parsed(xls_path, parsed_path, contacts)
+    except OSError as e:
+        logging.warning("Could not write %s: %s", parsed_path, e)
     return contacts
 
 
-def patch_dict(old_dict, new_dict):
-    """Merge the new dict onto the old, only replacing a field if it did not
-    exist in the original. A bit more complexity on the 'misc' fields. Returns
-    a new dict if changes were made or None if not"""
-    changed = False
-    to_return = deepcopy(old_dict)
+def field_changes(old_dict, new_dict):
+    """The fields new_dict would add to old_dict: every field old_dict
+    lacks, and under 'misc' (when both have one) the misc fields it lacks.
+    Nothing is copied; an empty dict means no change"""
+    changes = {}
     for field in new_dict:
         if new_dict[field] and field not in old_dict:
-            to_return[field] = new_dict[field]
-            changed = True
+            changes[field] = new_dict[field]
     if 'misc' in new_dict and 'misc' in old_dict:
-        misc = patch_dict(old_dict['misc'], new_dict['misc'])
+        misc = field_changes(old_dict['misc'], new_dict['misc'])
         if misc:
-            to_return['misc'] = misc
-            changed = True
-    if changed:
-        return to_return
+            changes['misc'] = misc
+    return changes
+
+
+def apply_changes(old_dict, changes):
+    """A copy of old_dict with the field_changes added. Only the dicts along
+    the way are copied; unchanged fields are shared with old_dict"""
+    to_return = dict(old_dict)
+    for field, value in changes.items():
+        if field == 'misc' and 'misc' in old_dict:
+            to_return['misc'] = apply_changes(old_dict['misc'], value)
+        else:
+            # Added values come from the XLS lookup, which may be shared
+            # between agencies
+            to_return[field] = deepcopy(value)
+    return to_return
+
+
+def patch_dict(old_dict, new_dict):
+    """Merge the new dict onto the old, only replacing a field if it did not
+    exist in the original. A bit more complexity on the 'misc' fields. Returns
+    a new dict if changes were made or None if not"""
+    changes = field_changes(old_dict, new_dict)
+    if changes:
+        return apply_changes(old_dict, changes)
+
+
+class XlsNames(object):
+    """Resolves YAML agency and office names to the XLS's spelling of them,
+    using the aliases confirmed for the agency (by its abbreviation in
+    data/). Each index is built once, the office indexes when first
+    needed"""
+
+    def __init__(self, contacts, aliases=None):
+        self.contacts = contacts
+        self.aliases = names.load_aliases() if aliases is None else aliases
+        self.agencies = names.NameIndex(contacts)
+        self.offices = {}
+
+    def agency(self, name, abbr=None):
+        return self.agencies.lookup(
+            name, aliases=names.agency_aliases(abbr, self.aliases))
+
+    def office(self, agency, name, exclude=(), abbr=None):
+        if agency not in self.offices:
+            self.offices[agency] = names.NameIndex(self.contacts[agency])
+        return self.offices[agency].lookup(
+            name, exclude, names.agency_aliases(abbr, self.aliases))
+
+
+def department_changes(yaml_data, contacts, xls_agency=None,
+                       xls_names=None, abbr=None):
+    """department name -> field_changes for the agency's departments which
+    the XLS adds to. Departments whose name isn't in the XLS are matched
+    fuzzily, each to a different XLS office"""
+    xls_agency = xls_agency or yaml_data['name']
+    xls_names = xls_names or XlsNames(contacts)
+    contact_data = contacts[xls_agency]
+    claimed = set(dept['name'] for dept in yaml_data['departments']
+                  if dept['name'] in contact_data)
+    changes = OrderedDict()
+    for yaml_office in yaml_data['departments']:
+        office = yaml_office['name']
+        if office not in contact_data:
+            office = xls_names.office(xls_agency, office, exclude=claimed,
+                                      abbr=abbr)
+            if office is None:
+                logging.warning('Not in XLS: %s -> %s',
+                                yaml_data['name'], yaml_office['name'])
+                continue
+            logging.info('Matched %s -> %s to XLS office %s',
+                         yaml_data['name'], yaml_office['name'], office)
+            claimed.add(office)
+        dept_changes = field_changes(yaml_office, contact_data[office])
+        if dept_changes:
+            changes[yaml_office['name']] = dept_changes
+    return changes
+
+
+def change_summary(changes):
+    """A compact description of department changes, like
+    'emails 3, misc.FOIA Contact 1, website 2'"""
+    counts = Counter()
+    for dept_changes in changes.values():
+        for field, value in dept_changes.items():
+            if field == 'misc' and isinstance(value, dict):
+                counts.update('misc.%s' % title for title in value)
+            else:
+                counts[field] += 1
+    return ', '.join('%s %s' % (field, count)
+                     for field, count in sorted(counts.items()))
+
+
+def patch_agency(yaml_data, contacts, xls_names=None, abbr=None):
+    """Fill in the agency's departments with anything they are missing from
+    the XLS. Returns the number of departments which changed, and the
+    agency data: a new dict if anything changed, in which only the changed
+    departments are copied, otherwise yaml_data itself"""
+    xls_names = xls_names or XlsNames(contacts)
+    xls_agency = xls_names.agency(yaml_data['name'], abbr)
+    if xls_agency is None:
+        logging.warning('Not in XLS: %s', yaml_data['name'])
+        return 0, yaml_data
+    if xls_agency != yaml_data['name']:
+        logging.info('Matched %s to XLS agency %s', yaml_data['name'],
+                     xls_agency)
+
+    changes = department_changes(yaml_data, contacts, xls_agency, xls_names,
+                                 abbr)
+    if not changes:
+        return 0, yaml_data
+    logging.info('%s: %s departments gain %s', yaml_data['name'],
+                 len(changes), change_summary(changes))
+    departments = [apply_changes(dept, changes[dept['name']])
+                   if dept['name'] in changes else dept
+                   for dept in yaml_data['departments']]
+    return len(changes), dict(yaml_data, departments=departments)
+
+
+def patch_agencies(agencies):
+    """In-memory version of patch_yaml over an abbreviation -> data
+    mapping"""
+    contacts = contacts_from_xls()
+    xls_names = XlsNames(contacts)
+    for abbr in agencies:
+        new_dept_count, agencies[abbr] = patch_agency(
+            agencies[abbr], contacts, xls_names, abbr)
+        if new_dept_count:
+            logging.info('Updated %s departments of %s', new_dept_count,
+                         abbr)
+    return agencies
 
 
 def patch_yaml():
     """Compare YAML files with fields in the XLS. Update the YAML files with
-    any information they are missing."""
+    any information they are missing. Files are only rewritten if their
+    YAML actually changes."""
     contacts = contacts_from_xls()
-    for filename in glob("data" + os.sep + "*.yaml"):
-        with open(filename) as f:
-            yaml_data = yaml.load(f.read())
-        if yaml_data['name'] in contacts:
-            contact_data = contacts[yaml_data['name']]
-            departments, new_dept_count = [], 0
-            for yaml_office in yaml_data['departments']:
-                if yaml_office['name'] in contact_data:
-                    contact_office = contact_data[yaml_office['name']]
-                    dept = patch_dict(yaml_office, contact_office)
-                    if dept:
-                        new_dept_count += 1
-                    else:
-                        dept = yaml_office
-                    departments.append(dept)
-                else:
-                    logging.warning('Not in XLS: %s -> %s',
-                                    yaml_data['name'], yaml_office['name'])
-                    departments.append(yaml_office)
-            if new_dept_count > 0:
-                yaml_data['departments'] = departments
-                with open(filename, 'w') as f:
-                    f.write(yaml.dump(yaml_data, default_flow_style=False,
-                                      allow_unicode=True))
-                    logging.info('Rewrote %s with %s updated departments',
-                                 filename, new_dept_count)
-        else:
-            logging.warning('Not in XLS: %s', yaml_data['name'])
+    xls_names = XlsNames(contacts)
+    for abbr, yaml_data in dataset.load_all().items():
+        new_dept_count, yaml_data = patch_agency(yaml_data, contacts,
+                                                 xls_names, abbr)
+        if new_dept_count > 0 \
+                and dataset.save_agency_if_changed(abbr, yaml_data):
+            logging.info('Rewrote %s with %s updated departments',
+                         abbr, new_dept_count)
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    patch_yaml()
+    with metrics.stage('csv'):
+        patch_yaml()
+    metrics.write()
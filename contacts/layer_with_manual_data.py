@@ -1,18 +1,26 @@
 #!/usr/bin/env python
 
-import yaml
+import logging
 
-import scraper
+import dataset
+import manual_data
 
 
-def layer_manual_data(agency_abbr):
-    filename = scraper.agency_yaml_filename('data', agency_abbr)
-    with open(filename, 'r') as f:
-        print(filename)
-        agency_data = yaml.load(f)
-        data = scraper.apply_manual_data(agency_abbr, agency_data)
-        scraper.save_agency_data(agency_abbr, data)
+def layer_manual_data(agencies):
+    """Apply the manual overrides to an abbreviation -> data mapping. Only
+    agencies with overrides are touched; returns their abbreviations"""
+    changed = []
+    for abbr in sorted(manual_data.index()):
+        if abbr in agencies:
+            agencies[abbr], _ = manual_data.apply(abbr, agencies[abbr])
+            changed.append(abbr)
+    manual_data.report(agencies)
+    return changed
+
 
 if __name__ == "__main__":
-    for agency_abbr in scraper.AGENCIES:
-        layer_manual_data(agency_abbr)
+    logging.basicConfig(level=logging.INFO)
+    agencies = dataset.load_all()
+    for abbr in layer_manual_data(agencies):
+        dataset.save_agency(abbr, agencies[abbr])
+        logging.info("[%s] Applied manual data.", abbr)
@@ -1,20 +1,19 @@
-import os
+import logging
 import sys
 from urllib.parse import urljoin, urlparse
 
 import requests
-import yaml
 from bs4 import BeautifulSoup
 
-from scraper import agency_yaml_filename, AGENCIES
+import dataset
+import http_client
+import metrics
+from scraper import AGENCIES
 from scraper import save_agency_data
 
 
 def read_yaml_file(agency_abbr):
-    yaml_filename = agency_yaml_filename('data', agency_abbr)
-    if os.path.exists(yaml_filename):
-        agency_data = yaml.load(open(yaml_filename, 'r'))
-        return agency_data
+    return dataset.load_agency(agency_abbr)
 
 
 def get_base_url(url):
@@ -64,7 +63,7 @@ def unique_links(links):
     redirected = []
     for l in links:
         try:
-            response = requests.get(l[1], verify=False)
+            response = http_client.get(l[1], verify=False)
             if response.status_code < 400:
                 redirected.append([l[0], response.url])
         # Ignore the link, as it clearly doesn't work.
@@ -101,10 +100,10 @@ def process(data):
 
     if 'website' in data and data['website'].strip():
         try:
-            response = requests.get(data['website'], verify=False)
+            response = http_client.get(data['website'], verify=False)
         except requests.exceptions.MissingSchema:
             with_schema = 'http://%s' % data['website']
-            response = requests.get(with_schema, verify=False)
+            response = http_client.get(with_schema, verify=False)
         except:
             return None
 
@@ -140,24 +139,41 @@ def update_links(agency_data, links):
     return agency_data
 
 
+def add_reading_rooms(agency_data):
+    """ Add reading room links for the agency, and also for each of the
+    departments. """
+
+    links = process(agency_data)
+    if links:
+        agency_data = update_links(agency_data, links)
+    departments = []
+    if 'departments' in agency_data:
+        for department in agency_data['departments']:
+            links = process(department)
+            if links:
+                department = update_links(department, links)
+            departments.append(department)
+        agency_data['departments'] = departments
+    return agency_data
+
+
 def reading_room(agency_abbr):
     """ Get the reading room links for the agency, and also for each of the
     departments. """
 
     agency_data = read_yaml_file(agency_abbr)
     if agency_data:
-        links = process(agency_data)
-        if links:
-            agency_data = update_links(agency_data, links)
-        departments = []
-        if 'departments' in agency_data:
-            for department in agency_data['departments']:
-                links = process(department)
-                if links:
-                    department = update_links(department, links)
-                departments.append(department)
-            agency_data['departments'] = departments
-        return agency_data
+        return add_reading_rooms(agency_data)
+
+
+def patch_agencies(agencies):
+    """ Get reading room links for every agency in an abbreviation -> data
+    mapping. """
+
+    for abbr in agencies:
+        logging.info(abbr)
+        agencies[abbr] = add_reading_rooms(agencies[abbr])
+    return agencies
 
 
 def all_reading_rooms():
@@ -174,8 +190,10 @@ if __name__ == "__main__":
     if len(sys.argv) > 1:
         agency_abbr = sys.argv[1]
 
-    if agency_abbr:
-        agency_data = reading_room(agency_abbr)
-        save_agency_data(agency_abbr, agency_data)
-    else:
-        all_reading_rooms()
+    with metrics.stage('reading_rooms'):
+        if agency_abbr:
+            agency_data = reading_room(agency_abbr)
+            save_agency_data(agency_abbr, agency_data)
+        else:
+            all_reading_rooms()
+    metrics.write()
@@ -1,9 +1,12 @@
 import os
 import re
-import yaml
 
 from glob import glob
-from requests_cache.core import CachedSession
+
+import dataset
+import http_client
+import metrics
+import names
 
 """
 This script updates the yaml files with usa_id, description, and acronyms.
@@ -119,25 +122,28 @@ def update_dict(old_data, new_data):
 def write_yaml(filename, data):
     """ Exports the updated yaml file """
 
-    with open(filename, 'w') as f:
-        f.write(yaml.dump(
-            data, default_flow_style=False, allow_unicode=True))
+    dataset.write(filename, data)
 
 
 def patch_yamls(data, directory):
     """
-    Loops through yaml files and matches them to USA contacts API data
+    Loops through yaml files and matches them to USA contacts API data,
+    by name or, failing that, by a close enough name
     """
 
+    index = names.NameIndex(data)
     for filename in glob(directory):
-        with open(filename) as f:
-            agency = yaml.load(f.read())
-        agency_name = clean_name(agency.get('name'))
-        if agency_name in data:
+        agency = dataset.read(filename)
+        aliases = names.agency_aliases(
+            os.path.splitext(os.path.basename(filename))[0])
+        agency_name = index.lookup(clean_name(agency.get('name')),
+                                   aliases=aliases)
+        if agency_name:
             agency = update_dict(agency, data[agency_name])
         for office in agency['departments']:
-            office_name = clean_name(office['name'])
-            if office_name in data:
+            office_name = index.lookup(clean_name(office['name']),
+                                       aliases=aliases)
+            if office_name:
                 office = update_dict(office, data[office_name])
         yield agency, filename
 
@@ -145,7 +151,7 @@ def patch_yamls(data, directory):
 def get_api_data(url, cache):
     """ Retrives data from USA Gov Contacts API """
 
-    client = CachedSession(cache)
+    client = http_client.Client(cache_name=cache)
     request = client.get(url)
     assert request.status_code == 200, \
         'USAgov contacts API returned invalid response'
@@ -166,4 +172,6 @@ def layer_with_data():
 
 
 if __name__ == "__main__":
-    layer_with_data()
+    with metrics.stage('usa_contacts'):
+        layer_with_data()
+    metrics.write()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""The manual overrides in manual_data/. Every file is read once into an index
+of agency abbreviation -> Overrides, with the department overrides keyed by
+name, and merge() applies an agency's overrides touching only the departments
+they name. Overrides which no longer match a scraped department (usually
+because foia.gov renamed an office) are reported rather than silently
+dropped:
+
+    python manual_data.py
+"""
+
+from collections import namedtuple, OrderedDict
+import hashlib
+import logging
+import os
+
+import dataset
+
+
+MANUAL_DATA_DIRECTORY = 'manual_data'
+
+# `data` is the file as loaded, `agency` the non-department fields,
+# `departments` the department overrides by name (None if the file has no
+# departments) and `hash` the sha1 of the file
+Overrides = namedtuple('Overrides', ['data', 'agency', 'departments',
+                                     'hash'])
+
+_indexes = {}
+
+
+def update_list_in_dict(data, field, new_values_list):
+    original_values = set(data.get(field, []))
+    data[field] = sorted(list(original_values | set(new_values_list)))
+
+
+def update_non_departments(agency_data, manual_data):
+    """ Apply all the non-department changes from manual_data to agency_data.
+    """
+
+    agency_data = dict(agency_data)
+
+    list_fields = ['common_requests', 'keywords']
+
+    for field in manual_data.keys():
+        if field not in list_fields + ['departments']:
+            agency_data[field] = manual_data[field]
+
+    for field in list_fields:
+        if field in manual_data and field not in ['departments']:
+            update_list_in_dict(agency_data, field, manual_data[field])
+    return agency_data
+
+
+def overrides_from(data, file_hash=None):
+    """Index one agency's manual data"""
+    departments = None
+    if 'departments' in data:
+        departments = OrderedDict()
+        for dept in data['departments']:
+            departments[dept['name']] = dept
+    agency = dict((field, value) for field, value in data.items()
+                  if field != 'departments')
+    return Overrides(data, agency, departments, file_hash)
+
+
+def load_index(directory=MANUAL_DATA_DIRECTORY):
+    """Read every file in directory. Returns abbreviation -> Overrides"""
+    index = {}
+    for abbr in dataset.agency_abbrs(directory):
+        with open(dataset.agency_filename(directory, abbr), 'r',
+                  encoding='utf8') as f:
+            text = f.read()
+        data = dataset.load(text)
+        if data:
+            index[abbr] = overrides_from(
+                data, hashlib.sha1(text.encode('utf8')).hexdigest())
+    return index
+
+
+def file_times(directory=MANUAL_DATA_DIRECTORY):
+    """(abbreviation, mtime, size) of every file in directory"""
+    times = []
+    for abbr in dataset.agency_abbrs(directory):
+        stat = os.stat(dataset.agency_filename(directory, abbr))
+        times.append((abbr, stat.st_mtime_ns, stat.st_size))
+    return tuple(times)
+
+
+def index(directory=MANUAL_DATA_DIRECTORY):
+    """The index of directory, read on first use. Call refresh() to pick up
+    files changed since"""
+    if not os.path.isdir(directory):
+        return {}
+    key = os.path.abspath(directory)
+    if key not in _indexes:
+        _indexes[key] = file_times(directory), load_index(directory)
+    return _indexes[key][1]
+
+
+def refresh(directory=MANUAL_DATA_DIRECTORY):
+    """Read the directory again if a file in it was added, removed or
+    edited since it was indexed. Meant to be called once per run, not per
+    lookup"""
+    key = os.path.abspath(directory)
+    if key in _indexes and _indexes[key][0] != file_times(directory):
+        del _indexes[key]
+
+
+def clear_index():
+    _indexes.clear()
+
+
+def lookup(agency_abbr, directory=MANUAL_DATA_DIRECTORY):
+    """The agency's Overrides, or None"""
+    return index(directory).get(agency_abbr)
+
+
+def merge(agency_data, overrides):
+    """Apply overrides to agency_data. Only the departments an override
+    names are copied; the rest are shared with agency_data. Returns the
+    merged agency and the names of department overrides which matched no
+    department"""
+    merged = update_non_departments(agency_data, overrides.agency)
+    if overrides.departments is None:
+        return merged, []
+
+    matched = set()
+    if 'departments' in agency_data:
+        departments = []
+        for dept in agency_data['departments']:
+            override = overrides.departments.get(dept['name'])
+            if override is not None:
+                dept = update_non_departments(dept, override)
+                matched.add(dept['name'])
+            departments.append(dept)
+        merged['departments'] = departments
+    return merged, [name for name in overrides.departments
+                    if name not in matched]
+
+
+def apply(agency_abbr, agency_data, directory=MANUAL_DATA_DIRECTORY):
+    """merge() the agency's overrides, if it has any"""
+    overrides = lookup(agency_abbr, directory)
+    if overrides:
+        return merge(agency_data, overrides)
+    return agency_data, []
+
+
+def stale_overrides(agencies, directory=MANUAL_DATA_DIRECTORY):
+    """Department overrides which match no department, as abbreviation ->
+    names, for an abbreviation -> data mapping. Overrides for agencies
+    missing from the mapping are listed under the name None"""
+    stale = OrderedDict()
+    for abbr, overrides in sorted(index(directory).items()):
+        if abbr not in agencies:
+            stale[abbr] = [None]
+            continue
+        _, unmatched = merge(agencies[abbr], overrides)
+        if unmatched:
+            stale[abbr] = unmatched
+    return stale
+
+
+def report(agencies, directory=MANUAL_DATA_DIRECTORY):
+    """Log the stale overrides; returns how many there are"""
+    stale = stale_overrides(agencies, directory)
+    for abbr, names in stale.items():
+        for name in names:
+            if name is None:
+                logging.warning("[%s] Manual data for an agency with no "
+                                "data", abbr)
+            else:
+                logging.warning("[%s] Manual data matches no department: "
+                                "%s", abbr, name)
+    return sum(len(names) for names in stale.values())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    count = report(dataset.load_all())
+    logging.info("Stale overrides: %s", count)
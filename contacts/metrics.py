@@ -0,0 +1,140 @@
+"""Run metrics shared by the contacts scripts. Each script wraps its work in a
+stage and the fetchers, caches and writers record what they did into
+whichever stage is running:
+
+    with metrics.stage('keywords'):
+        patch_yaml()
+    metrics.write()
+
+For every stage this collects the wall time, HTTP requests (in total and per
+host), cache hits, misses and revalidations, bytes downloaded, files written
+and, for the scraper, the parse time of each agency. write() appends the run
+as a single line of JSON to metrics.jsonl, so a slow run can be traced to
+foia.gov, the Federal Register API or our own parsing."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from copy import deepcopy
+import json
+import threading
+import time
+from timeit import default_timer
+from urllib.parse import urlparse
+
+
+METRICS_FILENAME = 'metrics.jsonl'
+
+# Counters recorded outside of any stage end up here
+DEFAULT_STAGE = 'main'
+
+_lock = threading.Lock()
+_stages = OrderedDict()
+# Stages run one after another, but the thread pools inside a stage should
+# count towards it, so this is shared rather than thread local
+_running = []
+_started_at = time.time()
+
+
+def _new_stage():
+    return {'seconds': 0.0, 'http_requests': 0, 'http_requests_by_host': {},
+            'cache_hits': 0, 'cache_misses': 0, 'cache_revalidations': 0,
+            'bytes_downloaded': 0, 'files_written': 0, 'parse_seconds': {}}
+
+
+def _current():
+    """The record of the innermost running stage. Call with _lock held"""
+    name = _running[-1] if _running else DEFAULT_STAGE
+    if name not in _stages:
+        _stages[name] = _new_stage()
+    return _stages[name]
+
+
+@contextmanager
+def stage(name):
+    """Attribute everything recorded inside the block to stage `name`, and
+    add the block's wall time to it"""
+    with _lock:
+        _running.append(name)
+        _current()
+    start = default_timer()
+    try:
+        yield
+    finally:
+        with _lock:
+            _stages[name]['seconds'] += default_timer() - start
+            _running.remove(name)
+
+
+def increment(counter, amount=1):
+    with _lock:
+        _current()[counter] += amount
+
+
+def cache_hit():
+    increment('cache_hits')
+
+
+def cache_miss():
+    increment('cache_misses')
+
+
+def file_written():
+    increment('files_written')
+
+
+def record_request(url, size, from_cache=False):
+    """A response of `size` bytes for url, either downloaded or served from
+    a cache"""
+    with _lock:
+        record = _current()
+        if from_cache:
+            record['cache_hits'] += 1
+            return
+        host = urlparse(url).netloc
+        record['http_requests'] += 1
+        by_host = record['http_requests_by_host']
+        by_host[host] = by_host.get(host, 0) + 1
+        record['bytes_downloaded'] += size
+
+
+def record_response(response):
+    """record_request for a requests response. requests_cache marks the
+    responses it serves with from_cache; plain sessions don't set it"""
+    record_request(response.url, len(response.content),
+                   getattr(response, 'from_cache', False))
+    return response
+
+
+def record_parse(key, seconds):
+    with _lock:
+        _current()['parse_seconds'][key] = seconds
+
+
+@contextmanager
+def timed_parse(key):
+    start = default_timer()
+    yield
+    record_parse(key, default_timer() - start)
+
+
+def snapshot():
+    """Everything recorded so far, as JSON-compatible data"""
+    with _lock:
+        stages = deepcopy(_stages)
+    return {'started_at': int(_started_at),
+            'seconds': time.time() - _started_at,
+            'stages': stages}
+
+
+def write(filename=METRICS_FILENAME):
+    """Append this run's metrics to filename as one line of JSON"""
+    with open(filename, 'a') as f:
+        f.write(json.dumps(snapshot(), sort_keys=True) + '\n')
+
+
+def reset():
+    global _started_at
+    with _lock:
+        _stages.clear()
+        del _running[:]
+        _started_at = time.time()
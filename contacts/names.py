@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+"""Resolving agency and office names between sources which spell them
+differently: the YAML in data/, foia.gov's contacts XLS and processing time
+tables, and the USA.gov contacts API. A NameIndex is built once over one
+source's names; looking a name up normalizes it and then, failing an exact
+match, compares it with the candidates sharing its trigrams:
+
+    index = names.NameIndex(contacts)
+    index.lookup('Dept. of Commerce - Office of the Secretary')
+
+Only matches at least THRESHOLD similar (Jaccard similarity of trigrams) are
+returned. Aliases confirmed by hand live in layering_data/name_aliases.yaml.
+They are kept per agency, under its abbreviation in data/, as "name in one
+source: name in another", so an alias for one agency's office never applies to
+another's. They take precedence over fuzzy matches; an alias to null rules
+them out:
+
+    index.lookup(name, aliases=names.agency_aliases('DOC'))
+
+To list the fuzzy matches between the XLS and data/, and record them as
+confirmed:
+
+    python names.py
+    python names.py --save
+"""
+
+import argparse
+from collections import Counter
+import logging
+import os
+import re
+
+import dataset
+
+
+ALIASES_FILENAME = os.path.join('layering_data', 'name_aliases.yaml')
+
+# Minimum similarity for a fuzzy match
+THRESHOLD = 0.85
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+ABBREVIATIONS = {
+    'admin': 'administration',
+    'dept': 'department',
+    'div': 'division',
+    'hq': 'headquarters',
+    'natl': 'national',
+    'ofc': 'office',
+    'svc': 'service',
+    'svcs': 'services',
+}
+STOPWORDS = frozenset(['a', 'an', 'and', 'at', 'for', 'in', 'of', 'on',
+                       'the', 'to'])
+
+_aliases = {}
+
+
+def normalize(name):
+    """Lowercase, drop punctuation and filler words, expand common
+    abbreviations"""
+    tokens = TOKEN_RE.findall(name.lower().replace('&', ' and '))
+    tokens = [ABBREVIATIONS.get(token, token) for token in tokens]
+    return ' '.join(token for token in tokens if token not in STOPWORDS)
+
+
+def trigrams(normalized):
+    padded = '  %s ' % normalized
+    return frozenset(padded[idx:idx + 3] for idx in range(len(padded) - 2))
+
+
+def load_aliases(filename=ALIASES_FILENAME):
+    """The confirmed aliases, abbreviation -> {name: alias}, read once and
+    kept until the file changes"""
+    if not os.path.isfile(filename):
+        return {}
+    modified = os.stat(filename).st_mtime_ns
+    key = os.path.abspath(filename)
+    if key not in _aliases or _aliases[key][0] != modified:
+        _aliases[key] = modified, dataset.read(filename) or {}
+    return _aliases[key][1]
+
+
+def save_aliases(aliases, filename=ALIASES_FILENAME):
+    dataset.write(filename, aliases)
+    _aliases.pop(os.path.abspath(filename), None)
+
+
+def agency_aliases(abbr, aliases=None):
+    """The confirmed aliases for one agency's names and its offices'"""
+    aliases = load_aliases() if aliases is None else aliases
+    return aliases.get(abbr) or {}
+
+
+class NameIndex(object):
+    """Exact and trigram indexes over a collection of names. aliases, name ->
+    alias, apply to every lookup that doesn't bring its own"""
+
+    def __init__(self, names, aliases=None, threshold=THRESHOLD):
+        self.names = list(names)
+        self.aliases = aliases or {}
+        self.threshold = threshold
+        self.exact = {}
+        self.grams = []
+        self.by_gram = {}
+        for idx, name in enumerate(self.names):
+            normalized = normalize(name)
+            self.exact.setdefault(normalized, idx)
+            grams = trigrams(normalized)
+            self.grams.append(grams)
+            for gram in grams:
+                self.by_gram.setdefault(gram, []).append(idx)
+        self.positions = dict((name, idx)
+                              for idx, name in enumerate(self.names))
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def match(self, name, exclude=(), aliases=None):
+        """(indexed name, similarity) for the best match of name, or (None,
+        0.0). Names in exclude (say, those already claimed by another name)
+        are never returned"""
+        aliases = self.aliases if aliases is None else aliases
+        if name in self.positions and name not in exclude:
+            return name, 1.0
+        if name in aliases:
+            alias = aliases[name]
+            if alias is None:
+                return None, 0.0
+            # Aliases name other sources too; only use those indexed here
+            if alias in self.positions and alias not in exclude:
+                return alias, 1.0
+        normalized = normalize(name)
+        if normalized in self.exact:
+            exact = self.names[self.exact[normalized]]
+            if exact not in exclude:
+                return exact, 1.0
+
+        grams = trigrams(normalized)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.by_gram.get(gram, ()))
+        best, best_score = None, 0.0
+        for idx, count in shared.items():
+            # Jaccard similarity from the shared count, without set
+            # operations
+            score = count / (len(grams) + len(self.grams[idx]) - count)
+            if score > best_score and self.names[idx] not in exclude:
+                best, best_score = self.names[idx], score
+        if best_score >= self.threshold:
+            return best, best_score
+        return None, best_score
+
+    def lookup(self, name, exclude=(), aliases=None):
+        """The indexed name that name resolves to, or None"""
+        return self.match(name, exclude, aliases)[0]
+
+
+def xls_matches(agencies, contacts, aliases=None, threshold=THRESHOLD):
+    """(abbreviation, YAML name, XLS name, similarity) for every agency and
+    office that only matches the XLS fuzzily. As when layering, each XLS
+    office is matched to one YAML office at most"""
+    agency_index = NameIndex(contacts, threshold=threshold)
+    found = []
+    for abbr, data in agencies.items():
+        own_aliases = agency_aliases(abbr, aliases)
+        name, score = agency_index.match(data['name'], aliases=own_aliases)
+        if name is None:
+            continue
+        if score < 1.0:
+            found.append((abbr, data['name'], name, score))
+        offices = NameIndex(contacts[name], own_aliases, threshold)
+        claimed = set(dept['name'] for dept in data['departments']
+                      if dept['name'] in contacts[name])
+        for dept in data['departments']:
+            if dept['name'] in contacts[name]:
+                continue
+            office, score = offices.match(dept['name'], exclude=claimed)
+            if office is None:
+                continue
+            claimed.add(office)
+            if score < 1.0:
+                found.append((abbr, dept['name'], office, score))
+    return found
+
+
+if __name__ == "__main__":
+    import layer_with_csv
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='List fuzzy name matches between the XLS and data/.')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='Minimum similarity to list.')
+    parser.add_argument('--save', action='store_true',
+                        help='Record the listed matches as confirmed '
+                             'aliases.')
+    args = parser.parse_args()
+    aliases = dict((abbr, dict(own_aliases))
+                   for abbr, own_aliases in load_aliases().items())
+    matches = xls_matches(dataset.load_all(),
+                          layer_with_csv.contacts_from_xls(), aliases,
+                          args.threshold)
+    for abbr, yaml_name, xls_name, score in matches:
+        print("%.2f  %s: %s  ->  %s" % (score, abbr, yaml_name, xls_name))
+    if args.save:
+        for abbr, yaml_name, xls_name, _ in matches:
+            aliases.setdefault(abbr, {})[yaml_name] = xls_name
+        save_aliases(aliases)
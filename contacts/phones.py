@@ -0,0 +1,180 @@
+"""Phone number normalization shared by the scraper and the XLS layer. The same
+numbers show up in many departments (and again in the XLS), so results are
+memoized in a bounded LRU cache."""
+
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+
+# The definition of a phone number. Matching it directly backtracks
+# quadratically on long runs of digits and separators (which malformed notes
+# fields contain), so scan_phone reproduces its matches in linear time; this
+# is kept as the reference it is tested against
+PHONE_RE = re.compile(
+    r"""(?P<prefix>\+?[\d\s\(\)\-]*)"""
+    r"""(?P<area_code>\(?\d{3}\)?[\s\-\(\)]*)"""
+    r"""(?P<first_three>\d{3}[\-\s\(\)]*)"""
+    r"""(?P<last_four>\d{4}[\-\s]*)"""
+    r"""(?P<extension>[\s\(,]*?ext[ .]*?\d{3,5})?"""
+    r"""(?P<tty>\s*\(tty)?""", re.IGNORECASE)
+
+# Pieces of PHONE_RE which can be matched without ambiguity
+PHONE_RUN_RE = re.compile(r"\+?[\d\s\(\)\-]+")
+DIGIT_RUN_RE = re.compile(r"\d+")
+TRAILING_RE = re.compile(r"[\-\s]*")
+EXTENSION_RE = re.compile(r"[\s\(,]*ext[ .]*\d{3,5}", re.IGNORECASE)
+TTY_RE = re.compile(r"\s*\(tty", re.IGNORECASE)
+
+NON_DIGITS_RE = re.compile(r"\D")
+EXTENSION_SEPARATOR_RE = re.compile(r"[,\s(]+ext")
+
+# Distinct phone strings across all agencies and the XLS number in the low
+# thousands
+CACHE_SIZE = 8192
+
+
+PhoneMatch = namedtuple('PhoneMatch', [
+    'start', 'end', 'prefix', 'area_code', 'first_three', 'last_four',
+    'extension', 'tty'])
+
+
+def digits(text):
+    return NON_DIGITS_RE.sub("", text)
+
+
+def _number_at(line, groups, idx, pos):
+    """Read the 3-3-4 digits of a number starting at pos, inside digit group
+    idx. The number may only continue into the next group (i.e. across
+    separators) where one of its parts ends. Returns the parts and the end
+    position, or None"""
+    parts = []
+    for size in (3, 3, 4):
+        if pos == groups[idx][1]:
+            idx += 1
+            if idx == len(groups):
+                return None
+            pos = groups[idx][0]
+        if groups[idx][1] - pos < size:
+            return None
+        parts.append(line[pos:pos + size])
+        pos += size
+    return parts, pos
+
+
+def _scan_run(line, run):
+    """Match PHONE_RE within a single run of digits and separators. The
+    prefix is greedy, so the number is the last place in the run where one
+    can start"""
+    groups = [m.span() for m in DIGIT_RUN_RE.finditer(line, run.start(),
+                                                      run.end())]
+    for idx in range(len(groups) - 1, -1, -1):
+        start, end = groups[idx]
+        for pos in range(end - 3, start - 1, -1):
+            number = _number_at(line, groups, idx, pos)
+            if number:
+                return pos, number
+    return None
+
+
+def _phone_match(line, run):
+    found = _scan_run(line, run)
+    if not found:
+        return None
+    pos, ((area_code, first_three, last_four), end) = found
+    end = TRAILING_RE.match(line, end).end()
+    extension = EXTENSION_RE.match(line, end)
+    if extension:
+        end = extension.end()
+        extension = digits(extension.group())
+    tty = TTY_RE.match(line, end)
+    if tty:
+        end = tty.end()
+    return PhoneMatch(run.start(), end, digits(line[run.start():pos]),
+                      area_code, first_three, last_four, extension,
+                      bool(tty))
+
+
+def scan_phone(line):
+    """Linear time equivalent of PHONE_RE.search. Returns a PhoneMatch (with
+    only the digits of each part) or None"""
+    for run in PHONE_RUN_RE.finditer(line):
+        match = _phone_match(line, run)
+        if match:
+            return match
+
+
+def match_phone(line):
+    """Linear time equivalent of PHONE_RE.match"""
+    run = PHONE_RUN_RE.match(line)
+    if run:
+        return _phone_match(line, run)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_phone_number(line):
+    """
+    Given "(123) 456-7890 (Telephone)", extract the number and format
+    """
+    match = scan_phone(line)
+    if match:
+        number = "-".join([match.area_code, match.first_three,
+                           match.last_four])
+        if match.prefix:
+            number = "+" + match.prefix + " " + number
+        if match.extension:
+            number = number + " x" + match.extension
+        if match.tty:
+            number += " (TTY)"
+        return number
+
+    else:
+        raise Exception("Error extracting phone number",
+                        "phone line: " + line)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _extract_numbers(phones):
+    clean_numbers = []
+    phones = EXTENSION_SEPARATOR_RE.sub(' ext', phones)
+    for phone in phones.split(","):
+        phone = phone.strip()
+        if match_phone(phone):
+            clean_numbers.append(clean_phone_number(phone))
+    return tuple(clean_numbers)
+
+
+def extract_numbers(phones):
+    """
+    Extracts all phone numbers from a line and adds them to a list
+    """
+    # A fresh list each time: the cached results are shared, and a list
+    # appearing twice in one YAML document would be dumped as an alias
+    return list(_extract_numbers(phones))
+
+
+def clean_phone_numbers(lines):
+    """Normalize a batch of phone strings. Lines without a recognizable
+    number come back as None"""
+    numbers = []
+    for line in lines:
+        try:
+            numbers.append(clean_phone_number(line))
+        except Exception:
+            numbers.append(None)
+    return numbers
+
+
+def extract_all_numbers(lines):
+    """extract_numbers over a batch of phone strings"""
+    return [extract_numbers(line) for line in lines]
+
+
+def cache_info():
+    return {'clean_phone_number': clean_phone_number.cache_info(),
+            'extract_numbers': _extract_numbers.cache_info()}
+
+
+def clear_cache():
+    clean_phone_number.cache_clear()
+    _extract_numbers.cache_clear()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Build the contacts dataset in a single process. The YAML in data/ is loaded
+once, each stage updates the agencies in memory, and the YAML and JSON files
+(and snapshot.py's binary snapshot) are written once at the end. In between,
+the agencies are kept as compact records.py records, which the stages read
+and assign one agency at a time as dicts. This does the
+same work as running scraper.py, layer_with_csv.py, processing_time_scraper.py,
+keywords_from_fr.py, layer_with_reading_room.py and convert_to_json.py one
+after another."""
+
+import argparse
+import logging
+
+import convert_to_json
+import dataset
+import keywords_from_fr
+import layer_with_csv
+import layer_with_reading_room
+import metrics
+import processing_time_scraper
+import records
+import scraper
+import snapshot
+
+
+STAGES = ['scraper', 'csv', 'processing_times', 'keywords', 'reading_rooms']
+
+
+def scrape(agencies, args):
+    return scraper.scrape_agencies(
+        agencies, args.manifest, workers=args.workers, interval=args.interval,
+        max_age=args.max_age, force=args.force, parser=args.parser,
+        parse_workers=args.parse_workers)
+
+
+def layer_csv(agencies, args):
+    return layer_with_csv.patch_agencies(agencies)
+
+
+def layer_processing_times(agencies, args):
+    context = processing_time_scraper.RunContext()
+    top_level_data, dept_level_data = processing_time_scraper.collect_times(
+        context=context)
+    return processing_time_scraper.patch_agencies(
+        agencies, top_level_data, dept_level_data, context)
+
+
+def layer_keywords(agencies, args):
+    return keywords_from_fr.patch_agencies(agencies)
+
+
+def layer_reading_rooms(agencies, args):
+    return layer_with_reading_room.patch_agencies(agencies)
+
+
+TRANSFORMS = dict(zip(STAGES, [scrape, layer_csv, layer_processing_times,
+                               layer_keywords, layer_reading_rooms]))
+
+
+def run(args):
+    with metrics.stage('load'):
+        agencies = records.AgencyRecords(dataset.load_all())
+        # What the scraper parsed is only recorded once the YAML is saved,
+        # so a failure in a later stage doesn't lose the parse
+        args.manifest = scraper.load_manifest()
+    for stage in STAGES:
+        if stage in args.skip:
+            logging.info("Skipping %s", stage)
+            continue
+        logging.info("Running %s", stage)
+        with metrics.stage(stage):
+            agencies = TRANSFORMS[stage](agencies, args)
+    with metrics.stage('save'):
+        dataset.save_all(agencies)
+        snapshot.write(agencies)
+        if 'scraper' not in args.skip:
+            scraper.remember_saved(args.manifest, agencies)
+            scraper.save_manifest(args.manifest)
+    with metrics.stage('json'):
+        convert_to_json.write_json(agencies)
+    return agencies
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build the FOIA contacts dataset in one process.')
+    parser.add_argument('--skip', nargs='*', default=[], choices=STAGES,
+                        help='Stages to leave out.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of agencies to download concurrently.')
+    parser.add_argument('--interval', type=float,
+                        default=scraper.DOWNLOAD_INTERVAL,
+                        help=('Minimum seconds between two requests to the '
+                              'same host when downloading concurrently.'))
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help='Number of processes to parse agencies with.')
+    parser.add_argument('--parser', default=scraper.HTML_PARSER,
+                        choices=['html.parser', 'lxml'],
+                        help='BeautifulSoup tree builder for agency pages.')
+    parser.add_argument('--max-age', type=float, default=None,
+                        help=('Re-download agency HTML older than this many '
+                              'hours. Defaults to the HTTP cache\'s TTL for '
+                              'agency pages (a week).'))
+    parser.add_argument('--force', action='store_true',
+                        help='Re-parse agencies even if their HTML and '
+                             'manual data are unchanged.')
+    args = parser.parse_args(argv)
+    if args.max_age is not None:
+        args.max_age *= 3600
+    return args
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run(parse_args())
+    metrics.write()
@@ -1,13 +1,20 @@
 #!/usr/bin/env python
+import argparse
 from bs4 import BeautifulSoup
-from copy import deepcopy
+from collections.abc import Mapping
+from concurrent.futures import as_completed, ThreadPoolExecutor
+import json
 import logging
-from glob import glob
-import os
 import csv
+import os
 import re
-import requests
-import yaml
+import time
+
+import cache
+import dataset
+import http_client
+import metrics
+import names
 
 """ This script scrapes processing times data from foia.gov and dumps
     the data in both the yaml files and `request_time_data.csv`."""
@@ -15,6 +22,69 @@ import yaml
 PROCESSING_TIMES_URL = "https://www.foia.gov/foia/Services/DataProcessTime.jsp"
 YEARS_URL = 'https://www.foia.gov/data.html'
 
+# Pages fetched at once, and the minimum seconds between two requests
+WORKERS = 8
+FETCH_INTERVAL = 0.1
+
+# The years foia.gov has data for, as last discovered, and how long that
+# is trusted
+YEARS_FILENAME = os.path.join(cache.CACHE_DIRECTORY, 'processing_years.json')
+YEARS_TTL = cache.DAY
+
+
+class RunContext(object):
+    """
+    What every part of a processing time run needs: the years foia.gov has
+    data for, the foia.gov -> yaml name mapping and the HTTP cache (and
+    session) pages are fetched through. Each is worked out once, the first
+    time it is needed, and the context is passed along explicitly.
+    """
+
+    def __init__(self, http_cache=None, years=None, mapping=None,
+                 years_filename=YEARS_FILENAME, years_ttl=YEARS_TTL):
+        self.http_cache = http_cache or cache.default_cache()
+        self._years = years
+        self._mapping = mapping
+        self.years_filename = years_filename
+        self.years_ttl = years_ttl
+
+    @property
+    def client(self):
+        return self.http_cache.client
+
+    @property
+    def years(self):
+        if self._years is None:
+            self._years = discover_years(self.client, self.years_filename,
+                                         self.years_ttl)
+        return self._years
+
+    @property
+    def mapping(self):
+        if self._mapping is None:
+            self._mapping = load_mapping(self.years)
+        return self._mapping
+
+
+def discover_years(client=http_client, filename=YEARS_FILENAME,
+                   ttl=YEARS_TTL):
+    """
+    The years foia.gov has data for, read from filename while it is less
+    than ttl seconds old, otherwise scraped and saved there.
+    """
+
+    if os.path.isfile(filename):
+        with open(filename, 'r') as f:
+            saved = json.load(f)
+        if time.time() - saved['fetched_at'] <= ttl:
+            return saved['years']
+
+    years = sorted(get_years(client=client))
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump({'fetched_at': int(time.time()), 'years': years}, f)
+    return years
+
 
 def load_mapping(years=None):
     """
@@ -26,10 +96,9 @@ def load_mapping(years=None):
     key = {}
 
     if years is None:
-        years = get_years()
+        years = discover_years()
 
-    with open('layering_data/foiadata_to_yaml_mapping.yaml', 'r') as f:
-        mapping = yaml.load(f.read())
+    mapping = dataset.read('layering_data/foiadata_to_yaml_mapping.yaml')
     for element in mapping:
         for year in years:
             yaml_name = "{0}_{1}".format(element, year).lower()
@@ -42,17 +111,47 @@ def load_mapping(years=None):
     return key
 
 
+class MappedData(Mapping):
+    """
+    A read-only view of foia.gov data which also answers to the yaml names
+    of its keys. Each yaml name resolves to the foia.gov record itself, so
+    records are shared rather than copied.
+    """
+
+    def __init__(self, data, aliases):
+        self.data = data
+        self.aliases = aliases
+
+    def __getitem__(self, key):
+        return self.data[self.aliases.get(key, key)]
+
+    def __contains__(self, key):
+        return key in self.aliases or key in self.data
+
+    def __iter__(self):
+        for key in self.data:
+            if key not in self.aliases:
+                yield key
+        for key in self.aliases:
+            yield key
+
+    def __len__(self):
+        return len(self.aliases) + sum(
+            1 for key in self.data if key not in self.aliases)
+
+
 def apply_mapping(data, mapping=None):
     """ Applies mapping to make foia.gov data compatiable with yaml data """
 
     if mapping is None:
         mapping = load_mapping()
 
-    for foia_data_name in mapping.keys():
-        if foia_data_name in data.keys():
-            for yaml_name in mapping[foia_data_name]:
-                data[yaml_name] = deepcopy(data[foia_data_name])
-    return data
+    aliases = {}
+    for foia_data_name, yaml_names in mapping.items():
+        if foia_data_name in data:
+            for yaml_name in yaml_names:
+                aliases[yaml_name] = foia_data_name
+    return MappedData(data, aliases)
 
 
 def delete_empty_data(data):
@@ -80,38 +179,89 @@ def append_time_stats(yaml_data, data, yaml_key, year):
 
     if not yaml_data.get('request_time_stats'):
         yaml_data['request_time_stats'] = {}
-    cleaned_data = clean_data(data[yaml_key])
+    # Records may be shared between yaml names, so clean a copy
+    cleaned_data = clean_data(dict(data[yaml_key]))
     if cleaned_data:
-        yaml_data['request_time_stats'][year.strip("_")] = \
-            deepcopy(cleaned_data)
+        yaml_data['request_time_stats'][year.strip("_")] = cleaned_data
     return yaml_data
 
 
-def patch_yamls(top_level_data, dept_level_data):
+def office_indexes(dept_level_data):
+    """ Indexes the office names in the data, by agency abbreviation """
+
+    by_abbr = {}
+    for key in dept_level_data:
+        parts = key.rsplit('_', 2)
+        if len(parts) == 3:
+            by_abbr.setdefault(parts[1], set()).add(parts[0])
+    return dict((abbr, names.NameIndex(sorted(offices)))
+                for abbr, offices in by_abbr.items())
+
+
+def office_names(abbr, yaml_data, offices=None):
+    """
+    The name each of the agency's offices goes by on foia.gov. Names that
+    don't match exactly are matched fuzzily, if offices are given.
+    """
+
+    yaml_names = [dept['name'] for dept in yaml_data['departments']]
+    index = (offices or {}).get(abbr.lower())
+    if index is None:
+        return yaml_names
+    lowered = set(name.lower() for name in yaml_names)
+    aliases = names.agency_aliases(abbr)
+    resolved = []
+    for name in yaml_names:
+        if name.lower() not in index:
+            match = index.lookup(name, exclude=lowered, aliases=aliases)
+            if match:
+                logging.info("Matched %s to foia.gov office %s", name, match)
+                name = match
+        resolved.append(name)
+    return resolved
+
+
+def patch_agency(abbr, yaml_data, top_level_data, dept_level_data, years,
+                 offices=None):
+    """ Adds average times to an agency and its offices """
+
+    short_filename = '_%s' % abbr
+    foia_names = office_names(abbr, yaml_data, offices)
+    for year in years:
+        year = "_%s" % year
+        agency_key = yaml_data['name'] + short_filename + year
+        agency_key = agency_key.lower()
+        if agency_key in top_level_data:
+            yaml_data = append_time_stats(
+                yaml_data, top_level_data, agency_key, year)
+        for internal_data, foia_name in zip(yaml_data['departments'],
+                                            foia_names):
+            office_key = foia_name + short_filename + year
+            office_key = office_key.lower()
+            if office_key in dept_level_data:
+                internal_data = append_time_stats(
+                    internal_data, dept_level_data, office_key, year)
+    return yaml_data
+
+
+def patch_agencies(agencies, top_level_data, dept_level_data, context=None):
+    """ Patches an abbreviation -> data mapping with average times """
+
+    context = context or RunContext()
+    offices = office_indexes(dept_level_data)
+    for abbr in agencies:
+        agencies[abbr] = patch_agency(
+            abbr, agencies[abbr], top_level_data, dept_level_data,
+            context.years, offices)
+    return agencies
+
+
+def patch_yamls(top_level_data, dept_level_data, context=None):
     """ Patches yaml files with average times """
 
-    years = get_years()
-    for filename in glob("data" + os.sep + "*.yaml"):
-        short_filename = '_%s' % filename.strip('.yaml').strip('/data')
-        with open(filename) as f:
-            yaml_data = yaml.load(f.read())
-        for year in years:
-            year = "_%s" % year
-            agency_key = yaml_data['name'] + short_filename + year
-            agency_key = agency_key.lower()
-            if agency_key in top_level_data.keys():
-                yaml_data = append_time_stats(
-                    yaml_data, top_level_data, agency_key, year)
-            for internal_data in yaml_data['departments']:
-                office_key = internal_data['name'] + short_filename + year
-                office_key = office_key.lower()
-                if office_key in dept_level_data.keys():
-                    internal_data = append_time_stats(
-                        internal_data, dept_level_data, office_key, year)
-
-        with open(filename, 'w') as f:
-            f.write(yaml.dump(
-                yaml_data, default_flow_style=False, allow_unicode=True))
+    agencies = patch_agencies(
+        dataset.load_all(), top_level_data, dept_level_data, context)
+    dataset.save_all(agencies)
 
 
 def make_column_names():
@@ -158,6 +308,7 @@ def write_csv(data, top_level=False):
             writing_data = get_row_data(key, data[key], column_names)
             writing_data.append(level)
             writer.writerow(writing_data)
+    metrics.file_written()
 
 
 def clean_html(html_text):
@@ -177,23 +328,56 @@ def clean_names(columns):
     return clean_columns
 
 
-def fetch_page(url, params):
+def fetch_page(url, params, rate_limiter=None, context=None):
     """
-    Returns a cached agency processing time page if it exists,
-    otherwise the function creates a cache and returns the html.
+    Returns an agency processing time page, from the HTTP cache while
+    its copy is fresh. Pages are cached in cache/processing_times/, which
+    replaced the html/<agency>_<year>_timedata.html files: those never
+    expired, so foia.gov's updated reports were never picked up.
     """
 
-    filename = "html/{0}_{1}_timedata.html"
-    filename = filename.format(
-        params.get('agencyName', "all"), params['requestYear'])
-    if os.path.isfile(filename):
-        with open(filename, 'r') as f:
-            return f.read()
-    else:
-        response = requests.get(url, params=params)
-        with open(filename, 'w') as f:
-            f.write(response.text)
-        return response.text
+    http_cache = context.http_cache if context else cache.default_cache()
+    before_request = rate_limiter.wait if rate_limiter else None
+    return http_cache.fetch(url, 'processing_times', params=params,
+                            before_request=before_request).text
+
+
+def fetch_pages(url, param_sets, workers=WORKERS, interval=FETCH_INTERVAL,
+                context=None):
+    """
+    Fetches a page for each of the param_sets, several at a time, with
+    requests to foia.gov spaced `interval` seconds apart. Yields the index
+    of the params and the html as each page arrives.
+    """
+
+    rate_limiter = http_client.HostRateLimiter(interval)
+    if workers <= 1:
+        for idx, params in enumerate(param_sets):
+            yield idx, fetch_page(url, params, rate_limiter, context)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_page, url, params, rate_limiter,
+                               context): idx
+                   for idx, params in enumerate(param_sets)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def collect_pages(url, param_sets, data, workers=WORKERS, context=None):
+    """
+    Parses each page as soon as it arrives. The results are added to data
+    in the order of param_sets, so the outcome doesn't depend on which
+    page came back first.
+    """
+
+    pages = [None] * len(param_sets)
+    for idx, html in fetch_pages(url, param_sets, workers,
+                                 context=context):
+        pages[idx] = parse_html(html, param_sets[idx], {})
+    for page_data in pages:
+        data.update(page_data)
+    return data
 
 
 def zip_and_clean(columns, row):
@@ -235,11 +419,11 @@ def parse_html(html, params, data):
     return data
 
 
-def get_years(html=None):
+def get_years(html=None, client=http_client):
     """ Gets year data by scraping the data page """
 
     if html is None:
-        r = requests.get(YEARS_URL)
+        r = client.get(YEARS_URL)
         assert r.status_code == 200
         html = r.text
 
@@ -251,42 +435,57 @@ def get_years(html=None):
     return(list(set(years)))
 
 
-def all_years(url, params, data):
-    """ Loops through yearly data """
+def all_years(url, params, data, context=None, workers=WORKERS):
+    """ Collects yearly data """
 
-    for year in get_years():
-        params["requestYear"] = year
-        html = fetch_page(url, params)
-        data = parse_html(html, params, data)
-    return data
+    context = context or RunContext()
+    param_sets = [dict(params, requestYear=year) for year in context.years]
+    return collect_pages(url, param_sets, data, workers, context)
 
 
-def scrape_times():
-    """ Loops through foia.gov data for processing time """
+def collect_times(workers=WORKERS, context=None):
+    """
+    Collects foia.gov data for processing time, writes the csv and
+    returns the agency and office level data, keyed by yaml names
+    """
 
+    context = context or RunContext()
     url = PROCESSING_TIMES_URL
     params = {"advanceSearch": "71001.gt.-999999"}
-    top_level_data = {}
-    top_level_data = all_years(url, params, top_level_data)
+    top_level_data = all_years(url, params, {}, context, workers)
     agencies = set([value['agency'] for value in top_level_data.values()])
-    logging.info("compelete: %s", params.get('agencyName', "all"))
+    logging.info("compelete: all")
 
-    dept_level_data = {}
-    for agency in agencies:
-        params["agencyName"] = agency
-        dept_level_data = all_years(url, params, dept_level_data)
-        logging.info("compelete: %s", params.get('agencyName', "all"))
+    # Every agency and year at once, rather than agency by agency
+    param_sets = [dict(params, agencyName=agency, requestYear=year)
+                  for agency in sorted(agencies) for year in context.years]
+    dept_level_data = collect_pages(url, param_sets, {}, workers, context)
+    logging.info("compelete: %s agencies", len(agencies))
 
     write_csv(top_level_data, top_level=True)
     write_csv(dept_level_data, top_level=False)
 
-    top_level_data = apply_mapping(top_level_data)
-    dept_level_data = apply_mapping(dept_level_data)
+    top_level_data = apply_mapping(top_level_data, context.mapping)
+    dept_level_data = apply_mapping(dept_level_data, context.mapping)
+    return top_level_data, dept_level_data
+
+
+def scrape_times(workers=WORKERS):
+    """ Loops through foia.gov data for processing time """
 
-    patch_yamls(top_level_data, dept_level_data,)
+    context = RunContext()
+    top_level_data, dept_level_data = collect_times(workers, context)
+    patch_yamls(top_level_data, dept_level_data, context)
 
 
 if __name__ == "__main__":
 
     logging.basicConfig(level=logging.INFO)
-    scrape_times()
+    parser = argparse.ArgumentParser(
+        description='Scrape processing times from foia.gov.')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='Number of pages to download concurrently.')
+    args = parser.parse_args()
+    with metrics.stage('processing_times'):
+        scrape_times(args.workers)
+    metrics.write()
@@ -0,0 +1,98 @@
+"""An in-memory query engine over the departments of every agency, for the
+audits run while curating manual_data/. Departments are indexed once, by
+whether each field is present and by each of its values, so questions like
+"which departments lack a request_form" or "which are in VA" are set lookups:
+
+    index = query.DepartmentIndex(snapshot.load_all())
+    index.missing('request_form')
+    index.where('address.state', 'VA')
+
+Fields are named as in the YAML, with dots for nested fields. The common
+ones are indexed up front; any other field is indexed the first time it is
+queried."""
+
+from collections import OrderedDict
+
+
+INDEXED_FIELDS = ['website', 'request_form', 'emails', 'phone',
+                  'address.state']
+
+
+def field_value(record, field):
+    """The value at a dotted path, or None"""
+    for part in field.split('.'):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(part)
+    return record
+
+
+def index_values(value):
+    """The values a field is indexed under: each element of a list, the
+    value itself otherwise (unhashable values aren't indexed)"""
+    values = value if isinstance(value, list) else [value]
+    for value in values:
+        try:
+            hash(value)
+        except TypeError:
+            continue
+        yield value
+
+
+class DepartmentIndex(object):
+    """Presence and value indexes over (agency abbreviation, department)
+    pairs"""
+
+    def __init__(self, agencies, fields=INDEXED_FIELDS):
+        self.departments = []
+        for abbr, data in agencies.items():
+            for dept in data.get('departments') or []:
+                self.departments.append((abbr, dept))
+        self.present = {}
+        self.by_value = {}
+        for field in fields:
+            self.index(field)
+
+    def index(self, field):
+        """Build the indexes for field, unless they already exist"""
+        if field in self.present:
+            return
+        present, by_value = set(), {}
+        for idx, (_, dept) in enumerate(self.departments):
+            value = field_value(dept, field)
+            # Empty values count as missing, as they always have in
+            # explorer.py
+            if value:
+                present.add(idx)
+                for key in index_values(value):
+                    by_value.setdefault(key, set()).add(idx)
+        self.present[field] = present
+        self.by_value[field] = by_value
+
+    def _records(self, ids):
+        return [self.departments[idx] for idx in sorted(ids)]
+
+    def having(self, field):
+        """(abbreviation, department) pairs with a value for field"""
+        self.index(field)
+        return self._records(self.present[field])
+
+    def missing(self, field):
+        """(abbreviation, department) pairs without a value for field"""
+        self.index(field)
+        return self._records(
+            set(range(len(self.departments))) - self.present[field])
+
+    def where(self, field, value):
+        """(abbreviation, department) pairs whose field is, or for lists
+        contains, value"""
+        self.index(field)
+        return self._records(self.by_value[field].get(value, ()))
+
+    def values(self, field):
+        """value -> number of departments, most common first"""
+        self.index(field)
+        counts = [(value, len(ids))
+                  for value, ids in self.by_value[field].items()]
+        counts.sort(key=lambda pair: (-pair[1], str(pair[0])))
+        return OrderedDict(counts)
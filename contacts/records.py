@@ -0,0 +1,326 @@
+"""Typed, compact records for the contacts data. Agencies, departments,
+addresses and contacts are slotted objects rather than dicts, so a record
+carries no per-instance key table, and lists are stored as tuples. Records are
+never modified in place: replace() returns a new record which shares every
+field it didn't change, so updating one department of an agency copies that
+department and the agency, not the whole tree.
+
+Conversion to and from the dicts used throughout the YAML is lossless. Fields
+a record doesn't know about are kept (with interned keys) in `extra`, and a
+field that is absent stays absent, even when other records set it to None:
+
+    agency = Agency.from_dict(dataset.load_agency('DOJ'))
+    assert agency.to_dict() == dataset.load_agency('DOJ')
+
+load_all() keeps all of data/ as records in an AgencyRecords mapping, which
+pipeline.py passes through the scraper and each layer. They still see plain
+dicts: one agency is expanded when it is read and stored as a record again
+when it is assigned, sharing whatever didn't change.
+"""
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import sys
+
+import dataset
+
+
+class _Missing(object):
+    """Marks a field absent from the original dict"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __bool__(self):
+        return False
+
+    def __reduce__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+def intern_keys(value):
+    """Intern the keys of (nested) dicts, so that the many copies of e.g.
+    the request_time_stats keys share one string"""
+    if isinstance(value, dict):
+        return dict((sys.intern(key) if isinstance(key, str) else key,
+                     intern_keys(child)) for key, child in value.items())
+    if isinstance(value, list):
+        return [intern_keys(child) for child in value]
+    return value
+
+
+def freeze_list(value):
+    """Lists (of lists) of strings are stored as tuples"""
+    if isinstance(value, list):
+        return tuple(freeze_list(child) for child in value)
+    return value
+
+
+def thaw_list(value):
+    if isinstance(value, tuple):
+        return [thaw_list(child) for child in value]
+    return value
+
+
+def record_field(record_class):
+    """Converters for a field holding a single record"""
+    def load(value):
+        if isinstance(value, dict):
+            return record_class.from_dict(value)
+        return value
+
+    def dump(value):
+        if isinstance(value, Record):
+            return value.to_dict()
+        return value
+    return load, dump
+
+
+def record_list_field(record_class):
+    """Converters for a field holding a list of records"""
+    load_one, dump_one = record_field(record_class)
+
+    def load(value):
+        if isinstance(value, list):
+            return tuple(load_one(child) for child in value)
+        return value
+
+    def dump(value):
+        if isinstance(value, tuple):
+            return [dump_one(child) for child in value]
+        return value
+    return load, dump
+
+
+def record_dict_field(record_class):
+    """Converters for a field holding a name -> record dict"""
+    load_one, dump_one = record_field(record_class)
+
+    def load(value):
+        if isinstance(value, dict):
+            return dict((sys.intern(key), load_one(child))
+                        for key, child in value.items())
+        return value
+
+    def dump(value):
+        if isinstance(value, dict):
+            return dict((key, dump_one(child))
+                        for key, child in value.items())
+        return value
+    return load, dump
+
+
+LIST_FIELD = freeze_list, thaw_list
+DICT_FIELD = intern_keys, intern_keys
+
+
+class Record(object):
+    """Base class. Subclasses list their fields in __slots__ and may give
+    converters for fields that aren't plain scalars in CONVERTERS"""
+    __slots__ = ('extra',)
+    CONVERTERS = {}
+
+    @classmethod
+    def fields(cls):
+        if '_fields' not in cls.__dict__:
+            names = []
+            for klass in reversed(cls.__mro__):
+                names.extend(name for name in klass.__dict__.get(
+                    '__slots__', ()) if name != 'extra')
+            cls._fields = tuple(names)
+        return cls._fields
+
+    def __init__(self, extra=None, **values):
+        for name in self.fields():
+            setattr(self, name, values.pop(name, MISSING))
+        if values:
+            raise TypeError("Unknown %s fields: %s" % (
+                type(self).__name__, ", ".join(sorted(values))))
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        fields = set(cls.fields())
+        values, extra = {}, {}
+        for key, value in data.items():
+            if key in fields:
+                if key in cls.CONVERTERS:
+                    value = cls.CONVERTERS[key][0](value)
+                else:
+                    value = intern_keys(value)
+                values[key] = value
+            else:
+                extra[sys.intern(key)] = intern_keys(value)
+        return cls(extra=extra, **values)
+
+    def to_dict(self):
+        """The record as new dicts and lists, which can be changed without
+        changing the record"""
+        data = {}
+        for name in self.fields():
+            value = getattr(self, name)
+            if value is not MISSING:
+                if name in self.CONVERTERS:
+                    value = self.CONVERTERS[name][1](value)
+                else:
+                    value = intern_keys(value)
+                data[name] = value
+        if self.extra:
+            data.update(intern_keys(self.extra))
+        return data
+
+    def get(self, name, default=None):
+        value = getattr(self, name, MISSING)
+        if value is MISSING and self.extra:
+            value = self.extra.get(name, MISSING)
+        return default if value is MISSING else value
+
+    def replace(self, **changes):
+        """A copy with some fields changed; everything else is shared.
+        Setting a field to MISSING removes it"""
+        copy = object.__new__(type(self))
+        for name in self.fields() + ('extra',):
+            setattr(copy, name, changes.pop(name, getattr(self, name)))
+        if changes:
+            raise TypeError("Unknown %s fields: %s" % (
+                type(self).__name__, ", ".join(sorted(changes))))
+        return copy
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.fields() + ('extra',))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (name, getattr(self, name)) for name in self.fields()
+            if getattr(self, name) is not MISSING))
+
+
+class Address(Record):
+    __slots__ = ('address_lines', 'street', 'city', 'state', 'zip')
+    CONVERTERS = {'address_lines': LIST_FIELD}
+
+
+class Contact(Record):
+    """A named contact, e.g. a public liaison"""
+    __slots__ = ('name', 'phone')
+    CONVERTERS = {'phone': LIST_FIELD}
+
+
+class Department(Record):
+    __slots__ = ('name', 'abbreviation', 'description', 'top_level',
+                 'keywords', 'common_requests', 'no_records_about',
+                 'address', 'phone', 'fax', 'emails', 'website',
+                 'request_form', 'public_liaison', 'service_center',
+                 'foia_officer', 'misc', 'notes', 'reading_rooms',
+                 'request_time_stats', 'usa_id')
+    CONVERTERS = {
+        'keywords': LIST_FIELD,
+        'common_requests': LIST_FIELD,
+        'no_records_about': LIST_FIELD,
+        'emails': LIST_FIELD,
+        'reading_rooms': LIST_FIELD,
+        'address': record_field(Address),
+        'public_liaison': record_field(Contact),
+        'service_center': record_field(Contact),
+        'foia_officer': record_field(Contact),
+        'misc': record_dict_field(Contact),
+        'request_time_stats': DICT_FIELD,
+    }
+
+
+class Agency(Department):
+    """An agency has the fields of a department (which describe its top
+    level office) plus its departments"""
+    __slots__ = ('departments',)
+    CONVERTERS = dict(Department.CONVERTERS,
+                      departments=record_list_field(Department))
+
+    def department(self, name):
+        for dept in self.departments or ():
+            if isinstance(dept, Department) and dept.name == name:
+                return dept
+
+    def replace_department(self, name, **changes):
+        """A copy with the named department's fields changed. Only that
+        department and the agency itself are copied"""
+        departments = tuple(
+            dept.replace(**changes)
+            if isinstance(dept, Department) and dept.name == name else dept
+            for dept in self.departments or ())
+        return self.replace(departments=departments)
+
+    def share(self, old):
+        """This agency, reusing old or those of old's departments that are
+        equal to its own, so that an update keeps one copy of what it didn't
+        change"""
+        if self == old:
+            return old
+        if not isinstance(self.departments, tuple) \
+                or not isinstance(old.departments, tuple):
+            return self
+        old_departments = dict((dept.name, dept) for dept in old.departments
+                               if isinstance(dept, Department))
+        departments = tuple(
+            old_departments[dept.name]
+            if isinstance(dept, Department)
+            and old_departments.get(dept.name) == dept else dept
+            for dept in self.departments)
+        return self.replace(departments=departments)
+
+
+class AgencyRecords(MutableMapping):
+    """An abbreviation -> data mapping, like dataset.load_all's, which holds
+    Agency records. Reading an agency gives a new dict; assigning a dict
+    stores it as a record again, sharing what is unchanged. Changes to a dict
+    that isn't assigned back are lost"""
+
+    def __init__(self, agencies=()):
+        self.records = OrderedDict()
+        self.update(agencies)
+
+    def __getitem__(self, abbr):
+        return self.records[abbr].to_dict()
+
+    def __setitem__(self, abbr, data):
+        agency = data if isinstance(data, Agency) else Agency.from_dict(data)
+        if abbr in self.records:
+            agency = agency.share(self.records[abbr])
+        self.records[abbr] = agency
+
+    def __delitem__(self, abbr):
+        del self.records[abbr]
+
+    def __contains__(self, abbr):
+        return abbr in self.records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def record(self, abbr):
+        return self.records[abbr]
+
+
+def load_all(directory=dataset.DATA_DIRECTORY):
+    """dataset.load_all, as Agency records"""
+    return AgencyRecords(dataset.load_all(directory))
+
+
+def to_dicts(agencies):
+    """Agency records back to the abbreviation -> data mapping that
+    dataset.save_all writes"""
+    if isinstance(agencies, AgencyRecords):
+        agencies = agencies.records
+    return OrderedDict((abbr, agency.to_dict())
+                       for abbr, agency in agencies.items())
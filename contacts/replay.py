@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""Record the HTTP traffic of a real run, then replay it offline, so the whole
+pipeline can be timed without depending on (or hammering) foia.gov,
+federalregister.gov and usa.gov. Both work at the transport level:
+http_client mounts a RecordingAdapter or a ReplayAdapter in place of the
+usual one when the environment asks for it, so every fetcher is covered
+without changes.
+
+    # capture every exchange of a real run into captures/
+    python replay.py record -- python pipeline.py
+
+    # run it again from captures/, with 50ms added to every request, and
+    # report the wall time of each of 3 runs
+    python replay.py bench --latency 0.05 --repeat 3 -- python pipeline.py
+
+Captures are JSON lines, one exchange per line. Requests are matched on
+method and URL, ignoring cache-busting parameters. A request with no capture
+fails as if the network were down."""
+
+import argparse
+import base64
+from collections import OrderedDict
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from timeit import default_timer
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import cache
+
+
+CAPTURES_DIRECTORY = 'captures'
+RECORD_ENV = 'CONTACTS_HTTP_RECORD'
+REPLAY_ENV = 'CONTACTS_HTTP_REPLAY'
+LATENCY_ENV = 'CONTACTS_HTTP_LATENCY'
+
+# Query parameters which change on every request (scraper.agency_url)
+IGNORED_PARAMS = ('Random',)
+# Describe how the body was sent, not the (already decoded) body we keep
+DROPPED_HEADERS = ('Content-Encoding', 'Content-Length', 'Transfer-Encoding')
+
+
+def capture_key(method, url):
+    """Method and URL, with the query sorted and cache busters removed"""
+    parts = urlsplit(url)
+    query = sorted((name, value) for name, value in parse_qsl(
+        parts.query, keep_blank_values=True) if name not in IGNORED_PARAMS)
+    return '%s %s' % (method.upper(), urlunsplit(
+        parts._replace(query=urlencode(query), fragment='')))
+
+
+def capture(request, response):
+    """An exchange as JSON-compatible data"""
+    headers = OrderedDict((name, value)
+                          for name, value in sorted(response.headers.items())
+                          if name not in DROPPED_HEADERS)
+    return {'key': capture_key(request.method, request.url),
+            'url': request.url, 'status_code': response.status_code,
+            'reason': response.reason, 'headers': headers,
+            'body': base64.b64encode(response.content).decode('ascii')}
+
+
+def load_captures(directory=CAPTURES_DIRECTORY):
+    """key -> exchange for every capture file in directory. Later
+    exchanges for the same request win"""
+    captures = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.jsonl'):
+            continue
+        with open(os.path.join(directory, name), 'r') as f:
+            for line in f:
+                if line.strip():
+                    exchange = json.loads(line)
+                    captures[exchange['key']] = exchange
+    return captures
+
+
+class RecordingAdapter(HTTPAdapter):
+    """The usual adapter, appending every exchange to a capture file. Each
+    process gets its own file, so worker processes don't interleave"""
+
+    def __init__(self, directory=CAPTURES_DIRECTORY, **kwargs):
+        super(RecordingAdapter, self).__init__(**kwargs)
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        response = super(RecordingAdapter, self).send(request, **kwargs)
+        line = json.dumps(capture(request, response)) + '\n'
+        os.makedirs(self.directory, exist_ok=True)
+        filename = os.path.join(self.directory, '%s.jsonl' % os.getpid())
+        with self.lock:
+            with open(filename, 'a') as f:
+                f.write(line)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Serves captured exchanges instead of going to the network, after
+    `latency` seconds. Conditional requests matching the captured ETag get
+    a 304, as the server would have sent"""
+
+    def __init__(self, directory=CAPTURES_DIRECTORY, latency=0.0,
+                 captures=None):
+        super(ReplayAdapter, self).__init__()
+        self.captures = (load_captures(directory) if captures is None
+                         else captures)
+        self.latency = latency
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        if self.latency:
+            time.sleep(self.latency)
+        exchange = self.captures.get(capture_key(request.method, request.url))
+        if exchange is None:
+            raise requests.ConnectionError(
+                "No capture for %s %s" % (request.method, request.url),
+                request=request)
+
+        headers = CaseInsensitiveDict(exchange['headers'])
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        etag = headers.get('ETag')
+        if etag and request.headers.get('If-None-Match') == etag:
+            response.status_code, response.reason = 304, 'Not Modified'
+            response._content = b''
+        else:
+            response.status_code = exchange['status_code']
+            response.reason = exchange['reason']
+            response._content = base64.b64decode(exchange['body'])
+        return response
+
+    def close(self):
+        pass
+
+
+def adapter_from_environment(**kwargs):
+    """A replaying or recording adapter if the environment asks for one,
+    otherwise None. kwargs are passed on to HTTPAdapter when recording"""
+    if os.environ.get(REPLAY_ENV):
+        latency = float(os.environ.get(LATENCY_ENV) or 0)
+        return ReplayAdapter(os.environ[REPLAY_ENV], latency)
+    if os.environ.get(RECORD_ENV):
+        return RecordingAdapter(os.environ[RECORD_ENV], **kwargs)
+
+
+def run(command, env):
+    """Run command with env added to the environment; returns its wall
+    time"""
+    start = default_timer()
+    subprocess.check_call(command, env=dict(os.environ, **env))
+    return default_timer() - start
+
+
+def record(command, directory=CAPTURES_DIRECTORY):
+    """Run command against the network, capturing every exchange. The run
+    gets an empty HTTP cache, so that everything it needs is fetched"""
+    cache_dir = tempfile.mkdtemp(prefix='contacts-cache-')
+    try:
+        return run(command, {RECORD_ENV: os.path.abspath(directory),
+                             cache.CACHE_ENV: cache_dir})
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def bench(command, directory=CAPTURES_DIRECTORY, latency=0.0, repeat=1,
+          warm=False):
+    """Run command `repeat` times against the captures. Unless warm is set,
+    each run starts with an empty HTTP cache. Returns the wall times"""
+    cache_dir = tempfile.mkdtemp(prefix='contacts-cache-')
+    env = {REPLAY_ENV: os.path.abspath(directory),
+           LATENCY_ENV: str(latency), cache.CACHE_ENV: cache_dir}
+    times = []
+    try:
+        for _ in range(repeat):
+            if not warm:
+                shutil.rmtree(cache_dir)
+                os.mkdir(cache_dir)
+            seconds = run(command, env)
+            logging.info("Run took %.2fs", seconds)
+            times.append(seconds)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return times
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Record or replay the HTTP traffic of a command.',
+        usage='%(prog)s {record,bench} [options] -- command ...')
+    parser.add_argument('mode', choices=['record', 'bench'])
+    parser.add_argument('--captures', default=CAPTURES_DIRECTORY,
+                        help='Directory of capture files.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to every replayed request.')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of replayed runs.')
+    parser.add_argument('--warm', action='store_true',
+                        help='Keep the HTTP cache between replayed runs.')
+    argv, command = sys.argv[1:], []
+    if '--' in argv:
+        argv, command = argv[:argv.index('--')], argv[argv.index('--') + 1:]
+    args = parser.parse_args(argv)
+    if not command:
+        parser.error('no command given')
+
+    if args.mode == 'record':
+        seconds = record(command, args.captures)
+        logging.info("Recorded into %s in %.2fs", args.captures, seconds)
+        sys.exit(0)
+
+    times = sorted(bench(command, args.captures, args.latency, args.repeat,
+                         args.warm))
+    print("runs: %d  min: %.2fs  median: %.2fs  max: %.2fs" % (
+        len(times), times[0], times[len(times) // 2], times[-1]))
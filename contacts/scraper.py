@@ -1,17 +1,29 @@
 #!/usr/bin/env python
 
+import argparse
+from concurrent.futures import (as_completed, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from functools import lru_cache
+import hashlib
 from itertools import takewhile
+import json
 import logging
 import os
 from random import randint
 import re
-import sys
+from timeit import default_timer
 from urllib.parse import urlencode
-from urllib.request import urlopen
 
 from bs4 import BeautifulSoup
-import yaml
-
+import requests
+
+import cache
+import dataset
+from http_client import HostRateLimiter
+import manual_data
+import metrics
+from phones import (clean_phone_number, extract_numbers, match_phone,
+                    scan_phone)
 import typos
 
 
@@ -139,19 +151,38 @@ AGENCIES = [
     'VA',
 ]
 
-PHONE_RE = re.compile(
-    r"""(?P<prefix>\+?[\d\s\(\)\-]*)"""
-    r"""(?P<area_code>\(?\d{3}\)?[\s\-\(\)]*)"""
-    r"""(?P<first_three>\d{3}[\-\s\(\)]*)"""
-    r"""(?P<last_four>\d{4}[\-\s]*)"""
-    r"""(?P<extension>[\s\(,]*?ext[ .]*?\d{3,5})?"""
-    r"""(?P<tty>\s*\(tty)?""", re.IGNORECASE)
+# Minimum number of seconds between two downloads from the same host when
+# fetching agencies concurrently
+DOWNLOAD_INTERVAL = 0.25
+
+MANIFEST_FILENAME = os.path.join('html', 'manifest.json')
+
+# BeautifulSoup tree builder used for agency pages. 'lxml' is considerably
+# faster on the large agency pages; compare_parsers.py checks that both
+# produce the same data
+HTML_PARSER = 'html.parser'
+
+# The code that turns a page into agency data. A change to any of it (or to
+# the tree builder) means every agency has to be parsed again
+PARSE_SOURCES = tuple(os.path.abspath(os.path.join(
+    os.path.dirname(__file__), name))
+    for name in ('scraper.py', 'phones.py', 'typos.py'))
 
+# Like PHONE_RE, this backtracks quadratically on long lines; match_address
+# reproduces it in linear time and this is kept as its reference
 ADDY_RE = re.compile(
     r"""(?P<city>.*)"""
     r"""[\s]*?,[\s]*?(?P<state>[A-Z\.]{2,4})"""
     r"""\s*(?P<zip>[0-9-]+)""")
 
+STATE_ZIP_RE = re.compile(
+    r"""\s*(?P<state>[A-Z\.]{2,4})\s*(?P<zip>[0-9-]+)""")
+
+
+def make_soup(text, parser=None):
+    """Build the document tree for an agency page"""
+    return BeautifulSoup(text, parser or HTML_PARSER)
+
 
 def agency_description(doc):
     """Account for BRs and such while finding the description."""
@@ -169,6 +200,28 @@ def agency_description(doc):
     return description.strip()
 
 
+def match_address(line):
+    """Linear time equivalent of ADDY_RE.match, returning (city, state, zip)
+    or None. The city is greedy, so try commas from the right. It can't span
+    a line break, though a comma following the break (and only whitespace)
+    is still reachable"""
+    city_end = line.find('\n')
+    if city_end == -1:
+        city_end = search_end = len(line)
+    else:
+        search_end = city_end
+        after_break = len(line) - len(line[city_end:].lstrip())
+        if line.startswith(',', after_break):
+            search_end = after_break + 1
+    comma = line.rfind(',', 0, search_end)
+    while comma != -1:
+        match = STATE_ZIP_RE.match(line, comma + 1)
+        if match:
+            return (line[:min(comma, city_end)], match.group('state'),
+                    match.group('zip'))
+        comma = line.rfind(',', 0, comma)
+
+
 def clean_paragraphs(doc):
     """Find all paragraphs with content. Return paragraph els + content
     strings. Beautiful Soup doesn't handle unclosed tags very graciously, so
@@ -185,36 +238,6 @@ def clean_paragraphs(doc):
     return lines, ps
 
 
-def clean_phone_number(line):
-    """
-    Given "(123) 456-7890 (Telephone)", extract the number and format
-    """
-    match = PHONE_RE.search(line)
-    if match:
-        # kill all non-numbers
-        prefix = "".join(ch for ch in match.group("prefix") if ch.isdigit())
-        area_code = "".join(ch for ch in match.group("area_code")
-                            if ch.isdigit())
-        first_three = "".join(ch for ch in match.group("first_three")
-                              if ch.isdigit())
-        last_four = "".join(ch for ch in match.group("last_four")
-                            if ch.isdigit())
-        number = "-".join([area_code, first_three, last_four])
-        if prefix:
-            number = "+" + prefix + " " + number
-        extension = match.group("extension")
-        if extension:
-            extension = re.sub("\D", "", extension)
-            number = number + " x" + extension
-        if match.group("tty"):
-            number += " (TTY)"
-        return number
-
-    else:
-        raise Exception("Error extracting phone number",
-                        "phone line: " + line)
-
-
 def address_list_to_dict(address_list):
     """
     Converts a list containing address elements into a dictionary
@@ -238,11 +261,12 @@ def address_list_to_dict(address_list):
     if len(address_list) > 2:
         address_dict['address_lines'] = address_list[0:-2]
 
-    match = ADDY_RE.match(address_list[-1])
+    match = match_address(address_list[-1])
     if match:
-        address_dict['zip'] = match.group('zip').strip()
-        address_dict['state'] = re.sub("\W", "", match.group('state'))
-        address_dict['city'] = match.group('city').strip()
+        city, state, zip_code = match
+        address_dict['zip'] = zip_code.strip()
+        address_dict['state'] = re.sub("\W", "", state)
+        address_dict['city'] = city.strip()
 
     if re.search('\d', address_dict['street']) \
             and address_dict.get('zip') \
@@ -262,7 +286,7 @@ def split_address_from(lines):
     for line in lines:
         if remaining:   # already switched over
             remaining.append(line)
-        elif PHONE_RE.search(line) and any(q in line.lower() for q in cues):
+        elif scan_phone(line) and any(q in line.lower() for q in cues):
             remaining.append(line)
         elif re.match('Website:', line):
             remaining.append(line)
@@ -292,21 +316,6 @@ def find_emails(lines, ps):
     return emails
 
 
-def extract_numbers(phones):
-    """
-    Extracts all phone numbers from a line and adds them to a list
-    """
-
-    clean_numbers = []
-    phones = re.sub('[,\s(]+ext', ' ext', phones)
-    phones = phones.split(",")
-    for phone in phones:
-        phone = phone.strip()
-        if PHONE_RE.match(phone):
-            clean_numbers.append(clean_phone_number(phone))
-    return clean_numbers
-
-
 def organize_contact(contact_info):
     """
     Organize contact info into a dictionary to facilitate extraction
@@ -382,7 +391,7 @@ def parse_department(elem, name):
         if ('phone' in lower and 'public liaison' not in lower
                 and 'service center' not in lower and 'phone' not in data):
             data['phone'] = clean_phone_number(line)
-        elif 'fax' in lower and 'fax' not in data and PHONE_RE.match(line):
+        elif 'fax' in lower and 'fax' not in data and match_phone(line):
             data['fax'] = clean_phone_number(line)
     emails = find_emails(lines, ps)
     if emails:
@@ -404,6 +413,15 @@ def parse_department(elem, name):
     return data
 
 
+def element_index(doc):
+    """Map each id to the first element carrying it, in a single pass over
+    the tree"""
+    by_id = {}
+    for elem in doc(id=True):
+        by_id.setdefault(elem['id'], elem)
+    return by_id
+
+
 def parse_agency(abb, doc):
     """Make sense of a block of HTML from FOIA.gov"""
     agency_name = doc.h1.text.strip()
@@ -412,9 +430,10 @@ def parse_agency(abb, doc):
     # get each dept id and name, parse department from its div. Skip the first
     # as it is always a 'please select'
     departments = []
+    by_id = element_index(doc)
     for option in doc("option")[1:]:
         opt_id = option['value']
-        elem = doc(id=opt_id)[0]
+        elem = by_id[opt_id]
         # Needed to replace the ? with - in order to
         # accomate Carlsbad Field Office
         dept_name = option.string.strip().replace('?', '–')
@@ -435,72 +454,31 @@ def fix_known_typos(text):
 
 
 def agency_yaml_filename(data_directory, agency_abbr):
-    return os.path.join(data_directory, '%s.yaml' % agency_abbr)
+    return dataset.agency_filename(data_directory, agency_abbr)
 
 
 def read_manual_data(agency_abbr, manual_data_dir='manual_data'):
-    if os.path.isdir(manual_data_dir):
-        filename = agency_yaml_filename(manual_data_dir, agency_abbr)
-        if os.path.exists(filename):
-            with open(filename, 'r') as yaml_file:
-                manual_data = yaml.load(yaml_file)
-            return manual_data
-
-
-def update_list_in_dict(data, field, new_values_list):
-    original_values = set(data.get(field, []))
-    data[field] = sorted(list(original_values | set(new_values_list)))
-
-
-def update_non_departments(agency_data, manual_data):
-    """ Apply all the non-department changes from manual_data to agency_data.
-    """
-
-    agency_data = dict(agency_data)
+    overrides = manual_data.lookup(agency_abbr, manual_data_dir)
+    if overrides:
+        return overrides.data
 
-    list_fields = ['common_requests', 'keywords']
 
-    for field in manual_data.keys():
-        if field not in list_fields + ['departments']:
-            agency_data[field] = manual_data[field]
-
-    for field in list_fields:
-        if field in manual_data and field not in ['departments']:
-            update_list_in_dict(agency_data, field, manual_data[field])
-    return agency_data
-
-
-def actual_apply(agency_data, manual_data):
-    """ Actually apply the changes in manual_data to agency_data. This handles
-    the departments. """
-
-    agency_data = update_non_departments(agency_data, manual_data)
-    manual_depts = {}
-    if 'departments' in manual_data:
-        for dept in manual_data['departments']:
-            manual_depts[dept['name']] = dept
-
-        departments = []
-        if 'departments' in agency_data:
-            for dept in agency_data['departments']:
-                if dept['name'] in manual_depts:
-                    new_department = update_non_departments(
-                        dept, manual_depts[dept['name']])
-                else:
-                    new_department = dict(dept)
-                departments.append(new_department)
-            agency_data['departments'] = departments
+def actual_apply(agency_data, agency_manual_data):
+    """ Actually apply the changes in agency_manual_data to agency_data. This
+    handles the departments. """
+    agency_data, _ = manual_data.merge(
+        agency_data, manual_data.overrides_from(agency_manual_data))
     return agency_data
 
 
 def apply_manual_data(agency_abbr, agency_data):
     """ In the manual data directory, we have all the manual over-rides for
     various contact fields. Apply those here. """
-    manual_data = read_manual_data(agency_abbr)
-    if manual_data:
-        return actual_apply(agency_data, manual_data)
-    else:
-        return agency_data
+    agency_data, unmatched = manual_data.apply(agency_abbr, agency_data)
+    for name in unmatched:
+        logging.warning("[%s] Manual data matches no department: %s",
+                        agency_abbr, name)
+    return agency_data
 
 
 def get_unknown_office_details(agency_data):
@@ -526,54 +504,294 @@ def populate_parent(agency_data):
     return agency_data
 
 
-def save_agency(abb):
-    """For a given agency, download (if not already present) their HTML,
-    process it, and save the resulting YAML"""
+def agency_html_filename(abb):
+    return os.path.join('html', '%s.html' % abb)
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def load_manifest(filename=MANIFEST_FILENAME):
+    """The manifest records, per agency, hashes of the inputs and output of
+    the last parse"""
+    if os.path.isfile(filename):
+        with open(filename, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest, filename=MANIFEST_FILENAME):
+    with open(filename, 'w') as f:
+        json.dump(manifest, f, sort_keys=True, indent=2)
+
+
+def write_agency_html(abb, body):
+    """Save the agency's HTML for parsing, unless it is unchanged. Returns
+    True if the file was written"""
+    html_path = agency_html_filename(abb)
+    if os.path.isfile(html_path):
+        with open(html_path, 'r', encoding='utf8') as f:
+            if f.read() == body:
+                return False
+    with open(html_path, 'w', encoding='utf8') as f:
+        f.write(body)
+    metrics.file_written()
+    return True
+
+
+def fetch_agency(abb, rate_limiter=None, max_age=None):
+    """Bring the agency's HTML up to date from the HTTP cache, which only
+    goes to foia.gov once its copy is older than max_age seconds (by
+    default, the cache's TTL for agency pages). Returns True if there is
+    HTML to parse"""
     os.makedirs('html', exist_ok=True)
-    html_path = "html" + os.sep + "%s.html" % abb
-    if not os.path.isfile(html_path):
-        try:
-            body = download_agency(abb)
-        except AssertionError:
-            # Ignore any download errors for a single agency and continue on
-            body = None
-
-        if body:
-            with open(html_path, 'w', encoding='utf8') as f:
-                f.write(body)
+    html_path = agency_html_filename(abb)
+    try:
+        body = download_agency(abb, rate_limiter, max_age)
+    except (AssertionError, requests.RequestException):
+        # Ignore any download errors for a single agency and continue on
+        body = None
+
+    if body:
+        if write_agency_html(abb, body):
             logging.info("[%s] Downloaded.", abb)
         else:
-            logging.warning("[%s] DID NOT DOWNLOAD, NO.", abb)
-            return
+            logging.info("[%s] Already downloaded.", abb)
+        return True
+    elif os.path.isfile(html_path):
+        logging.warning("[%s] DID NOT REFRESH, using cached copy.", abb)
+        return True
     else:
-        logging.info("[%s] Already downloaded.", abb)
-
-    with open(html_path, 'r', encoding='utf8') as f:
-        text = f.read()
+        logging.warning("[%s] DID NOT DOWNLOAD, NO.", abb)
+        return False
+
+
+def manual_data_hash(agency_abbr, manual_data_dir='manual_data'):
+    overrides = manual_data.lookup(agency_abbr, manual_data_dir)
+    if overrides:
+        return overrides.hash
+
+
+def read_agency_html(abb):
+    with open(agency_html_filename(abb), 'r', encoding='utf8') as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def parser_hash(parser=None):
+    """Identifies the parsing code and tree builder"""
+    digest = hashlib.sha1((parser or HTML_PARSER).encode('utf8'))
+    for path in PARSE_SOURCES:
+        with open(path, 'rb') as f:
+            digest.update(b'\0' + f.read())
+    return digest.hexdigest()
+
+
+def yaml_hash(abb, data_directory='data'):
+    """content_hash of the agency's YAML, or None if there is none"""
+    filename = agency_yaml_filename(data_directory, abb)
+    if os.path.isfile(filename):
+        with open(filename, 'r', encoding='utf8') as f:
+            return content_hash(f.read())
+
+
+def inputs_unchanged(abb, text, manifest, parser=None):
+    """True if neither the HTML, the agency's manual data nor the parser
+    changed since the YAML was last written, and the YAML is still what was
+    written"""
+    entry = manifest.get(abb, {})
+    return (entry.get('html_hash') == content_hash(text)
+            and entry.get('manual_hash') == manual_data_hash(abb)
+            and entry.get('parser_hash') == parser_hash(parser)
+            and entry.get('parse_hash') is not None
+            and entry.get('parse_hash') == yaml_hash(abb))
+
+
+def plain_strings(value):
+    """value with any BeautifulSoup strings (which keep their whole document
+    alive, and can't be dumped as YAML) turned into plain str"""
+    if isinstance(value, dict):
+        return dict((key, plain_strings(child))
+                    for key, child in value.items())
+    if isinstance(value, list):
+        return [plain_strings(child) for child in value]
+    if isinstance(value, tuple):
+        return tuple(plain_strings(child) for child in value)
+    if isinstance(value, str) and type(value) is not str:
+        return str(value)
+    return value
+
+
+def parse_agency_html(abb, text, parser=None):
+    """The whole parse stage for one agency: HTML in, agency data out. This
+    doesn't touch data/, so it can run in a worker process"""
     text = fix_known_typos(text)
-    data = parse_agency(abb, BeautifulSoup(text, 'html.parser'))
+    data = plain_strings(parse_agency(abb, make_soup(text, parser)))
     data = populate_parent(data)
-    data = apply_manual_data(abb, data)
-    save_agency_data(abb, data)
+    return apply_manual_data(abb, data)
+
+
+def timed_parse_agency_html(abb, text, parser=None):
+    """parse_agency_html, plus how long it took. Worker processes can't
+    record metrics for the main process, so they return the time instead"""
+    start = default_timer()
+    data = parse_agency_html(abb, text, parser)
+    return data, default_timer() - start
+
+
+def remember_parse(abb, text, dumped, manifest, parser=None):
+    """Note in the manifest what the agency's YAML was parsed from"""
+    manifest.setdefault(abb, {}).update(
+        html_hash=content_hash(text), manual_hash=manual_data_hash(abb),
+        parser_hash=parser_hash(parser), parse_hash=content_hash(dumped))
+
+
+def remember_saved(manifest, abbs, data_directory='data'):
+    """Note the YAML as saved after later stages added to it, so that it
+    doesn't count as changed"""
+    for abb in abbs:
+        if abb in manifest:
+            manifest[abb]['parse_hash'] = yaml_hash(abb, data_directory)
+
+
+def record_agency_data(abb, text, data, manifest, parser=None):
+    """Save the parsed agency and remember what it was parsed from"""
+    dumped = save_agency_data(abb, data)
+    if dumped:
+        remember_parse(abb, text, dumped, manifest, parser)
+
+
+def process_agency(abb, manifest=None, force=False, parser=None):
+    """Parse the agency's downloaded HTML and save the resulting YAML. If
+    neither the HTML nor the agency's manual data changed since the last
+    parse, the existing YAML is left alone"""
+    if manifest is None:
+        manifest = {}
+    text = read_agency_html(abb)
+    if not force and inputs_unchanged(abb, text, manifest, parser):
+        logging.info("[%s] Unchanged, skipping parse.", abb)
+        return
+    with metrics.timed_parse(abb):
+        data = parse_agency_html(abb, text, parser)
+    record_agency_data(abb, text, data, manifest, parser)
+
+
+def parse_agencies(pages, workers, parser=None):
+    """Fan parse_agency_html out over a pool of processes. `pages` is a list
+    of (abbreviation, html) pairs; (abbreviation, html, data) triples are
+    yielded as the parses finish"""
+    if workers <= 1:
+        for abb, text in pages:
+            with metrics.timed_parse(abb):
+                data = parse_agency_html(abb, text, parser)
+            yield abb, text, data
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(timed_parse_agency_html, abb, text, parser):
+                   (abb, text) for abb, text in pages}
+        for future in as_completed(futures):
+            abb, text = futures[future]
+            data, seconds = future.result()
+            metrics.record_parse(abb, seconds)
+            yield abb, text, data
+
+
+def save_agency(abb, max_age=None, force=False, parser=None):
+    """For a given agency, download (if not already present) their HTML,
+    process it, and save the resulting YAML"""
+    manual_data.refresh()
+    manifest = load_manifest()
+    if fetch_agency(abb, max_age=max_age):
+        process_agency(abb, manifest, force, parser)
+    save_manifest(manifest)
 
 
 def save_agency_data(agency_abbr, data, data_directory='data'):
-    """ Actually do the save. """
+    """ Actually do the save. Returns the YAML that was written. """
     os.makedirs(data_directory, exist_ok=True)
 
     if data:
-        with open(data_directory + os.sep + "%s.yaml" % agency_abbr, 'w') as f:
-            f.write(yaml.dump(data, default_flow_style=False,
-                    allow_unicode=True))
-            logging.info("[%s] Parsed.", agency_abbr)
+        dumped = dataset.save_agency(agency_abbr, data, data_directory)
+        logging.info("[%s] Parsed.", agency_abbr)
+        return dumped
     else:
         logging.warning("[%s] DID NOT PARSE, NO.", agency_abbr)
 
 
-def save_agencies():
-    """Save all agencies"""
-    for agency in AGENCIES:
-        save_agency(agency)
+def fetch_agencies(workers, interval, max_age):
+    """Yield the abbreviation of each agency with HTML to parse, as soon as
+    it is available. With more than one worker, downloads run in a thread
+    pool, politely spaced per host"""
+    if workers <= 1:
+        for agency in AGENCIES:
+            if fetch_agency(agency, max_age=max_age):
+                yield agency
+        return
+
+    rate_limiter = HostRateLimiter(interval)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_agency, agency, rate_limiter,
+                               max_age): agency
+                   for agency in AGENCIES}
+        for future in as_completed(futures):
+            if future.result():
+                yield futures[future]
+
+
+def save_agencies(workers=1, interval=DOWNLOAD_INTERVAL, max_age=None,
+                  force=False, parser=None, parse_workers=1):
+    """Save all agencies. With a single parse worker each agency is parsed
+    as soon as its HTML arrives; with more, all of the downloaded pages are
+    parsed in a process pool and the results are saved from here"""
+    manual_data.refresh()
+    manifest = load_manifest()
+    fetched = fetch_agencies(workers, interval, max_age)
+    if parse_workers <= 1:
+        for agency in fetched:
+            process_agency(agency, manifest, force, parser)
+    else:
+        pages = []
+        for agency in fetched:
+            text = read_agency_html(agency)
+            if force or not inputs_unchanged(agency, text, manifest,
+                                             parser):
+                pages.append((agency, text))
+            else:
+                logging.info("[%s] Unchanged, skipping parse.", agency)
+        for agency, text, data in parse_agencies(pages, parse_workers,
+                                                 parser):
+            record_agency_data(agency, text, data, manifest, parser)
+    save_manifest(manifest)
+
+
+def scrape_agencies(agencies, manifest, workers=1,
+                    interval=DOWNLOAD_INTERVAL, max_age=None, force=False,
+                    parser=None, parse_workers=1):
+    """In-memory counterpart of save_agencies, for pipeline.py. Agencies in
+    the abbreviation -> data mapping (as returned by dataset.load_all) are
+    replaced when their HTML or manual data changed; nothing is written to
+    data/. What was parsed is noted in manifest, which the caller saves only
+    once the agencies have been written"""
+    manual_data.refresh()
+    pages = []
+    for agency in fetch_agencies(workers, interval, max_age):
+        text = read_agency_html(agency)
+        if force or agency not in agencies \
+                or not inputs_unchanged(agency, text, manifest, parser):
+            pages.append((agency, text))
+        else:
+            logging.info("[%s] Unchanged, skipping parse.", agency)
+    for agency, text, data in parse_agencies(pages, parse_workers, parser):
+        if data:
+            agencies[agency] = data
+            remember_parse(agency, text, dataset.dumps(data), manifest,
+                           parser)
+            logging.info("[%s] Parsed.", agency)
+        else:
+            logging.warning("[%s] DID NOT PARSE, NO.", agency)
+    return agencies
 
 
 def agency_url(abb):
@@ -582,14 +800,24 @@ def agency_url(abb):
     return "https://www.foia.gov/foia/FoiaMakeRequest?" + urlencode(params)
 
 
-def download_agency(abb):
-    """Agency HTML files"""
+def accept_agency_page(response):
+    """Only cache real agency pages, not foia.gov's rejections"""
+    return (response.status_code == 200
+            and b'<title>Request Rejected</title>' not in response.content)
+
+
+def download_agency(abb, rate_limiter=None, max_age=None):
+    """Agency HTML files. The cache is keyed by abbreviation, as the URL
+    changes on every request"""
     url = agency_url(abb)
-    response = urlopen(url)
-    assert response.status == 200, "Unexpected HTTP status."
+    before_request = rate_limiter.wait if rate_limiter else None
+    response = cache.fetch(url, 'foia_agencies', key=abb, max_age=max_age,
+                           before_request=before_request,
+                           accept=accept_agency_page)
+    assert response.status_code == 200, "Unexpected HTTP status."
 
     # No encoding is specified, but at least USDA's National Finance Center is known to contain latin1 encoding
-    body = response.read().decode('latin1')
+    body = response.content.decode('latin1')
     assert not re.search('<title>Request Rejected</title>', body), "Request rejected error."
 
     return body
@@ -601,14 +829,41 @@ if __name__ == "__main__":
         will only scrape and save the data for the provided agency.
 
         python scraper.py will scrape and save data for all the agencies.
+        Use --workers to download several agencies at once.
     """
     logging.basicConfig(level=logging.INFO)
 
-    agency_abbr = None
-    if len(sys.argv) > 1:
-        agency_abbr = sys.argv[1]
-
-    if agency_abbr:
-        save_agency(agency_abbr)
-    else:
-        save_agencies()
+    parser = argparse.ArgumentParser(
+        description='Scrape FOIA contact data from foia.gov.')
+    parser.add_argument('agency', nargs='?',
+                        help='Only process the agency with this abbreviation.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of agencies to download concurrently.')
+    parser.add_argument('--interval', type=float, default=DOWNLOAD_INTERVAL,
+                        help=('Minimum seconds between two requests to the '
+                              'same host when downloading concurrently.'))
+    parser.add_argument('--max-age', type=float, default=None,
+                        help=('Re-download HTML older than this many hours. '
+                              'Defaults to the HTTP cache\'s TTL for agency '
+                              'pages (a week).'))
+    parser.add_argument('--force', action='store_true',
+                        help='Re-parse agencies even if their HTML and '
+                             'manual data are unchanged.')
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help='Number of processes to parse agencies with.')
+    parser.add_argument('--parser', default=HTML_PARSER,
+                        choices=['html.parser', 'lxml'],
+                        help='BeautifulSoup tree builder for agency pages.')
+    args = parser.parse_args()
+
+    max_age = args.max_age * 3600 if args.max_age is not None else None
+    with metrics.stage('scraper'):
+        if args.agency:
+            save_agency(args.agency, max_age=max_age, force=args.force,
+                        parser=args.parser)
+        else:
+            save_agencies(workers=args.workers, interval=args.interval,
+                          max_age=max_age, force=args.force,
+                          parser=args.parser,
+                          parse_workers=args.parse_workers)
+    metrics.write()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""A binary snapshot of the whole contacts dataset, for consumers (explorer.py,
+the hub importer) which would otherwise parse all of data/ on every run.
+pipeline.py writes it after saving the YAML; load_all() returns the snapshot
+while it matches data/, and falls back to the YAML (refreshing the snapshot)
+when it doesn't:
+
+    agencies = snapshot.load_all()
+
+The file holds a small header and then the pickled abbreviation -> data
+mapping. The header carries a schema version and a hash of every YAML file
+the snapshot was built from, so a snapshot of older data, or in an older
+layout, is rejected before its payload is read.
+
+    python snapshot.py    # rebuild data/snapshot.pickle from the YAML
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import pickle
+import time
+
+import dataset
+
+
+# Bump whenever the structure of the payload changes
+SCHEMA_VERSION = 1
+
+SNAPSHOT_FILENAME = 'snapshot.pickle'
+MAGIC = b'FOIA-CONTACTS-SNAPSHOT\n'
+# The header is readable by any Python 3; the payload uses the fastest
+# protocol this Python has
+HEADER_PROTOCOL = 2
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, unreadable or out of date"""
+
+
+def snapshot_filename(directory=dataset.DATA_DIRECTORY):
+    return os.path.join(directory, SNAPSHOT_FILENAME)
+
+
+def source_hash(directory=dataset.DATA_DIRECTORY):
+    """Hash of the name and contents of every agency YAML file. Reading the
+    files is cheap; it's parsing them that the snapshot saves"""
+    digest = hashlib.sha1()
+    for abbr in dataset.agency_abbrs(directory):
+        with open(dataset.agency_filename(directory, abbr), 'rb') as f:
+            content = f.read()
+        digest.update(abbr.encode('utf8') + b'\0')
+        digest.update(hashlib.sha1(content).digest())
+    return digest.hexdigest()
+
+
+def write(agencies, directory=dataset.DATA_DIRECTORY, filename=None):
+    """Snapshot an abbreviation -> data mapping whose YAML is in
+    directory"""
+    filename = filename or snapshot_filename(directory)
+    header = {'schema_version': SCHEMA_VERSION,
+              'source_hash': source_hash(directory),
+              'protocol': pickle.HIGHEST_PROTOCOL,
+              'agencies': len(agencies),
+              'created_at': int(time.time())}
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(MAGIC)
+        pickle.dump(header, f, protocol=HEADER_PROTOCOL)
+        pickle.dump(OrderedDict(sorted(agencies.items())), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filename, filename)
+    return header
+
+
+def read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise SnapshotError("Not a contacts snapshot")
+    try:
+        return pickle.load(f)
+    except Exception as e:
+        raise SnapshotError("Unreadable snapshot header: %s" % e)
+
+
+def load(directory=dataset.DATA_DIRECTORY, filename=None):
+    """The snapshotted abbreviation -> data mapping. Raises SnapshotError
+    unless the snapshot was built, in the current schema, from exactly the
+    YAML now in directory"""
+    filename = filename or snapshot_filename(directory)
+    if not os.path.isfile(filename):
+        raise SnapshotError("No snapshot at %s" % filename)
+    with open(filename, 'rb') as f:
+        header = read_header(f)
+        if header.get('schema_version') != SCHEMA_VERSION:
+            raise SnapshotError("Snapshot schema %s, expected %s" % (
+                header.get('schema_version'), SCHEMA_VERSION))
+        if header.get('protocol', 0) > pickle.HIGHEST_PROTOCOL:
+            raise SnapshotError("Snapshot needs pickle protocol %s" %
+                                header['protocol'])
+        if header.get('source_hash') != source_hash(directory):
+            raise SnapshotError("Snapshot is older than the YAML")
+        try:
+            return pickle.load(f)
+        except Exception as e:
+            raise SnapshotError("Unreadable snapshot: %s" % e)
+
+
+def load_all(directory=dataset.DATA_DIRECTORY, refresh=True):
+    """dataset.load_all, from the snapshot when it's current. Otherwise the
+    YAML is parsed and, if refresh is set, the snapshot is rebuilt"""
+    try:
+        return load(directory)
+    except SnapshotError as e:
+        logging.info("Loading YAML: %s", e)
+    agencies = dataset.load_all(directory)
+    if refresh:
+        try:
+            write(agencies, directory)
+        except OSError as e:
+            logging.warning("Could not write snapshot: %s", e)
+    return agencies
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    header = write(dataset.load_all())
+    logging.info("Snapshot of %s agencies written to %s", header['agencies'],
+                 snapshot_filename())
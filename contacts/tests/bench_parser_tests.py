@@ -0,0 +1,33 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import bench_parser
+import scraper
+from tests.compare_parsers_tests import AGENCY_HTML
+
+
+class BenchParserTests(TestCase):
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3, 10, 9, 8, 7, 6]
+        self.assertEqual(10, bench_parser.percentile(values, 95))
+        self.assertEqual(5, bench_parser.percentile(values, 50))
+        self.assertEqual(1, bench_parser.percentile(values, 0))
+
+    def test_run(self):
+        """Every function should be measured for each cached page"""
+        abb = scraper.AGENCIES[0]
+        with tempfile.TemporaryDirectory() as html_directory:
+            with open(os.path.join(html_directory, abb + '.html'), 'w') as f:
+                f.write(AGENCY_HTML)
+            results = bench_parser.run(repeat=3,
+                                       html_directory=html_directory)
+        self.assertEqual([abb], list(results['agencies']))
+        for name in bench_parser.FUNCTIONS:
+            measured = results['agencies'][abb][name]
+            self.assertEqual(measured, results['totals'][name])
+            self.assertLessEqual(measured['median'], measured['p95'])
+            self.assertGreater(measured['peak_bytes'], 0)
+        self.assertIn('clean_phone_number', bench_parser.report(
+            results, baseline=results))
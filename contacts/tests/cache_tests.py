@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from mock import Mock, patch
+
+import cache
+import metrics
+
+
+def response(content=b'body', status_code=200, headers=None,
+             url='https://www.foia.gov/page'):
+    return Mock(url=url, content=content, status_code=status_code,
+                encoding='utf8', headers=headers or {})
+
+
+class HttpCacheTests(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.client = Mock()
+        self.cache = cache.HttpCache(self.tmpdir.name, self.client,
+                                     ttls={'src': 100})
+        metrics.reset()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        metrics.reset()
+
+    def test_fresh_entries(self):
+        """Fresh entries are served without a request"""
+        self.client.get.return_value = response(b'first')
+        url = 'https://www.foia.gov/page'
+        self.assertEqual('first', self.cache.fetch(url, 'src').text)
+        self.client.get.return_value = response(b'second')
+        cached = self.cache.fetch(url, 'src')
+        self.assertEqual(b'first', cached.content)
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(1, self.client.get.call_count)
+        stage = metrics.snapshot()['stages'][metrics.DEFAULT_STAGE]
+        self.assertEqual(1, stage['cache_hits'])
+        self.assertEqual(1, stage['cache_misses'])
+
+    def test_keys(self):
+        """Params are part of the key, unless a key is given"""
+        self.client.get.return_value = response()
+        url = 'https://www.foia.gov/page'
+        self.cache.fetch(url, 'src', params={'year': 2012})
+        self.cache.fetch(url, 'src', params={'year': 2013})
+        self.assertEqual(2, self.client.get.call_count)
+        self.cache.fetch(url + '?Random=1', 'src', key='ABC')
+        self.cache.fetch(url + '?Random=2', 'src', key='ABC')
+        self.assertEqual(3, self.client.get.call_count)
+
+    @patch('cache.time')
+    def test_revalidation(self, mock_time):
+        """Expired entries are revalidated with their ETag"""
+        mock_time.time.return_value = 1000
+        url = 'https://www.foia.gov/page'
+        self.client.get.return_value = response(
+            b'first', headers={'ETag': '"v1"'})
+        self.cache.fetch(url, 'src')
+
+        mock_time.time.return_value = 1200
+        self.client.get.return_value = response(b'', status_code=304)
+        self.assertEqual(b'first', self.cache.fetch(url, 'src').content)
+        self.assertEqual({'If-None-Match': '"v1"'},
+                         self.client.get.call_args[1]['headers'])
+        stage = metrics.snapshot()['stages'][metrics.DEFAULT_STAGE]
+        self.assertEqual(1, stage['cache_revalidations'])
+
+        # The 304 made the entry fresh again
+        self.cache.fetch(url, 'src')
+        self.assertEqual(2, self.client.get.call_count)
+
+    def test_accept(self):
+        """Rejected responses are returned but not cached"""
+        self.client.get.return_value = response(status_code=500)
+        url = 'https://www.foia.gov/page'
+        self.assertEqual(500, self.cache.fetch(url, 'src').status_code)
+        self.assertIsNone(self.cache.entry('src', url))
+        self.client.get.return_value = response(b'Request Rejected')
+        self.cache.fetch(url, 'src',
+                         accept=lambda r: b'Rejected' not in r.content)
+        self.assertIsNone(self.cache.entry('src', url))
+
+    @patch('cache.time')
+    def test_stats_and_prune(self, mock_time):
+        """Pruning drops expired entries without validators, then the least
+        recently used"""
+        mock_time.time.return_value = 1000
+        for idx, headers in enumerate([{}, {'ETag': 'a'}, {'ETag': 'b'}]):
+            mock_time.time.return_value = 1000 + idx
+            self.client.get.return_value = response(b'x' * 10, headers=headers)
+            self.cache.fetch('https://www.foia.gov/%s' % idx, 'src')
+        self.assertEqual(30, self.cache.size())
+
+        mock_time.time.return_value = 2000
+        self.assertEqual({'src': {'entries': 3, 'bytes': 30, 'expired': 3}},
+                         self.cache.stats())
+        self.assertEqual(2, self.cache.prune(max_bytes=10))
+        self.assertEqual(10, self.cache.size())
+        self.assertIsNotNone(self.cache.entry('src',
+                                              'https://www.foia.gov/2'))
+
+    def test_evicts_over_budget(self):
+        """Storing past max_bytes evicts old entries"""
+        self.cache.max_bytes = 15
+        self.client.get.return_value = response(b'x' * 10)
+        self.cache.fetch('https://www.foia.gov/1', 'src')
+        self.cache.fetch('https://www.foia.gov/2', 'src')
+        self.assertEqual(10, self.cache.size())
+        self.assertEqual(1, self.cache.stats()['src']['entries'])
+
+    def test_missing_body(self):
+        """An entry whose body has gone is fetched again"""
+        url = 'https://www.foia.gov/page'
+        self.client.get.return_value = response(b'first')
+        self.cache.fetch(url, 'src')
+        body_path, _ = self.cache.paths('src', url)
+        os.remove(body_path)
+        self.client.get.return_value = response(b'second')
+        self.assertEqual(b'second', self.cache.fetch(url, 'src').content)
+        self.assertEqual(2, self.client.get.call_count)
+
+    @patch('cache.time')
+    def test_touch_interval(self, mock_time):
+        """Hits only rewrite the metadata once the last use is stale"""
+        mock_time.time.return_value = 1000
+        url = 'https://www.foia.gov/page'
+        self.client.get.return_value = response()
+        self.cache = cache.HttpCache(self.tmpdir.name, self.client,
+                                     ttls={'src': 10 * cache.DAY})
+        self.cache.fetch(url, 'src')
+        with patch.object(self.cache, 'write_entry') as write_entry:
+            mock_time.time.return_value = 1010
+            self.cache.fetch(url, 'src')
+            self.assertFalse(write_entry.called)
+            mock_time.time.return_value = 1000 + cache.TOUCH_INTERVAL
+            self.cache.fetch(url, 'src')
+            self.assertEqual(1, write_entry.call_count)
+
+    def test_concurrent_fetches(self):
+        """Threads storing and evicting at once neither fail nor lose
+        track of the size"""
+        self.cache.max_bytes = 50
+        self.client.get.side_effect = lambda url, **kwargs: response(
+            b'x' * 10, url=url)
+        urls = ['https://www.foia.gov/%s' % (idx % 12) for idx in range(200)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for result in pool.map(lambda url: self.cache.fetch(url, 'src'),
+                                   urls):
+                self.assertEqual(b'x' * 10, result.content)
+        on_disk = sum(entry['size'] for _, _, entry in self.cache.entries())
+        self.assertEqual(on_disk, self.cache.size())
+        self.assertLessEqual(on_disk, 50)
+
+    def test_client_for(self):
+        self.client.get.return_value = response(b'{"results": []}')
+        client = self.cache.client_for('src')
+        result = client.get('https://www.foia.gov/api', params=[('a', 1)])
+        self.assertEqual({'results': []}, result.json())
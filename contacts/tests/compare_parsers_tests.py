@@ -0,0 +1,73 @@
+from unittest import skipUnless, TestCase
+
+import compare_parsers
+
+try:
+    import lxml     # noqa
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+
+# Agency pages laid out like foia.gov's, as scraper.py caches them in html/
+FIXTURE_HTML = 'tests/fixtures/html'
+
+AGENCY_HTML = """<h1><a></a>An Agency</h1>
+    <h2><label for="ComponentsList">I want to:</label></h2>
+    <select id="ComponentsList">
+      <option value="0">Select an Office</option>
+      <option value="1">Headquarters</option>
+      <option value="2">I don't know which office</option>
+    </select>
+    <div id="0">Div Zero</div>
+    <div id="1"><blockquote>
+      <p><strong>FOIA Contact:</strong> send to:</p>
+      <p>Jane Smith</p>
+      <p>1 congress street</p>
+      <p>Washington, DC 20505</p>
+      <p>(555) 111-2222 (Telephone)</p>
+      <p><strong>FOIA Public Liaison:</strong>
+          Mark Someone, Phone: (555) 444-5555
+      <p><strong>Website: </strong>
+          <a href="http://www.foia.example.gov/">foia.example.gov</a>
+      </p></blockquote></div>
+    <div id="2"><blockquote>
+      <p><strong>FOIA Contact:</strong> send to:</p>
+      <p>2 congress street</p>
+      <p>Washington, DC 20505</p>
+      <p>(555) 999-8888 (Telephone)</p>
+      </blockquote></div>
+    <h2>About the this agency</h2>Some<br>Description"""
+
+
+class CompareParsersTests(TestCase):
+
+    def test_differences(self):
+        """Differences should be reported by path"""
+        expected = {'name': 'A', 'departments': [{'name': 'B'}]}
+        self.assertEqual([], compare_parsers.differences(expected, expected))
+        actual = {'name': 'A', 'departments': [{'name': 'C'}], 'x': 1}
+        self.assertEqual(
+            ['/departments[0]/name', '/x'],
+            compare_parsers.differences(expected, actual))
+        self.assertEqual(
+            ['/departments'],
+            compare_parsers.differences(expected, {'name': 'A',
+                                                   'departments': []}))
+
+    @skipUnless(HAS_LXML, "lxml is not installed")
+    def test_backends_agree(self):
+        """Both backends should produce the same agency"""
+        expected = compare_parsers.parse_with(
+            'AAA', AGENCY_HTML, 'html.parser')
+        self.assertEqual(1, len(expected['departments']))
+        self.assertEqual(
+            expected, compare_parsers.parse_with('AAA', AGENCY_HTML, 'lxml'))
+
+    @skipUnless(HAS_LXML, "lxml is not installed")
+    def test_backends_agree_on_cached_pages(self):
+        """Both backends should agree on every agency page in the fixture
+        corpus"""
+        self.assertEqual(2, len(list(
+            compare_parsers.cached_agency_pages(FIXTURE_HTML))))
+        self.assertEqual({}, compare_parsers.compare_parsers(FIXTURE_HTML))
@@ -0,0 +1,107 @@
+import glob
+import gzip
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from mock import patch
+
+import convert_to_json
+import dataset
+
+
+AGENCIES = {
+    'AAA': {'abbreviation': 'AAA', 'name': 'Agency A', 'departments': []},
+    'BBB': {'abbreviation': 'BBB', 'name': 'Agency B',
+            'departments': [{'name': 'Office', 'top_level': True}]},
+}
+
+
+class ConvertToJsonTests(TestCase):
+
+    def read(self, directory, filename):
+        with open(os.path.join(directory, filename), 'rb') as f:
+            return f.read()
+
+    def test_export_directory(self):
+        """Each agency gets a pretty-printed file, and all agencies are
+        bundled, as JSON and NDJSON, plain and gzipped"""
+        with TemporaryDirectory() as directory:
+            dataset.save_all(AGENCIES, directory)
+            exported = convert_to_json.export_directory(directory)
+            bundles = os.path.join(directory, 'bundles')
+
+            self.assertEqual(AGENCIES, exported)
+            # Only agencies match data/*.json
+            self.assertEqual(['AAA.json', 'BBB.json'], sorted(
+                os.path.basename(name) for name in
+                glob.glob(os.path.join(directory, '*.json'))))
+            self.assertEqual(
+                json.dumps(AGENCIES['BBB'], sort_keys=True, indent=2),
+                self.read(directory, 'BBB.json').decode('utf8'))
+            bundle = self.read(bundles, 'all_agencies.json')
+            self.assertEqual(AGENCIES, json.loads(bundle.decode('utf8')))
+            self.assertEqual(bundle, gzip.decompress(
+                self.read(bundles, 'all_agencies.json.gz')))
+            lines = self.read(bundles, 'all_agencies.ndjson').decode(
+                'utf8').splitlines()
+            self.assertEqual([AGENCIES['AAA'], AGENCIES['BBB']],
+                             [json.loads(line) for line in lines])
+            self.assertEqual(
+                self.read(bundles, 'all_agencies.ndjson'),
+                gzip.decompress(self.read(bundles,
+                                          'all_agencies.ndjson.gz')))
+
+    def test_export_is_incremental(self):
+        """Only YAML that changed since the last export is parsed, and only
+        changed files are rewritten"""
+        with TemporaryDirectory() as directory:
+            dataset.save_all(AGENCIES, directory)
+            convert_to_json.export_directory(directory)
+            bundles = os.path.join(directory, 'bundles')
+            gz = self.read(bundles, 'all_agencies.json.gz')
+
+            dataset.save_agency('AAA', dict(AGENCIES['AAA'], name='A2'),
+                                directory)
+            with patch('convert_to_json.export_agency',
+                       wraps=convert_to_json.export_agency) as export, \
+                    patch('convert_to_json.write_if_changed',
+                          wraps=convert_to_json.write_if_changed) as write:
+                exported = convert_to_json.export_directory(directory)
+            export.assert_called_once_with('AAA', directory)
+            self.assertEqual('A2', exported['AAA']['name'])
+            self.assertEqual(AGENCIES['BBB'], exported['BBB'])
+            self.assertNotEqual(gz, self.read(bundles,
+                                              'all_agencies.json.gz'))
+            written = [call[0][0] for call in write.call_args_list
+                       if call[0][0].endswith('BBB.json')]
+            self.assertEqual([], written)
+
+            # Nothing changed: nothing is converted or written
+            with patch('convert_to_json.export_agency') as export, \
+                    patch('convert_to_json.metrics') as metrics:
+                convert_to_json.export_directory(directory)
+            self.assertFalse(export.called)
+            self.assertFalse(metrics.file_written.called)
+
+    def test_export_in_parallel(self):
+        """Files written by worker processes are counted too"""
+        with TemporaryDirectory() as directory:
+            dataset.save_all(AGENCIES, directory)
+            with patch('convert_to_json.metrics') as metrics:
+                self.assertEqual(AGENCIES, convert_to_json.export_directory(
+                    directory, workers=2))
+            # Two agencies, the manifest and four bundle files
+            self.assertEqual(7, metrics.file_written.call_count)
+
+    def test_write_json(self):
+        """Exporting in-memory agencies should leave a manifest the next
+        file-based export can use"""
+        with TemporaryDirectory() as directory:
+            dataset.save_all(AGENCIES, directory)
+            convert_to_json.write_json(AGENCIES, directory)
+            with patch('convert_to_json.export_agency') as export:
+                self.assertEqual(AGENCIES, convert_to_json.export_directory(
+                    directory))
+            self.assertFalse(export.called)
@@ -0,0 +1,63 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import os
+import stat
+
+import dataset
+
+
+class DatasetTests(TestCase):
+
+    def test_write_and_read(self):
+        """Writes should round trip and leave no temporary files behind"""
+        data = {'name': 'Test Agency', 'departments': [{'name': 'Office'}]}
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'nested', 'TEST.yaml')
+            dumped = dataset.write(filename, data)
+            self.assertEqual(data, dataset.read(filename))
+            with open(filename) as f:
+                self.assertEqual(dumped, f.read())
+            self.assertEqual(['TEST.yaml'],
+                             os.listdir(os.path.join(tmp, 'nested')))
+            self.assertEqual(None, dataset.read(os.path.join(tmp, 'X.yaml')))
+
+    def test_write_mode(self):
+        """Written files get the usual mode, not the temp file's 0600"""
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'TEST.yaml')
+            with open(os.path.join(tmp, 'plain'), 'w'):
+                pass
+            dataset.write(filename, {'name': 'Test Agency'})
+            self.assertEqual(
+                stat.S_IMODE(os.stat(os.path.join(tmp, 'plain')).st_mode),
+                stat.S_IMODE(os.stat(filename).st_mode))
+
+    def test_write_if_changed(self):
+        """Files holding the same YAML are left alone"""
+        data = {'name': 'Test Agency'}
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'TEST.yaml')
+            self.assertIsNotNone(dataset.write_if_changed(filename, data))
+            self.assertIsNone(dataset.write_if_changed(filename, data))
+            self.assertIsNotNone(dataset.save_agency_if_changed(
+                'TEST', {'name': 'Renamed'}, tmp))
+            self.assertEqual({'name': 'Renamed'}, dataset.read(filename))
+
+    def test_load_and_save_all(self):
+        """Agencies should be keyed by abbreviation, in sorted order"""
+        agencies = {'ZZZ': {'name': 'Zed'}, 'Ex-Im Bank': {'name': 'Bank'},
+                    'AAA': {'name': 'Ay'}}
+        with TemporaryDirectory() as tmp:
+            dataset.save_all(agencies, tmp)
+            loaded = dataset.load_all(tmp)
+            self.assertEqual(['AAA', 'Ex-Im Bank', 'ZZZ'], list(loaded))
+            self.assertEqual(agencies, dict(loaded))
+            self.assertEqual({'name': 'Bank'},
+                             dataset.load_agency('Ex-Im Bank', tmp))
+
+    def test_dumps_matches_existing_files(self):
+        """Re-serializing an agency shouldn't change its file"""
+        filename = dataset.agency_filename('data', 'DOJ')
+        with open(filename, encoding='utf8') as f:
+            original = f.read()
+        self.assertEqual(original, dataset.dumps(dataset.load(original)))
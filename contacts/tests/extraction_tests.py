@@ -0,0 +1,92 @@
+import random
+from timeit import default_timer
+from unittest import TestCase
+
+from bench_extraction import garbage_lines
+from compare_parsers import cached_agency_pages
+import phones
+import scraper
+
+
+def regex_phone(line, anchored=False):
+    """What PHONE_RE finds, in the same shape as phones.PhoneMatch"""
+    match = (phones.PHONE_RE.match if anchored
+             else phones.PHONE_RE.search)(line)
+    if match:
+        extension = match.group('extension')
+        return (match.start(), match.end(),
+                phones.digits(match.group('prefix')),
+                phones.digits(match.group('area_code')),
+                phones.digits(match.group('first_three')),
+                phones.digits(match.group('last_four')),
+                phones.digits(extension) if extension else None,
+                bool(match.group('tty')))
+
+
+def scanned_phone(line, anchored=False):
+    match = (phones.match_phone if anchored else phones.scan_phone)(line)
+    if match:
+        return tuple(match)
+
+
+def regex_address(line):
+    match = scraper.ADDY_RE.match(line)
+    if match:
+        return match.group('city'), match.group('state'), match.group('zip')
+
+
+def random_lines(pieces, count, seed=0):
+    rand = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rand.choice(pieces)
+                      for _ in range(rand.randint(0, 25)))
+
+
+class ExtractionTests(TestCase):
+    """The linear time scanners should agree with the regexes they replace,
+    and stay fast on lines which make the regexes backtrack"""
+
+    def assert_agree(self, line):
+        for anchored in (False, True):
+            self.assertEqual(regex_phone(line, anchored),
+                             scanned_phone(line, anchored), repr(line))
+        self.assertEqual(regex_address(line), scraper.match_address(line),
+                         repr(line))
+
+    def test_known_lines(self):
+        for line in ("(928) 779-2727, ext. 145", "+4 123-456-7890",
+                     "4-(123) 456 7890", "41234567890", "123-4567",
+                     " (202) 663-7026 (TTY)'", "Phone: (555) 333-4444",
+                     "1234567890123", "12 345 678-901-2345 ext 12345 (tty",
+                     "Washington , DC  20424", "Arlington, VA 22201",
+                     "New York, N.Y. 10001-2345", "City\n , DC 20001",
+                     "City,\nDC 20001", "Nowhere, WASHDC 20001", ""):
+            self.assert_agree(line)
+
+    def test_random_lines(self):
+        pieces = (list('0123456789') * 3 + list(' ()-+,.\n\tAaZ') +
+                  ['ext', 'Ext. ', '(tty)', ' (TTY', 'DC', 'N.Y.', ', '])
+        for line in random_lines(pieces, 20000):
+            self.assert_agree(line)
+
+    def test_adversarial_lines(self):
+        """10KB lines take the regexes seconds; the scanners should need a
+        tiny fraction of that"""
+        for name, line in garbage_lines(10000).items():
+            for scanner in (phones.scan_phone, phones.match_phone,
+                            scraper.match_address):
+                start = default_timer()
+                scanner(line)
+                self.assertLess(default_timer() - start, 0.2, name)
+
+    def test_cached_pages(self):
+        """Every paragraph of every agency page in the fixture corpus should
+        extract the same way"""
+        pages = list(cached_agency_pages('tests/fixtures/html'))
+        self.assertTrue(pages)
+        for abb, text in pages:
+            lines, _ = scraper.clean_paragraphs(
+                scraper.make_soup(scraper.fix_known_typos(text)))
+            self.assertTrue(lines, abb)
+            for line in lines:
+                self.assert_agree(line)
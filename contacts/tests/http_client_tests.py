@@ -0,0 +1,90 @@
+import threading
+import time
+from unittest import TestCase
+
+from mock import Mock, patch
+
+import http_client
+import metrics
+
+
+class HttpClientTests(TestCase):
+
+    def test_adapter(self):
+        """Sessions should pool connections and retry with backoff"""
+        client = http_client.Client(retries=5, backoff_factor=2,
+                                    pool_size=4)
+        adapter = client.session.get_adapter('https://www.foia.gov/')
+        self.assertEqual(5, adapter.max_retries.total)
+        self.assertEqual(2, adapter.max_retries.backoff_factor)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+        self.assertEqual(4, adapter._pool_maxsize)
+        self.assertIs(adapter,
+                      client.session.get_adapter('http://www.foia.gov/'))
+
+    def test_get(self):
+        """Requests get the default timeout and are recorded in metrics"""
+        client = http_client.Client(timeout=3)
+        client.session = Mock()
+        client.session.get.return_value = Mock(
+            url='https://www.foia.gov/', content=b'abc', from_cache=False)
+        metrics.reset()
+        response = client.get('https://www.foia.gov/', params={'a': 1},
+                              verify=False)
+        self.assertEqual(client.session.get.return_value, response)
+        client.session.get.assert_called_once_with(
+            'https://www.foia.gov/', params={'a': 1}, verify=False,
+            timeout=3)
+        stage = metrics.snapshot()['stages'][metrics.DEFAULT_STAGE]
+        self.assertEqual(1, stage['http_requests'])
+        self.assertEqual(3, stage['bytes_downloaded'])
+        metrics.reset()
+
+    def test_cached_client(self):
+        with patch('http_client.CachedSession') as CachedSession:
+            client = http_client.Client(cache_name='fr')
+        CachedSession.assert_called_once_with('fr')
+        self.assertEqual(CachedSession.return_value, client.session)
+
+    def test_host_limiter(self):
+        """No more than `limit` requests should be in flight per host"""
+        limiter = http_client.HostLimiter(2)
+        in_flight, peak = {'a': 0, 'b': 0}, {'a': 0, 'b': 0}
+        lock = threading.Lock()
+
+        def fetch(host):
+            with limiter.slot('https://%s/path' % host):
+                with lock:
+                    in_flight[host] += 1
+                    peak[host] = max(peak[host], in_flight[host])
+                time.sleep(0.01)
+                with lock:
+                    in_flight[host] -= 1
+
+        threads = [threading.Thread(target=fetch, args=(host,))
+                   for host in 'ab' * 6]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({'a': 2, 'b': 2}, peak)
+
+    @patch('http_client.time')
+    def test_host_rate_limiter(self, mock_time):
+        """Requests to the same host should be spaced out; other hosts should
+        not have to wait"""
+        mock_time.monotonic.return_value = 100.0
+        limiter = http_client.HostRateLimiter(0.5)
+        limiter.wait('https://www.foia.gov/a')
+        self.assertFalse(mock_time.sleep.called)
+        limiter.wait('https://www.foia.gov/b')
+        mock_time.sleep.assert_called_with(0.5)
+        limiter.wait('https://www.foia.gov/c')
+        mock_time.sleep.assert_called_with(1.0)
+        mock_time.sleep.reset_mock()
+        limiter.wait('https://www.example.gov/')
+        self.assertFalse(mock_time.sleep.called)
+
+    def test_default_client(self):
+        self.assertIs(http_client.default_client(),
+                      http_client.default_client())
@@ -1,6 +1,11 @@
+import os
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
+from mock import Mock, patch
+
 import layer_with_csv as layer
+import phones
 
 
 class LayerTests(TestCase):
@@ -80,6 +85,67 @@ class LayerTests(TestCase):
         self.assertEqual(None, layer.patch_dict(old_dict, old_dict))
         self.assertEqual(None, layer.patch_dict(old_dict, new_dict))
 
+    def test_field_changes(self):
+        """Changes are computed without copying anything"""
+        old_dict = {"a": 1, "misc": {"z": 100}}
+        new_dict = {"a": 2, "b": [3], "misc": {"z": 999, "y": 99}}
+        self.assertEqual({"b": [3], "misc": {"y": 99}},
+                         layer.field_changes(old_dict, new_dict))
+        self.assertEqual({}, layer.field_changes(old_dict, old_dict))
+
+    def test_patch_agency(self):
+        """Only the departments that gain fields are copied"""
+        yaml_data = {'name': 'A', 'departments': [
+            {'name': 'B', 'website': 'b.gov'},
+            {'name': 'C', 'misc': {'X': {'name': 'Ada'}}},
+            {'name': 'D'}]}
+        contacts = {'A': {
+            'B': {'website': 'other.gov', 'misc': {}, 'emails': []},
+            'C': {'emails': ['c@c.gov'],
+                  'misc': {'X': {'name': 'Bob'}, 'Y': {'name': 'Cy'}}}}}
+        with self.assertLogs(level='INFO') as logs:
+            count, patched = layer.patch_agency(yaml_data, contacts)
+        self.assertEqual(1, count)
+        self.assertIs(yaml_data['departments'][0], patched['departments'][0])
+        self.assertIs(yaml_data['departments'][2], patched['departments'][2])
+        self.assertEqual({'name': 'C', 'emails': ['c@c.gov'],
+                          'misc': {'X': {'name': 'Ada'}, 'Y': {'name': 'Cy'}}},
+                         patched['departments'][1])
+        self.assertEqual({'X': {'name': 'Ada'}},
+                         yaml_data['departments'][1]['misc'])
+        self.assertIn('A: 1 departments gain emails 1, misc.Y 1',
+                      '\n'.join(logs.output))
+
+        self.assertEqual((0, patched), layer.patch_agency(patched, contacts))
+
+    def test_department_changes_claims_once(self):
+        """Two departments spelled like the same XLS office don't both
+        merge it"""
+        yaml_data = {'name': 'A', 'departments': [
+            {'name': 'Research and Development'},
+            {'name': 'Research + Development'}]}
+        contacts = {'A': {'Research & Development': {
+            'emails': ['rd@a.gov'], 'misc': {}}}}
+        changes = layer.department_changes(yaml_data, contacts)
+        self.assertEqual(['Research and Development'], list(changes))
+
+    def test_department_changes_aliases(self):
+        """Only the agency's own aliases are used"""
+        yaml_data = {'name': 'A', 'departments': [
+            {'name': 'Armstrong Flight Research Center'}]}
+        contacts = {'A': {'Dryden Flight Research Center': {
+            'emails': ['dfrc@a.gov'], 'misc': {}}}}
+        xls_names = layer.XlsNames(contacts, aliases={'NASA': {
+            'Armstrong Flight Research Center':
+                'Dryden Flight Research Center'}})
+        self.assertEqual(
+            ['Armstrong Flight Research Center'],
+            list(layer.department_changes(yaml_data, contacts,
+                                          xls_names=xls_names, abbr='NASA')))
+        self.assertEqual(
+            {}, layer.department_changes(yaml_data, contacts,
+                                         xls_names=xls_names, abbr='DOC'))
+
     def empty_row(self):
         return {"Agency": "", "Department": "", "Name": "", "Title": "",
                 "Room Number": "", "Street Address": "", "City": "",
@@ -184,3 +250,48 @@ class LayerTests(TestCase):
                          {'name': 'Bob'})
         self.assertEqual(contact_dict["A"]["B"]["misc"],
                          {'Awesome Person': {'name': 'Ada'}})
+
+    def test_read_rows(self):
+        """Rows are keyed by the header row"""
+        rows = [['Department', 'Agency'], ['A', 'B'], ['C', 'D']]
+        sheet = Mock(nrows=3, row_values=lambda idx: rows[idx])
+        self.assertEqual([{'Department': 'A', 'Agency': 'B'},
+                          {'Department': 'C', 'Agency': 'D'}],
+                         list(layer.read_rows(sheet)))
+
+    @patch('layer_with_csv.refresh_xls')
+    @patch('layer_with_csv.parse_xls')
+    def test_contacts_from_xls_cached(self, parse_xls, refresh_xls):
+        """The XLS is only parsed again once it changes"""
+        parse_xls.return_value = {'A': {'B': {'misc': {}, 'emails': []}}}
+        with TemporaryDirectory() as tmpdir:
+            xls_path = os.path.join(tmpdir, 'contacts.xls')
+            parsed_path = os.path.join(tmpdir, 'contacts.pickle')
+            with open(xls_path, 'wb') as f:
+                f.write(b'first')
+            for _ in range(2):
+                self.assertEqual(
+                    parse_xls.return_value,
+                    layer.contacts_from_xls(xls_path, parsed_path))
+            self.assertEqual(1, parse_xls.call_count)
+
+            with open(xls_path, 'wb') as f:
+                f.write(b'second')
+            layer.contacts_from_xls(xls_path, parsed_path)
+            self.assertEqual(2, parse_xls.call_count)
+
+    def test_xls_hash_covers_sources(self):
+        """Changing the parsing code invalidates the parse"""
+        with TemporaryDirectory() as tmpdir:
+            xls_path = os.path.join(tmpdir, 'contacts.xls')
+            source = os.path.join(tmpdir, 'phones.py')
+            for path in (xls_path, source):
+                with open(path, 'wb') as f:
+                    f.write(b'first')
+            before = layer.xls_hash(xls_path, (source,))
+            self.assertEqual(before, layer.xls_hash(xls_path, (source,)))
+            with open(source, 'wb') as f:
+                f.write(b'second')
+            self.assertNotEqual(before, layer.xls_hash(xls_path, (source,)))
+            self.assertIn(os.path.abspath(phones.__file__),
+                          layer.PARSE_SOURCES)
@@ -1,8 +1,11 @@
 import layer_with_usa_contacts as usa_layer
 import os
+from tempfile import TemporaryDirectory
 
 from unittest import TestCase
 
+import dataset
+
 
 class USALayerTests(TestCase):
 
@@ -187,3 +190,23 @@ class USALayerTests(TestCase):
                 'usa_id' in patched_yaml[0].get('departments')[0])
             self.assertTrue(
                 'description' in patched_yaml[0].get('departments')[0])
+
+    def test_patch_yamls_near_miss(self):
+        """ Names close enough to one in the API data are matched too """
+
+        data = {'Commerce': {'usa_id': '1'},
+                'Patent and Trademark Offices': {'usa_id': '2',
+                                                 'description': 'Patents'}}
+        with TemporaryDirectory() as tmpdir:
+            agency = {'name': 'Department of Commerce',
+                      'departments': [{'name': 'Patent and Trademark Office'},
+                                      {'name': 'Bureau of Unrelated Things'}]}
+            dataset.save_agency('DOC', agency, tmpdir)
+            patched = list(usa_layer.patch_yamls(
+                data=data, directory=os.path.join(tmpdir, '*.yaml')))
+        agency = patched[0][0]
+        self.assertEqual('1', agency['usa_id'])
+        self.assertEqual({'name': 'Patent and Trademark Office',
+                          'usa_id': '2', 'description': 'Patents'},
+                         agency['departments'][0])
+        self.assertNotIn('usa_id', agency['departments'][1])
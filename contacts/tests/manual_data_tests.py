@@ -0,0 +1,98 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import dataset
+import manual_data
+
+
+AGENCY = {
+    'name': 'An Agency',
+    'keywords': ['estates'],
+    'departments': [
+        {'name': 'Headquarters', 'phone': '202-555-1212'},
+        {'name': 'Branch', 'phone': '202-555-3434'},
+    ],
+}
+
+OVERRIDES = {
+    'keywords': ['accounting'],
+    'departments': [
+        {'name': 'Branch', 'website': 'http://example.gov/branch'},
+        {'name': 'Renamed Office', 'website': 'http://example.gov/gone'},
+    ],
+}
+
+
+class ManualDataTests(TestCase):
+
+    def setUp(self):
+        manual_data.clear_index()
+
+    def test_update_list_in_dict(self):
+        original = {'keywords': ['accounting', 'estates']}
+        manual_data.update_list_in_dict(
+            original, 'keywords', ['accounting', 'employment', 'courts'])
+
+        self.assertEqual(
+            original['keywords'],
+            ['accounting', 'courts', 'employment', 'estates'])
+
+        original = {}
+        manual_data.update_list_in_dict(
+            original, 'emails', ['email@agency.gov'])
+        self.assertEqual(original['emails'], ['email@agency.gov'])
+
+    def test_merge(self):
+        """Only the overridden department should be copied, and overrides
+        which match no department should be reported"""
+        merged, unmatched = manual_data.merge(
+            AGENCY, manual_data.overrides_from(OVERRIDES))
+        self.assertEqual(['Renamed Office'], unmatched)
+        self.assertEqual(['accounting', 'estates'], merged['keywords'])
+        hq, branch = merged['departments']
+        self.assertIs(AGENCY['departments'][0], hq)
+        self.assertEqual({'name': 'Branch', 'phone': '202-555-3434',
+                          'website': 'http://example.gov/branch'}, branch)
+        # The original is left alone
+        self.assertNotIn('website', AGENCY['departments'][1])
+        self.assertEqual(['estates'], AGENCY['keywords'])
+
+    def test_index(self):
+        """Files are read once, and again on refresh if one of them changed"""
+        with TemporaryDirectory() as directory:
+            dataset.save_agency('AAA', OVERRIDES, directory)
+            index = manual_data.index(directory)
+            self.assertEqual(['AAA'], list(index))
+            self.assertEqual(['Branch', 'Renamed Office'],
+                             list(index['AAA'].departments))
+            self.assertIs(index, manual_data.index(directory))
+            self.assertEqual(40, len(manual_data.lookup('AAA', directory)
+                                     .hash))
+            self.assertIsNone(manual_data.lookup('BBB', directory))
+
+            dataset.save_agency('BBB', {'name': 'B'}, directory)
+            self.assertEqual(['AAA'], list(manual_data.index(directory)))
+            manual_data.refresh(directory)
+            self.assertEqual(['AAA', 'BBB'],
+                             sorted(manual_data.index(directory)))
+            index = manual_data.index(directory)
+            manual_data.refresh(directory)
+            self.assertIs(index, manual_data.index(directory))
+
+            # Edited in place, leaving the directory's mtime alone
+            filename = dataset.agency_filename(directory, 'BBB')
+            with open(filename, 'w') as f:
+                f.write('name: Bee\n')
+            os.utime(filename, ns=(0, 0))
+            manual_data.refresh(directory)
+            self.assertEqual({'name': 'Bee'},
+                             manual_data.lookup('BBB', directory).data)
+
+            self.assertEqual(
+                {'AAA': ['Renamed Office'], 'BBB': [None]},
+                dict(manual_data.stale_overrides({'AAA': AGENCY},
+                                                 directory)))
+            self.assertEqual(2, manual_data.report({'AAA': AGENCY},
+                                                   directory))
+        self.assertEqual({}, manual_data.index(directory))
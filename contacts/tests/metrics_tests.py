@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import requests
+
+import metrics
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_stages(self):
+        """Counters should be attributed to the innermost running stage"""
+        with metrics.stage('scraper'):
+            metrics.record_request('https://www.foia.gov/a', 100)
+            metrics.record_request('https://www.foia.gov/b', 50)
+            metrics.record_request('https://www.foia.gov/c', 75,
+                                   from_cache=True)
+            metrics.cache_miss()
+            with metrics.stage('inner'):
+                metrics.file_written()
+            metrics.record_parse('DOJ', 1.5)
+        metrics.file_written()
+
+        stages = metrics.snapshot()['stages']
+        self.assertEqual(['scraper', 'inner', metrics.DEFAULT_STAGE],
+                         list(stages))
+        scraper = stages['scraper']
+        self.assertEqual(2, scraper['http_requests'])
+        self.assertEqual({'www.foia.gov': 2},
+                         scraper['http_requests_by_host'])
+        self.assertEqual(150, scraper['bytes_downloaded'])
+        self.assertEqual(1, scraper['cache_hits'])
+        self.assertEqual(1, scraper['cache_misses'])
+        self.assertEqual(0, scraper['files_written'])
+        self.assertEqual({'DOJ': 1.5}, scraper['parse_seconds'])
+        self.assertGreaterEqual(scraper['seconds'], stages['inner']['seconds'])
+        self.assertEqual(1, stages['inner']['files_written'])
+        self.assertEqual(1, stages[metrics.DEFAULT_STAGE]['files_written'])
+
+    def test_record_response(self):
+        """Responses served by requests_cache should count as cache hits"""
+        response = requests.Response()
+        response.url = 'https://www.federalregister.gov/api'
+        response._content = b'1234'
+        self.assertEqual(response, metrics.record_response(response))
+        cached = requests.Response()
+        cached.url = 'https://www.federalregister.gov/api'
+        cached._content = b'1234'
+        cached.from_cache = True
+        metrics.record_response(cached)
+        record = metrics.snapshot()['stages'][metrics.DEFAULT_STAGE]
+        self.assertEqual(1, record['http_requests'])
+        self.assertEqual(4, record['bytes_downloaded'])
+        self.assertEqual(1, record['cache_hits'])
+
+    def test_write(self):
+        """Each run should be appended as a line of JSON"""
+        with metrics.stage('csv'):
+            metrics.file_written()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'metrics.jsonl')
+            metrics.write(filename)
+            metrics.write(filename)
+            with open(filename) as f:
+                runs = [json.loads(line) for line in f]
+        self.assertEqual(2, len(runs))
+        self.assertEqual(1, runs[0]['stages']['csv']['files_written'])
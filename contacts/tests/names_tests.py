@@ -0,0 +1,102 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import names
+import processing_time_scraper
+
+
+class NamesTests(TestCase):
+
+    def test_normalize(self):
+        self.assertEqual('department commerce office secretary',
+                         names.normalize('Dept. of Commerce - Office of '
+                                         'the Secretary'))
+        self.assertEqual(names.normalize('Research and Development'),
+                         names.normalize('Research & Development'))
+
+    def test_lookup(self):
+        index = names.NameIndex(
+            ['Bureau of Fiscal Services', 'Office of Personnel Management',
+             'Department of Labor '], aliases={})
+        self.assertEqual('Department of Labor ',
+                         index.lookup('Department of Labor'))
+        self.assertEqual('Bureau of Fiscal Services',
+                         index.lookup('Bureau of the Fiscal Service'))
+        # Too different to be the same office
+        self.assertIsNone(index.lookup('Office of Management and Budget'))
+        self.assertIsNone(index.lookup('Bureau of the Fiscal Service',
+                                       exclude=['Bureau of Fiscal Services']))
+
+    def test_aliases(self):
+        index = names.NameIndex(
+            ['Dryden Flight Research Center', 'Bureau of Fiscal Services'],
+            aliases={
+                'Armstrong Flight Research Center':
+                    'Dryden Flight Research Center',
+                'Bureau of the Fiscal Service': None,
+                'Bureau of Fiscal Service': 'Somewhere else'})
+        self.assertEqual('Dryden Flight Research Center',
+                         index.lookup('Armstrong Flight Research Center'))
+        self.assertIsNone(index.lookup('Bureau of the Fiscal Service'))
+        # Aliases into other sources don't stop a match here
+        self.assertEqual('Bureau of Fiscal Services',
+                         index.lookup('Bureau of Fiscal Service'))
+
+    def test_exclude(self):
+        """Claimed names aren't returned, however they would match"""
+        index = names.NameIndex(
+            ['Research & Development', 'Office of Research and Development',
+             'Dryden Flight Research Center'],
+            aliases={'Armstrong Flight Research Center':
+                     'Dryden Flight Research Center'})
+        claimed = ['Research & Development', 'Dryden Flight Research Center']
+        self.assertIsNone(index.lookup('Research & Development', claimed))
+        self.assertIsNone(index.lookup('Research and Development', claimed))
+        self.assertIsNone(index.lookup('Armstrong Flight Research Center',
+                                       claimed))
+
+    def test_save_aliases(self):
+        with TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'aliases.yaml')
+            self.assertEqual({}, names.load_aliases(filename))
+            names.save_aliases({'X': {'A': 'B', 'C': None}}, filename)
+            self.assertEqual({'X': {'A': 'B', 'C': None}},
+                             names.load_aliases(filename))
+
+    def test_agency_aliases(self):
+        """One agency's aliases don't apply to another agency's offices"""
+        aliases = {'NASA': {'Office of Inspector General': 'OIG - NASA'}}
+        index = names.NameIndex(['OIG - NASA', 'Office of Inspector Generals'])
+        self.assertEqual('OIG - NASA', index.lookup(
+            'Office of Inspector General',
+            aliases=names.agency_aliases('NASA', aliases)))
+        self.assertEqual('Office of Inspector Generals', index.lookup(
+            'Office of Inspector General',
+            aliases=names.agency_aliases('DOC', aliases)))
+
+    def test_xls_matches(self):
+        """Each XLS office is listed for one YAML office at most"""
+        agencies = {'A': {'name': 'Agency A', 'departments': [
+            {'name': 'Bureau of the Fiscal Service'},
+            {'name': 'Bureau of Fiscal Service'}]}}
+        contacts = {'Agency A': {'Bureau of Fiscal Services': {}}}
+        self.assertEqual(
+            [('A', 'Bureau of the Fiscal Service', 'Bureau of Fiscal Services',
+              0.875)],
+            names.xls_matches(agencies, contacts, {}))
+
+    def test_processing_time_office_names(self):
+        """Offices are looked up in the processing times under the name
+        foia.gov uses"""
+        dept_level_data = {
+            'bureau of fiscal services_treasury_2012': {},
+            'internal revenue service_treasury_2012': {}}
+        offices = processing_time_scraper.office_indexes(dept_level_data)
+        yaml_data = {'departments': [{'name': 'Bureau of the Fiscal Service'},
+                                     {'name': 'Internal Revenue Service'},
+                                     {'name': 'Mint'}]}
+        self.assertEqual(
+            ['bureau of fiscal services', 'Internal Revenue Service', 'Mint'],
+            processing_time_scraper.office_names('Treasury', yaml_data,
+                                                 offices))
@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+import phones
+
+
+class PhonesTests(TestCase):
+
+    def setUp(self):
+        phones.clear_cache()
+
+    def test_clean_phone_numbers(self):
+        """Batches should be normalized in order, with None for lines that
+        aren't phone numbers"""
+        lines = ["(928) 779-2727, ext. 145", "Other", "+4 123-456-7890",
+                 "(202) 663-7026 (TTY)", "(928) 779-2727, ext. 145"]
+        self.assertEqual(
+            ['928-779-2727 x145', None, '+4 123-456-7890',
+             '202-663-7026 (TTY)', '928-779-2727 x145'],
+            phones.clean_phone_numbers(lines))
+        info = phones.cache_info()['clean_phone_number']
+        self.assertEqual(1, info.hits)
+        self.assertEqual(4, info.misses)
+
+    def test_clean_phone_number_errors(self):
+        """Errors shouldn't be cached away"""
+        for _ in range(2):
+            self.assertRaises(Exception, phones.clean_phone_number, "Other")
+
+    def test_extract_numbers_returns_fresh_lists(self):
+        """Cached results must not be shared between callers"""
+        phone_str = " (202) 663-4634, (202) 663-7026 (TTY)'"
+        first = phones.extract_numbers(phone_str)
+        second = phones.extract_numbers(phone_str)
+        self.assertEqual(['202-663-4634', '202-663-7026 (TTY)'], first)
+        self.assertEqual(first, second)
+        self.assertFalse(first is second)
+        first.append('mutated')
+        self.assertEqual(['202-663-4634', '202-663-7026 (TTY)'],
+                         phones.extract_all_numbers([phone_str])[0])
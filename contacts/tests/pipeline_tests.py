@@ -0,0 +1,82 @@
+from mock import patch
+from unittest import TestCase
+
+import metrics
+import pipeline
+import records
+
+
+class PipelineTests(TestCase):
+
+    @patch('scraper.save_manifest')
+    @patch('scraper.load_manifest', return_value={})
+    @patch('pipeline.snapshot')
+    @patch('pipeline.convert_to_json')
+    @patch('pipeline.dataset')
+    def test_run(self, dataset, convert_to_json, snapshot, load_manifest,
+                 save_manifest):
+        """Stages should run in order over the in-memory agencies, and the
+        results should be written exactly once"""
+        dataset.load_all.return_value = {'AAA': {'name': 'A'}}
+        calls = []
+
+        def transform(stage):
+            def apply(agencies, args):
+                calls.append(stage)
+                agencies['AAA'] = dict(agencies['AAA'], **{stage: True})
+                return agencies
+            return apply
+
+        transforms = {stage: transform(stage) for stage in pipeline.STAGES}
+        metrics.reset()
+        with patch.dict(pipeline.TRANSFORMS, transforms):
+            args = pipeline.parse_args(['--skip', 'keywords', '--max-age',
+                                        '2'])
+            agencies = pipeline.run(args)
+
+        self.assertEqual(7200, args.max_age)
+        self.assertIsInstance(agencies, records.AgencyRecords)
+        self.assertEqual(
+            ['scraper', 'csv', 'processing_times', 'reading_rooms'], calls)
+        self.assertEqual(
+            {'name': 'A', 'scraper': True, 'csv': True,
+             'processing_times': True, 'reading_rooms': True},
+            agencies['AAA'])
+        dataset.load_all.assert_called_once_with()
+        dataset.save_all.assert_called_once_with(agencies)
+        convert_to_json.write_json.assert_called_once_with(agencies)
+        snapshot.write.assert_called_once_with(agencies)
+        save_manifest.assert_called_once_with(args.manifest)
+        self.assertEqual(
+            ['load', 'scraper', 'csv', 'processing_times', 'reading_rooms',
+             'save', 'json'],
+            list(metrics.snapshot()['stages']))
+        metrics.reset()
+
+    @patch('scraper.save_manifest')
+    @patch('scraper.load_manifest', return_value={})
+    @patch('pipeline.snapshot')
+    @patch('pipeline.convert_to_json')
+    @patch('pipeline.dataset')
+    def test_failed_stage_keeps_manifest(self, dataset, convert_to_json,
+                                         snapshot, load_manifest,
+                                         save_manifest):
+        """If a stage fails after the scraper, nothing is saved, so the
+        next run parses the same agencies again"""
+        dataset.load_all.return_value = {}
+
+        def scrape(agencies, args):
+            args.manifest['AAA'] = {'parse_hash': 'new'}
+            return agencies
+
+        def fail(agencies, args):
+            raise ValueError
+
+        metrics.reset()
+        with patch.dict(pipeline.TRANSFORMS, {'scraper': scrape,
+                                              'csv': fail}):
+            with self.assertRaises(ValueError):
+                pipeline.run(pipeline.parse_args([]))
+        self.assertFalse(dataset.save_all.called)
+        self.assertFalse(save_manifest.called)
+        metrics.reset()
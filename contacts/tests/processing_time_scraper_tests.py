@@ -1,6 +1,11 @@
 import processing_time_scraper
 
+import os
+from tempfile import TemporaryDirectory
+import time
+
 from bs4 import BeautifulSoup
+from mock import Mock, patch
 from unittest import TestCase
 
 # HTTP requests are mocked out with vcrpy and requests
@@ -55,6 +60,72 @@ class ProcessingTimeScaperTests(TestCase):
             data = processing_time_scraper.parse_html(html, params, {})
             self.assertEqual({}, data)
 
+    @patch('processing_time_scraper.parse_html')
+    @patch('processing_time_scraper.fetch_page')
+    def test_collect_pages(self, fetch_page, parse_html):
+        """ Pages are fetched concurrently, but added in order """
+
+        fetch_page.side_effect = lambda url, params, limiter, context: \
+            params['requestYear']
+        parse_html.side_effect = lambda html, params, data: {
+            'key': html, params['agencyName'] + html: html}
+        param_sets = [{'agencyName': agency, 'requestYear': year}
+                      for agency in ('A', 'B') for year in ('2012', '2013')]
+        data = processing_time_scraper.collect_pages(
+            'url', param_sets, {'old': 1}, workers=4)
+        self.assertEqual({'old': 1, 'key': '2013', 'A2012': '2012',
+                          'A2013': '2013', 'B2012': '2012', 'B2013': '2013'},
+                         data)
+        self.assertEqual(4, fetch_page.call_count)
+
+    def test_discover_years(self):
+        """ Years are scraped once, then read from disk until too old """
+
+        client = Mock()
+        client.get.return_value = Mock(
+            status_code=200,
+            text='<input type="checkbox" name="year-2013">'
+                 '<input type="checkbox" name="year-2012">')
+        with TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'years.json')
+            for _ in range(2):
+                years = processing_time_scraper.discover_years(
+                    client, filename, ttl=60)
+                self.assertEqual(['2012', '2013'], years)
+            self.assertEqual(1, client.get.call_count)
+
+            with patch('processing_time_scraper.time.time',
+                       return_value=time.time() + 120):
+                processing_time_scraper.discover_years(
+                    client, filename, ttl=60)
+            self.assertEqual(2, client.get.call_count)
+
+    @patch('processing_time_scraper.get_years')
+    @patch('processing_time_scraper.discover_years')
+    def test_default_mapping_uses_saved_years(self, discover_years,
+                                              get_years):
+        """ Without years, the mapping uses the saved years """
+
+        discover_years.return_value = ['2013']
+        mapping = processing_time_scraper.load_mapping()
+        self.assertIn('surface transportation board_stb_2013', mapping)
+        processing_time_scraper.apply_mapping({})
+        self.assertEqual(2, discover_years.call_count)
+        self.assertFalse(get_years.called)
+
+    @patch('processing_time_scraper.load_mapping')
+    @patch('processing_time_scraper.discover_years')
+    def test_run_context(self, discover_years, load_mapping):
+        """ A context works out years and mapping once """
+
+        discover_years.return_value = ['2012']
+        context = processing_time_scraper.RunContext(http_cache=Mock())
+        for _ in range(3):
+            self.assertEqual(['2012'], context.years)
+            context.mapping
+        self.assertEqual(1, discover_years.call_count)
+        load_mapping.assert_called_once_with(['2012'])
+
     def test_get_key_values(self):
         """ Should convert a row in header into a unique key """
 
@@ -231,3 +302,30 @@ class ProcessingTimeScaperTests(TestCase):
         self.assertEqual(
             mapped_test_data[yaml_key_1],
             mapped_test_data[yaml_key_2])
+
+    def test_mapped_data_shares_records(self):
+        """ yaml names resolve to the foia.gov record without copies """
+
+        record = {'agency': 'STB', 'year': '2013', 'component': 'STB',
+                  'simple_median_days': '10', '': ''}
+        data = {'surface transportation board_stb_2013': record,
+                'other_stb_2013': {}}
+        mapping = {'surface transportation board_stb_2013': [
+            'surface transportation board_dot_2013',
+            'surface transportation board_stb_2013']}
+        mapped = processing_time_scraper.apply_mapping(data, mapping)
+
+        self.assertIs(record, mapped['surface transportation board_dot_2013'])
+        self.assertIn('surface transportation board_dot_2013', mapped)
+        self.assertNotIn('surface transportation board_dot_2012', mapped)
+        self.assertEqual(
+            ['other_stb_2013', 'surface transportation board_dot_2013',
+             'surface transportation board_stb_2013'], sorted(mapped))
+        self.assertEqual(3, len(mapped))
+
+        # Patching one agency leaves the shared record alone
+        yaml_data = processing_time_scraper.append_time_stats(
+            {}, mapped, 'surface transportation board_dot_2013', '_2013')
+        self.assertEqual({'2013': {'simple_median_days': '10'}},
+                         yaml_data['request_time_stats'])
+        self.assertEqual('STB', record['agency'])
@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+import query
+
+
+AGENCIES = {
+    'AAA': {'departments': [
+        {'name': 'HQ', 'website': 'http://a.gov', 'emails': ['a@a.gov'],
+         'address': {'state': 'VA'}},
+        {'name': 'Branch', 'request_form': 'http://a.gov/form',
+         'emails': [], 'address': {'state': 'DC'}},
+    ]},
+    'BBB': {'departments': [
+        {'name': 'Office', 'emails': ['b@b.gov', 'a@a.gov'],
+         'address': {'state': 'VA'}, 'misc': {'x': {'phone': ['1']}}},
+    ]},
+}
+
+
+def names(departments):
+    return [(abbr, dept['name']) for abbr, dept in departments]
+
+
+class QueryTests(TestCase):
+
+    def setUp(self):
+        self.index = query.DepartmentIndex(AGENCIES)
+
+    def test_field_value(self):
+        dept = AGENCIES['AAA']['departments'][0]
+        self.assertEqual('VA', query.field_value(dept, 'address.state'))
+        self.assertIsNone(query.field_value(dept, 'address.zip'))
+        self.assertIsNone(query.field_value(dept, 'website.zip'))
+
+    def test_missing(self):
+        """Absent and empty values both count as missing"""
+        self.assertEqual([('AAA', 'Branch'), ('BBB', 'Office')],
+                         names(self.index.missing('website')))
+        self.assertEqual([('AAA', 'Branch')],
+                         names(self.index.missing('emails')))
+        self.assertEqual([('AAA', 'Branch')],
+                         names(self.index.having('request_form')))
+
+    def test_where(self):
+        self.assertEqual([('AAA', 'HQ'), ('BBB', 'Office')],
+                         names(self.index.where('address.state', 'VA')))
+        self.assertEqual([('AAA', 'HQ'), ('BBB', 'Office')],
+                         names(self.index.where('emails', 'a@a.gov')))
+        self.assertEqual([], self.index.where('address.state', 'MD'))
+
+    def test_unindexed_fields(self):
+        """Other fields are indexed on first use; unhashable values can only
+        be checked for presence"""
+        self.assertNotIn('misc', self.index.present)
+        self.assertEqual([('BBB', 'Office')],
+                         names(self.index.having('misc')))
+        self.assertIn('misc', self.index.present)
+        self.assertEqual({}, self.index.values('misc'))
+
+    def test_values(self):
+        self.assertEqual([('VA', 2), ('DC', 1)],
+                         list(self.index.values('address.state').items()))
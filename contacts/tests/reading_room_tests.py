@@ -86,7 +86,7 @@ class ReadingRoomTests(TestCase):
             None,
             reading.get_absolute_url(l, 'http://fbi.gov/rr'))
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.get')
     def test_update_links(self, req):
         mock_resp = MockResponse()
         mock_resp.url = 'http://www.amtrak.com/foia/'
@@ -130,7 +130,7 @@ class ReadingRoomTests(TestCase):
         uniques = reading.uniquefy(links)
         self.assertEqual(len(uniques), 1)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.get')
     def test_unique_links_redirect_exception_handling(self, req):
         req.side_effect = requests.exceptions.TooManyRedirects()
 
@@ -138,21 +138,21 @@ class ReadingRoomTests(TestCase):
         uniques = reading.unique_links(links)
         self.assertEqual([], uniques)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.get')
     def test_unique_links_connection_error(self, req):
         req.side_effect = requests.exceptions.ConnectionError
         links = [['text one', 'http://testone.gov/resources/foialibrary/']]
         uniques = reading.unique_links(links)
         self.assertEqual([], uniques)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.get')
     def test_unique_links_redirect(self, req):
         req.return_value = MockResponse()
         links = [['text one', 'http://testone.gov/resources/foialibrary/']]
         uniques = reading.unique_links(links)
         self.assertEqual([['text one', 'http://newurl.gov']], uniques)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.get')
     def test_unique_links_redirect_301(self, req):
         fake_response = MockResponse()
         fake_response.history[0].status_code = 302
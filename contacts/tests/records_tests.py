@@ -0,0 +1,106 @@
+import pickle
+from unittest import TestCase
+
+import dataset
+import records
+from records import Address, Agency, Contact, Department, MISSING
+
+
+AGENCY = {
+    'abbreviation': 'AAA',
+    'name': 'An Agency',
+    'description': 'Does things',
+    'keywords': ['Things', 'Stuff'],
+    'request_time_stats': {'2014': {'simple_median_days': 5}},
+    'departments': [
+        {'name': 'Headquarters', 'top_level': False,
+         'address': {'address_lines': ['FOIA Officer'],
+                     'street': '1 Congress Street', 'city': 'Washington',
+                     'state': 'DC', 'zip': '20505'},
+         'emails': ['foia@example.gov'],
+         'public_liaison': {'name': 'Jane Smith',
+                            'phone': ['202-555-1212']},
+         'misc': {'FOIA Hotline': {'phone': ['202-555-3434']}},
+         'reading_rooms': [['Reading Room', 'http://example.gov/rr']],
+         'request_form': None,
+         'something_new': {'nested': [1, 2]}},
+        {'name': 'Branch', 'top_level': False, 'phone': '202-555-5656'},
+    ],
+}
+
+
+class RecordsTests(TestCase):
+
+    def test_round_trip(self):
+        """Conversion should be lossless, including unknown fields and
+        fields set to None"""
+        agency = Agency.from_dict(AGENCY)
+        self.assertEqual(AGENCY, agency.to_dict())
+        self.assertEqual(dataset.dumps(AGENCY),
+                         dataset.dumps(agency.to_dict()))
+
+        hq = agency.department('Headquarters')
+        self.assertIsInstance(hq, Department)
+        self.assertIsInstance(hq.address, Address)
+        self.assertIsInstance(hq.misc['FOIA Hotline'], Contact)
+        self.assertEqual(('foia@example.gov',), hq.emails)
+        self.assertIsNone(hq.request_form)
+        self.assertIs(MISSING, hq.website)
+        self.assertEqual({'nested': [1, 2]}, hq.get('something_new'))
+        self.assertEqual('n/a', hq.get('website', 'n/a'))
+
+    def test_round_trip_data(self):
+        """Every agency in data/ should survive the round trip"""
+        agencies = dataset.load_all()
+        self.assertEqual(agencies, records.to_dicts(records.load_all()))
+
+    def test_replace(self):
+        """Updates return new records which share the unchanged fields"""
+        agency = Agency.from_dict(AGENCY)
+        updated = agency.replace_department('Branch', fax='202-555-7878')
+
+        self.assertIsNot(agency, updated)
+        self.assertIs(MISSING, agency.department('Branch').fax)
+        self.assertEqual('202-555-7878', updated.department('Branch').fax)
+        self.assertIs(agency.department('Headquarters'),
+                      updated.department('Headquarters'))
+        self.assertIs(agency.request_time_stats, updated.request_time_stats)
+
+        removed = updated.replace(description=MISSING)
+        self.assertNotIn('description', removed.to_dict())
+        with self.assertRaises(TypeError):
+            agency.replace(not_a_field=1)
+        with self.assertRaises(TypeError):
+            Contact(not_a_field=1)
+
+    def test_pickle(self):
+        agency = Agency.from_dict(AGENCY)
+        unpickled = pickle.loads(pickle.dumps(agency))
+        self.assertEqual(agency, unpickled)
+        self.assertIs(MISSING, unpickled.department('Branch').fax)
+
+    def test_agency_records(self):
+        """Agencies are read as new dicts and stored back as records which
+        share the departments that didn't change"""
+        agencies = records.AgencyRecords({'AAA': AGENCY})
+        self.assertEqual(AGENCY, agencies['AAA'])
+        self.assertEqual(['AAA'], list(agencies))
+        before = agencies.record('AAA')
+
+        data = agencies['AAA']
+        data['departments'][1]['fax'] = '202-555-7878'
+        data['departments'][0]['something_new']['nested'].append(3)
+        self.assertEqual(before, agencies.record('AAA'))
+
+        data = agencies['AAA']
+        data['departments'][1]['fax'] = '202-555-7878'
+        agencies['AAA'] = data
+        after = agencies.record('AAA')
+        self.assertEqual('202-555-7878', after.department('Branch').fax)
+        self.assertIs(before.department('Headquarters'),
+                      after.department('Headquarters'))
+
+        agencies['AAA'] = agencies['AAA']
+        self.assertIs(after, agencies.record('AAA'))
+        self.assertEqual(records.to_dicts(agencies),
+                         {'AAA': agencies['AAA']})
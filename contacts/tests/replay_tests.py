@@ -0,0 +1,83 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from mock import patch
+import requests
+
+import http_client
+import replay
+
+
+def recorded_response(request, content=b'<h1>Agency</h1>', headers=None):
+    response = requests.Response()
+    response.request, response.url = request, request.url
+    response.status_code, response.reason = 200, 'OK'
+    response.headers = requests.structures.CaseInsensitiveDict(
+        headers or {'Content-Type': 'text/html; charset=utf-8'})
+    response._content = content
+    return response
+
+
+class ReplayTests(TestCase):
+
+    def test_capture_key(self):
+        """Query order and cache busters don't matter"""
+        self.assertEqual(
+            replay.capture_key('get', 'https://www.foia.gov/a?x=1&y=2'),
+            replay.capture_key('GET', 'https://www.foia.gov/a?y=2&x=1'))
+        self.assertEqual(
+            replay.capture_key(
+                'GET', 'https://www.foia.gov/f?agency=CIA&Random=12'),
+            'GET https://www.foia.gov/f?agency=CIA')
+
+    def test_record_and_replay(self):
+        """Exchanges recorded through a session come back from the replay
+        adapter, whatever the cache buster"""
+        with TemporaryDirectory() as tmpdir:
+            session = requests.Session()
+            session.mount('https://', replay.RecordingAdapter(tmpdir))
+            with patch('requests.adapters.HTTPAdapter.send',
+                       side_effect=lambda request, **kw:
+                       recorded_response(request)):
+                session.get('https://www.foia.gov/f?agency=CIA&Random=1')
+            filename = os.path.join(tmpdir, '%s.jsonl' % os.getpid())
+            with open(filename) as f:
+                exchange = json.loads(f.readline())
+            self.assertEqual(200, exchange['status_code'])
+
+            session = requests.Session()
+            session.mount('https://', replay.ReplayAdapter(tmpdir))
+            response = session.get(
+                'https://www.foia.gov/f?agency=CIA&Random=2')
+            self.assertEqual('<h1>Agency</h1>', response.text)
+            self.assertEqual('utf-8', response.encoding)
+            with self.assertRaises(requests.ConnectionError):
+                session.get('https://www.foia.gov/f?agency=DOJ')
+
+    def test_conditional_replay(self):
+        """A request carrying the captured ETag gets a 304"""
+        captures = {'GET https://www.foia.gov/a': {
+            'key': 'GET https://www.foia.gov/a', 'status_code': 200,
+            'reason': 'OK', 'headers': {'ETag': '"v1"'}, 'body': 'YWJj'}}
+        session = requests.Session()
+        session.mount('https://', replay.ReplayAdapter(captures=captures))
+        self.assertEqual(b'abc', session.get('https://www.foia.gov/a').content)
+        response = session.get('https://www.foia.gov/a',
+                               headers={'If-None-Match': '"v1"'})
+        self.assertEqual(304, response.status_code)
+
+    def test_adapter_from_environment(self):
+        with TemporaryDirectory() as tmpdir:
+            with patch.dict(os.environ, {replay.REPLAY_ENV: tmpdir,
+                                         replay.LATENCY_ENV: '0.5'}):
+                adapter = http_client.make_adapter()
+            self.assertIsInstance(adapter, replay.ReplayAdapter)
+            self.assertEqual(0.5, adapter.latency)
+            with patch.dict(os.environ, {replay.RECORD_ENV: tmpdir}):
+                adapter = http_client.make_adapter(retries=5)
+            self.assertIsInstance(adapter, replay.RecordingAdapter)
+            self.assertEqual(5, adapter.max_retries.total)
+        with patch.dict(os.environ, clear=True):
+            self.assertIsNone(replay.adapter_from_environment())
@@ -1,5 +1,6 @@
 from bs4 import BeautifulSoup
 from mock import patch
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
 import os
@@ -84,19 +85,6 @@ class ScraperTests(TestCase):
                 'name': "I don't know which office",
                 'emails': ['hq@agency.gov']})
 
-    def test_update_list_in_dict(self):
-        original = {'keywords': ['accounting', 'estates']}
-        scraper.update_list_in_dict(
-            original, 'keywords', ['accounting', 'employment', 'courts'])
-
-        self.assertEqual(
-            original['keywords'],
-            ['accounting', 'courts', 'employment', 'estates'])
-
-        original = {}
-        scraper.update_list_in_dict(original, 'emails', ['email@agency.gov'])
-        self.assertEqual(original['emails'], ['email@agency.gov'])
-
     def test_actual_apply(self):
         agency_data = {
             'emails': ['foia@agency.gov'],
@@ -439,6 +427,16 @@ class ScraperTests(TestCase):
         self.assertEqual(chicago_call[0][0]['id'], "2")
         self.assertEqual(chicago_call[0][1], "Chicago Branch")
 
+    def test_element_index(self):
+        """Ids should map to the first element with that id"""
+        doc = BeautifulSoup("""<div id="a">First</div><p id="b">B</p>
+                               <div id="a">Second</div><span>None</span>""",
+                            'html.parser')
+        by_id = scraper.element_index(doc)
+        self.assertEqual(['a', 'b'], sorted(by_id.keys()))
+        self.assertEqual('First', by_id['a'].string)
+        self.assertEqual('p', by_id['b'].name)
+
     def test_agency_url(self):
         """Verify that agency abbreviations are getting converted into a URL"""
         self.assertTrue("agency=ABCDEF" in scraper.agency_url("ABCDEF"))
@@ -485,3 +483,98 @@ class ScraperTests(TestCase):
         address_list.append("Washington , DC  20424")
         self.assertEqual(
             scraper.address_list_to_dict(address_list), address_dict)
+
+    @patch('scraper.save_manifest')
+    @patch('scraper.load_manifest', return_value={})
+    @patch('scraper.process_agency')
+    @patch('scraper.fetch_agency')
+    def test_save_agencies_concurrently(self, fetch_agency, process_agency,
+                                        *_):
+        """All agencies should be fetched through the pool, and only those
+        which downloaded should be parsed"""
+        fetch_agency.side_effect = lambda abb, *args: abb != 'CIA'
+        scraper.save_agencies(workers=4, interval=0)
+        fetched = [call[0][0] for call in fetch_agency.call_args_list]
+        self.assertEqual(sorted(fetched), sorted(scraper.AGENCIES))
+        processed = [call[0][0] for call in process_agency.call_args_list]
+        self.assertEqual(len(processed), len(scraper.AGENCIES) - 1)
+        self.assertFalse('CIA' in processed)
+
+    @patch('scraper.parse_agency')
+    def test_process_agency_skips_unchanged(self, parse_agency):
+        """An agency is only re-parsed when its HTML or manual data change"""
+        parse_agency.side_effect = lambda abb, doc: {
+            'name': doc.h1.string, 'departments': []}
+        cwd = os.getcwd()
+        with TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                os.makedirs('html')
+                with open('html/TEST.html', 'w') as f:
+                    f.write('<h1>Test Agency</h1>')
+                manifest = {}
+                scraper.process_agency('TEST', manifest)
+                scraper.process_agency('TEST', manifest)
+                self.assertEqual(parse_agency.call_count, 1)
+                self.assertTrue(os.path.isfile('data/TEST.yaml'))
+                self.assertEqual(
+                    sorted(manifest['TEST'].keys()),
+                    ['html_hash', 'manual_hash', 'parse_hash',
+                     'parser_hash'])
+
+                scraper.process_agency('TEST', manifest, force=True)
+                self.assertEqual(parse_agency.call_count, 2)
+
+                with open('html/TEST.html', 'w') as f:
+                    f.write('<h1>Renamed Agency</h1>')
+                scraper.process_agency('TEST', manifest)
+                self.assertEqual(parse_agency.call_count, 3)
+
+                # The YAML was changed since it was written
+                with open('data/TEST.yaml', 'a') as f:
+                    f.write('extra: field\n')
+                scraper.process_agency('TEST', manifest)
+                self.assertEqual(parse_agency.call_count, 4)
+                scraper.process_agency('TEST', manifest)
+                self.assertEqual(parse_agency.call_count, 4)
+
+                # The parser changed
+                with patch('scraper.parser_hash', return_value='new'):
+                    scraper.process_agency('TEST', manifest)
+                self.assertEqual(parse_agency.call_count, 5)
+            finally:
+                os.chdir(cwd)
+
+    def test_write_agency_html(self):
+        """Agency HTML is only rewritten when the download differs"""
+        with TemporaryDirectory() as tmpdir:
+            cwd = os.getcwd()
+            os.chdir(tmpdir)
+            try:
+                os.mkdir('html')
+                self.assertTrue(scraper.write_agency_html('TEST', '<h1>A'))
+                self.assertFalse(scraper.write_agency_html('TEST', '<h1>A'))
+                self.assertTrue(scraper.write_agency_html('TEST', '<h1>B'))
+                self.assertEqual('<h1>B', scraper.read_agency_html('TEST'))
+            finally:
+                os.chdir(cwd)
+
+    def test_parse_agencies(self):
+        """Pages parsed in worker processes should come back as the same
+        agency data as parsing them here"""
+        html = """<h1>Agency %s</h1>
+            <select><option value="0">Select an Office</option>
+            <option value="1">Headquarters</option></select>
+            <div id="1"><p><strong>FOIA Contact:</strong></p>
+            <p>1 congress street</p><p>Washington, DC 20505</p>
+            <p>(555) 111-2222 (Telephone)</p></div>
+            <h2>About</h2>Description %s"""
+        pages = [(abb, html % (abb, abb)) for abb in ('AAA', 'BBB', 'CCC')]
+        results = list(scraper.parse_agencies(pages, workers=2))
+        self.assertEqual(['AAA', 'BBB', 'CCC'],
+                         sorted(abb for abb, _, _ in results))
+        for abb, text, data in results:
+            self.assertEqual(data, scraper.parse_agency_html(abb, text))
+            self.assertEqual(data['name'], 'Agency ' + abb)
+            self.assertEqual(data['departments'][0]['phone'],
+                             '555-111-2222')
@@ -0,0 +1,67 @@
+import os
+import pickle
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from mock import patch
+
+import dataset
+import snapshot
+
+
+AGENCIES = {
+    'AAA': {'abbreviation': 'AAA', 'name': 'Agency A', 'departments': []},
+    'BBB': {'abbreviation': 'BBB', 'name': 'Agency B',
+            'departments': [{'name': 'Office', 'top_level': True}]},
+}
+
+
+class SnapshotTests(TestCase):
+
+    def test_round_trip(self):
+        with TemporaryDirectory() as directory:
+            dataset.save_all(AGENCIES, directory)
+            header = snapshot.write(AGENCIES, directory)
+            self.assertEqual(snapshot.SCHEMA_VERSION,
+                             header['schema_version'])
+            loaded = snapshot.load(directory)
+            self.assertEqual(AGENCIES, loaded)
+            self.assertEqual(['AAA', 'BBB'], list(loaded))
+
+    def test_stale_snapshots_are_rejected(self):
+        with TemporaryDirectory() as directory:
+            with self.assertRaises(snapshot.SnapshotError):
+                snapshot.load(directory)
+
+            dataset.save_all(AGENCIES, directory)
+            snapshot.write(AGENCIES, directory)
+            dataset.save_agency('AAA', dict(AGENCIES['AAA'], name='A2'),
+                                directory)
+            with self.assertRaises(snapshot.SnapshotError):
+                snapshot.load(directory)
+
+            snapshot.write(AGENCIES, directory)
+            with patch('snapshot.SCHEMA_VERSION', snapshot.SCHEMA_VERSION + 1):
+                with self.assertRaises(snapshot.SnapshotError):
+                    snapshot.load(directory)
+
+            with open(snapshot.snapshot_filename(directory), 'wb') as f:
+                pickle.dump(AGENCIES, f)
+            with self.assertRaises(snapshot.SnapshotError):
+                snapshot.load(directory)
+
+    def test_load_all(self):
+        """The YAML is parsed only when the snapshot is missing or stale"""
+        with TemporaryDirectory() as directory:
+            dataset.save_all(AGENCIES, directory)
+            self.assertEqual(AGENCIES, snapshot.load_all(directory))
+            self.assertTrue(os.path.isfile(
+                snapshot.snapshot_filename(directory)))
+            with patch('snapshot.dataset.load_all') as load_all:
+                self.assertEqual(AGENCIES, snapshot.load_all(directory))
+            self.assertFalse(load_all.called)
+
+            dataset.save_agency('AAA', dict(AGENCIES['AAA'], name='A2'),
+                                directory)
+            self.assertEqual('A2', snapshot.load_all(directory)['AAA']['name'])
+            self.assertEqual('A2', snapshot.load(directory)['AAA']['name'])